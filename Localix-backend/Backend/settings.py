@@ -184,9 +184,31 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Segundos que se cachean las estadísticas de pedidos del dashboard (0 = sin caché)
+PEDIDOS_ESTADISTICAS_CACHE_TIMEOUT = 60
+
+# Segundos que se cachea cada página del catálogo de ventas (0 = sin caché)
+CATALOGO_CACHE_TIMEOUT = 300
+
+# Segundos que se cachea el estado de un plan expirado o sin fecha de expiración
+# (los planes vigentes se cachean hasta su end_date; ver usuarios/cache.py)
+PLAN_CACHE_TIMEOUT_CORTO = 300
+
+# Procesamiento de imágenes subidas en un pool local de procesos (False = en la misma petición)
+IMAGENES_ASYNC = True
+IMAGENES_WORKERS = 2
+
+# Rendiciones responsive: anchos (px) y formatos en orden de preferencia (AVIF se omite si Pillow no lo soporta)
+IMAGENES_ANCHOS = [320, 640, 960, 1280]
+IMAGENES_FORMATOS = ['avif', 'webp', 'jpeg']
+
+# Máximo de píxeles (ancho x alto) de una imagen subida; se comprueba en la cabecera, antes de decodificar
+IMAGENES_MAX_PIXELES = 50_000_000
+
 # Límites aumentados para desarrollo
 FILE_UPLOAD_PERMISSIONS = 0o644
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
+# Las subidas mayores a este tamaño se escriben en un archivo temporal en lugar de quedar en memoria
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 
 # Configuraciones de seguridad deshabilitadas para desarrollo
@@ -139,7 +139,8 @@ SIMPLE_JWT = {
 
 # Configuración de archivos para desarrollo
 FILE_UPLOAD_PERMISSIONS = 0o644
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
+# Las subidas mayores a este tamaño se escriben en un archivo temporal en lugar de quedar en memoria
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 
 # Configuración de caché para desarrollo
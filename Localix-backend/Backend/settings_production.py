@@ -189,14 +189,18 @@ FILE_UPLOAD_PERMISSIONS = 0o600  # Más restrictivo
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB máximo
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB máximo
 
-# Configuración de caché para producción (usar Redis en producción real)
+# Configuración de caché para producción: caché en base de datos, compartida por
+# todos los workers. Las invalidaciones del estado del plan (usuarios/cache.py) y
+# la versión del catálogo (productos/catalogo.py) deben llegar a todos los procesos;
+# con una LocMemCache por proceso solo las vería el que atiende la escritura.
+# Crear la tabla una vez con: python manage.py createcachetable
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'localix_cache',
         'TIMEOUT': 300,  # 5 minutos
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+            'MAX_ENTRIES': 10000,
         }
     }
 }
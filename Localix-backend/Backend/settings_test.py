@@ -0,0 +1,31 @@
+"""
+Configuración para correr los tests sin un servidor PostgreSQL:
+
+    python manage.py test ventas productos categorias pedidos usuarios --settings=Backend.settings_test
+
+Usa SQLite en archivo con transaction_mode='IMMEDIATE': cada transacción toma
+el bloqueo de escritura al empezar, de modo que las escrituras concurrentes
+esperan (timeout) en lugar de fallar con 'database is locked'. Así también
+corre VentaConcurrenteTest, que verifica que el UPDATE condicional de stock
+no permite sobrevender. El CI corre además la suite sobre PostgreSQL.
+"""
+
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'localix.sqlite3'),
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 30,
+        },
+        'TEST': {
+            # En archivo (no en memoria) para que los hilos de los tests compartan la base de datos
+            'NAME': os.path.join(tempfile.gettempdir(), 'test_localix.sqlite3'),
+        },
+    }
+}
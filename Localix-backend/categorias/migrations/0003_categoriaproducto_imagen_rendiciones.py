@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categorias', '0002_alter_categoriaproducto_nombre_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoriaproducto',
+            name='imagen_rendiciones',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Miniatura y anchos en AVIF/WebP/JPEG generados en segundo plano', verbose_name='Rendiciones de la imagen'),
+        ),
+    ]
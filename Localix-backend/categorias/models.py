@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
+from productos.catalogo import invalidar_catalogo
+from productos.cola_imagenes import liberar_imagen
 
 class CategoriaBase(models.Model):
     """
@@ -61,6 +63,40 @@ class CategoriaBase(models.Model):
         super().save(*args, **kwargs)
 
 
+class CategoriaProductoQuerySet(models.QuerySet):
+    def con_resumen_productos(self):
+        """
+        Anota por categoría la cantidad de productos (num_productos) y el stock
+        total de sus variantes y colores activos (stock_total), con subconsultas.
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        from productos.models import Producto, VarianteProducto, ColorProducto
+
+        def suma(subconsulta, campo):
+            subconsulta = subconsulta.order_by().values(campo).annotate(total=Sum('stock')).values('total')
+            return Coalesce(Subquery(subconsulta, output_field=IntegerField()), Value(0))
+
+        conteo = Producto.objects.filter(categoria=OuterRef('pk')).order_by().values('categoria').annotate(
+            total=Count('id')
+        ).values('total')
+        return self.annotate(
+            num_productos=Coalesce(Subquery(conteo, output_field=IntegerField()), Value(0)),
+            stock_total=(
+                suma(VarianteProducto.objects.filter(producto__categoria=OuterRef('pk')), 'producto__categoria') +
+                suma(ColorProducto.objects.filter(producto__categoria=OuterRef('pk'), activo=True), 'producto__categoria')
+            )
+        )
+
+    def con_productos(self):
+        """Precarga los productos de cada categoría con su stock calculado anotado"""
+        from productos.models import Producto
+
+        return self.prefetch_related(
+            models.Prefetch('productos', queryset=Producto.objects.con_stock_calculado())
+        )
+
+
 class CategoriaProducto(CategoriaBase):
     """
     Modelo específico para categorías de productos
@@ -86,6 +122,16 @@ class CategoriaProducto(CategoriaBase):
         help_text=_("Fecha y hora de la última actualización")
     )
     
+    imagen_rendiciones = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Rendiciones de la imagen"),
+        help_text=_("Miniatura y anchos en AVIF/WebP/JPEG generados en segundo plano")
+    )
+    
+    objects = CategoriaProductoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _("Categoría de producto")
         verbose_name_plural = _("Categorías de productos")
@@ -94,6 +140,18 @@ class CategoriaProducto(CategoriaBase):
             models.Index(fields=['usuario', 'slug']),
         ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # El nombre de la categoría se muestra en el catálogo de ventas
+        invalidar_catalogo(self.usuario_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # La imagen y sus rendiciones se eliminan si ningún otro objeto las usa
+            liberar_imagen('categoria', self.imagen.name, self.imagen_rendiciones)
+        return resultado
+
     @property
     def cantidad_productos(self):
         from productos.models import Producto
@@ -1,23 +1,32 @@
 from rest_framework import serializers
 from categorias.models import CategoriaProducto
+from productos.imagenes import imagen_responsive
 from django.utils.text import slugify
 from django.core.files.images import get_image_dimensions
 import os
 
 class CategoriaSerializer(serializers.ModelSerializer):
     imagen_url = serializers.SerializerMethodField()
-    cantidad_productos = serializers.IntegerField(read_only=True)
+    imagen_responsive = serializers.SerializerMethodField()
+    cantidad_productos = serializers.SerializerMethodField()
     productos_vinculados = serializers.SerializerMethodField()
     stock_total_categoria = serializers.SerializerMethodField()
     
     class Meta:
         model = CategoriaProducto
         fields = [
-            'id', 'nombre', 'slug', 'descripcion', 'activa', 'orden', 'imagen', 'imagen_url',
+            'id', 'nombre', 'slug', 'descripcion', 'activa', 'orden', 'imagen', 'imagen_url', 'imagen_responsive',
             'cantidad_productos', 'productos_vinculados', 'stock_total_categoria',
             'fecha_creacion', 'fecha_actualizacion',
         ]
-        read_only_fields = ('slug', 'imagen_url', 'fecha_creacion', 'fecha_actualizacion')
+        read_only_fields = ('slug', 'imagen_url', 'imagen_responsive', 'fecha_creacion', 'fecha_actualizacion')
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # El detalle de productos solo se construye si la vista lo pide (?expand=productos)
+        if not self.context.get('expandir_productos', True):
+            fields.pop('productos_vinculados', None)
+        return fields
     
     def get_imagen_url(self, obj):
         if obj.imagen:
@@ -27,9 +36,20 @@ class CategoriaSerializer(serializers.ModelSerializer):
             return obj.imagen.url
         return None
     
+    def get_imagen_responsive(self, obj):
+        """srcset de la imagen de la categoría (AVIF/WebP/JPEG por ancho)"""
+        return imagen_responsive(obj.imagen, obj.imagen_rendiciones, self.context.get('request'))
+    
+    def get_cantidad_productos(self, obj):
+        # Usar el conteo anotado por CategoriaProducto.objects.con_resumen_productos() si existe
+        num_productos = getattr(obj, 'num_productos', None)
+        if num_productos is None:
+            return obj.cantidad_productos
+        return num_productos
+    
     def get_productos_vinculados(self, obj):
-        from productos.models import Producto
-        productos = Producto.objects.filter(categoria=obj)
+        # .all() aprovecha el Prefetch de CategoriaProducto.objects.con_productos()
+        productos = obj.productos.all()
         request = self.context.get('request')
         return [
             {
@@ -54,11 +74,15 @@ class CategoriaSerializer(serializers.ModelSerializer):
     def _calcular_stock_total(self, producto):
         """Calcula el stock total sumando variantes y colores"""
         try:
-            # Sumar stock de variantes
-            stock_variantes = sum(variante.stock for variante in producto.variantes.all())
+            # Usar las sumas anotadas por Producto.objects.con_stock_calculado() si existen
+            stock_variantes = getattr(producto, 'stock_variantes_total', None)
+            if stock_variantes is None:
+                stock_variantes = sum(variante.stock for variante in producto.variantes.all())
             
             # Sumar stock de colores activos
-            stock_colores = sum(color.stock for color in producto.colores.filter(activo=True))
+            stock_colores = getattr(producto, 'stock_colores_total', None)
+            if stock_colores is None:
+                stock_colores = sum(color.stock for color in producto.colores.filter(activo=True))
             
             # El stock total es la suma de variantes + colores
             return stock_variantes + stock_colores
@@ -69,14 +93,12 @@ class CategoriaSerializer(serializers.ModelSerializer):
     def get_stock_total_categoria(self, obj):
         """Calcula el stock total de todos los productos de la categoría"""
         try:
-            from productos.models import Producto
-            productos = Producto.objects.filter(categoria=obj)
-            stock_total = 0
-            
-            for producto in productos:
-                stock_total += self._calcular_stock_total(producto)
+            # Usar la suma anotada por CategoriaProducto.objects.con_resumen_productos() si existe
+            stock_total = getattr(obj, 'stock_total', None)
+            if stock_total is not None:
+                return stock_total
             
-            return stock_total
+            return sum(self._calcular_stock_total(producto) for producto in obj.productos.all())
         except Exception as e:
             print(f"❌ Error calculando stock total de categoría {obj.nombre}: {str(e)}")
             return 0
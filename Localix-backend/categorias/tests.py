@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from productos.models import Producto, ColorProducto
+from usuarios.models import Usuario
+from .models import CategoriaProducto
+
+
+class ListadoCategoriasConsultasTest(TestCase):
+    """El listado de categorías debe costar las mismas consultas sin importar su tamaño"""
+
+    URL = '/api/categorias/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _crear_categorias(self, cantidad, productos_por_categoria=3):
+        inicio = CategoriaProducto.objects.count()
+        for i in range(inicio, inicio + cantidad):
+            categoria = CategoriaProducto.objects.create(usuario=self.usuario, nombre=f'Categoría {i}', slug=f'categoria-{i}')
+            for j in range(productos_por_categoria):
+                producto = Producto.objects.create(
+                    usuario=self.usuario, categoria=categoria, sku=f'SKU-{i}-{j}',
+                    nombre=f'Producto {i}-{j}', slug=f'producto-{i}-{j}',
+                    descripcion_corta='Producto', descripcion_larga='Producto',
+                    precio=Decimal('10.00'), costo=Decimal('4.00'),
+                )
+                ColorProducto.objects.create(producto=producto, nombre='Rojo', hex_code='#FF0000', stock=2)
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['results'], len(contexto.captured_queries)
+
+    def test_consultas_constantes(self):
+        self._crear_categorias(2)
+        _, consultas_pocas = self._consultas(self.URL)
+        _, consultas_pocas_expandidas = self._consultas(self.URL + '?expand=productos')
+
+        self._crear_categorias(8)
+        categorias, consultas_muchas = self._consultas(self.URL)
+        expandidas, consultas_muchas_expandidas = self._consultas(self.URL + '?expand=productos')
+
+        self.assertEqual(consultas_pocas, consultas_muchas)
+        self.assertEqual(consultas_pocas_expandidas, consultas_muchas_expandidas)
+        self.assertNotIn('productos_vinculados', categorias[0])
+        self.assertTrue(all(categoria['cantidad_productos'] == 3 for categoria in categorias))
+        self.assertTrue(all(categoria['stock_total_categoria'] == 6 for categoria in categorias))
+        self.assertEqual(len(expandidas[0]['productos_vinculados']), 3)
+        self.assertEqual(expandidas[0]['productos_vinculados'][0]['stock_total_calculado'], 2)
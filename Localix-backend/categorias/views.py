@@ -5,8 +5,10 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils.text import slugify
 from django.core.files.images import get_image_dimensions
+from django.db import transaction
 from categorias.models import CategoriaProducto
 from categorias.serializers import CategoriaSerializer
+from productos.cola_imagenes import encolar_imagen_categoria
 import os
 import logging
 
@@ -30,9 +32,29 @@ class CategoriaViewSet(viewsets.ModelViewSet):
         """
         Filtra las categorías por usuario autenticado
         """
-        if self.request.user.is_authenticated:
-            return CategoriaProducto.objects.filter(usuario=self.request.user)
-        return CategoriaProducto.objects.none()
+        if not self.request.user.is_authenticated:
+            return CategoriaProducto.objects.none()
+        
+        # Conteo y stock anotados: el listado cuesta las mismas consultas sin importar su tamaño
+        queryset = CategoriaProducto.objects.filter(usuario=self.request.user).con_resumen_productos()
+        if self._expandir_productos():
+            queryset = queryset.con_productos()
+        return queryset
+    
+    def _expandir_productos(self):
+        """
+        El listado solo incluye productos_vinculados con ?expand=productos;
+        el resto de acciones (detalle, creación, edición) los incluye siempre.
+        """
+        if self.action != 'list':
+            return True
+        expand = self.request.query_params.get('expand', '')
+        return 'productos' in [valor.strip() for valor in expand.split(',')]
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expandir_productos'] = self._expandir_productos()
+        return context
 
     def create(self, request, *args, **kwargs):
         """Crear categoría con mejor manejo de errores"""
@@ -149,9 +171,11 @@ class CategoriaViewSet(viewsets.ModelViewSet):
                     "imagen": "La imagen es demasiado grande. Máximo 10MB"
                 })
             
-            # Guardar imagen
-            categoria.imagen = imagen
-            categoria.save()
+            # Guardar imagen; la redimensión se procesa en segundo plano
+            with transaction.atomic():
+                categoria.imagen = imagen
+                categoria.save()
+                encolar_imagen_categoria(categoria)
             logger.info(f"Imagen guardada exitosamente para categoría: {categoria.nombre}")
             
         except Exception as e:
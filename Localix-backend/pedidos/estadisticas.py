@@ -0,0 +1,97 @@
+"""
+Estadísticas de pedidos por usuario con una sola consulta y caché opcional
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Segundos que se conserva el snapshot; 0 desactiva la caché
+ESTADISTICAS_CACHE_TIMEOUT = getattr(settings, 'PEDIDOS_ESTADISTICAS_CACHE_TIMEOUT', 60)
+
+
+def _cache_key(usuario_id):
+    return f"pedidos_estadisticas:{usuario_id}"
+
+
+def calcular_estadisticas(usuario_id):
+    """Calcula todas las métricas con un único aggregate condicional"""
+    from .models import Pedido
+
+    hace_30_dias = timezone.now() - timedelta(days=30)
+    datos = Pedido.objects.filter(usuario_id=usuario_id).aggregate(
+        total_pedidos=Count('id'),
+        pedidos_pendientes=Count('id', filter=Q(estado_pedido='pendiente')),
+        pedidos_en_proceso=Count('id', filter=Q(estado_pedido__in=['confirmado', 'en_preparacion'])),
+        pedidos_enviados=Count('id', filter=Q(estado_pedido='enviado')),
+        pedidos_entregados=Count('id', filter=Q(estado_pedido='entregado')),
+        ventas_fisicas=Count('id', filter=Q(tipo_venta='fisica')),
+        ventas_digitales=Count('id', filter=Q(tipo_venta='digital')),
+        total_ingresos=Coalesce(
+            Sum('venta__total'), Value(Decimal('0.00')), output_field=DecimalField()
+        ),
+        pedidos_ultimo_mes=Count('id', filter=Q(fecha_creacion__gte=hace_30_dias)),
+    )
+    datos['total_ingresos'] = float(datos['total_ingresos'])
+    return datos
+
+
+def obtener_estadisticas(usuario_id):
+    """Retorna el snapshot cacheado o lo calcula y lo guarda"""
+    if not ESTADISTICAS_CACHE_TIMEOUT:
+        return calcular_estadisticas(usuario_id)
+
+    datos = cache.get(_cache_key(usuario_id))
+    if datos is None:
+        datos = calcular_estadisticas(usuario_id)
+        cache.set(_cache_key(usuario_id), datos, ESTADISTICAS_CACHE_TIMEOUT)
+    return datos
+
+
+def invalidar_estadisticas(usuario_id):
+    """
+    Elimina el snapshot del usuario cuando la transacción se confirma,
+    para que una lectura concurrente no vuelva a cachear datos sin confirmar.
+    """
+    transaction.on_commit(lambda: cache.delete(_cache_key(usuario_id)))
+
+
+def resumen_abonos(abonos):
+    """
+    Totales de un queryset de abonos por estado y, de los confirmados, por
+    método de pago. Una sola consulta GROUP BY estado_abono, metodo_pago
+    cuyo resultado (a lo sumo estados x métodos filas) se pivota aquí.
+    """
+    from .models import Abono
+
+    cero = Decimal('0.00')
+    resumen = {
+        'total_abonos': 0,
+        'total_confirmado': cero,
+        'total_pendiente': cero,
+        'total_rechazado': cero,
+        'abonos_por_metodo': {},
+    }
+    por_metodo = {}
+    grupos = abonos.order_by().values('estado_abono', 'metodo_pago').annotate(cantidad=Count('id'), total=Sum('monto'))
+    for grupo in grupos:
+        resumen['total_abonos'] += grupo['cantidad']
+        clave = f"total_{grupo['estado_abono']}"
+        if clave in resumen:
+            resumen[clave] += grupo['total']
+        if grupo['estado_abono'] == 'confirmado':
+            metodo = por_metodo.setdefault(grupo['metodo_pago'], {'cantidad': 0, 'total': cero})
+            metodo['cantidad'] += grupo['cantidad']
+            metodo['total'] += grupo['total']
+
+    # Mismo orden que las opciones de método de pago
+    resumen['abonos_por_metodo'] = {
+        metodo: por_metodo[metodo] for metodo, _ in Abono.METODO_PAGO_CHOICES if metodo in por_metodo
+    }
+    return resumen
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def _extraer_numero(codigo):
+    """Parte numérica de un código como PED-000042; None si no tiene el formato"""
+    if not codigo or '-' not in codigo:
+        return None
+    try:
+        return int(codigo.rsplit('-', 1)[1])
+    except ValueError:
+        return None
+
+
+def inicializar_contadores(apps, schema_editor):
+    """Continúa la numeración de cada usuario desde su último pedido existente"""
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    ContadorDocumento = apps.get_model('ventas', 'ContadorDocumento')
+
+    maximos = {}
+    for usuario_id, codigo in Pedido.objects.values_list('usuario_id', 'numero_pedido').iterator():
+        numero = _extraer_numero(codigo)
+        if numero is not None:
+            maximos[usuario_id] = max(numero, maximos.get(usuario_id, 0))
+
+    ContadorDocumento.objects.bulk_create([
+        ContadorDocumento(usuario_id=usuario_id, tipo='pedido', ultimo_numero=numero)
+        for usuario_id, numero in maximos.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_abono_estadopedido'),
+        ('ventas', '0004_contadordocumento'),
+    ]
+
+    operations = [
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
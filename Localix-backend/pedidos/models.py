@@ -1,9 +1,46 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Prefetch, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 from ventas.models import Cliente, Venta, Reserva
+from ventas.numeracion import siguiente_documento
+from .estadisticas import invalidar_estadisticas
 from productos.models import Producto, ColorProducto
 
+CERO = Decimal('0.00')
+
+
+def total_abonos_confirmados(prefijo=''):
+    """Sum(filter=...) de los abonos confirmados; `prefijo` es la ruta hasta Abono ('abonos__' desde Pedido)"""
+    return Coalesce(
+        Sum(f'{prefijo}monto', filter=Q(**{f'{prefijo}estado_abono': 'confirmado'})),
+        Value(CERO),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+class PedidoQuerySet(models.QuerySet):
+    def para_listado(self):
+        """
+        Queryset del listado de pedidos con costo de consultas constante: anota
+        el total abonado y precarga items, historial, estados, abonos y la venta
+        con todo lo que leen sus serializers
+        """
+        return self.annotate(total_abonado_confirmado=total_abonos_confirmados('abonos__')).select_related(
+            'cliente', 'venta__cliente'
+        ).prefetch_related(
+            Prefetch('items', queryset=ItemPedido.objects.select_related('color')),
+            Prefetch('items__producto', queryset=Producto.objects.para_listado()),
+            Prefetch('historial', queryset=HistorialPedido.objects.select_related('usuario')),
+            Prefetch('estados', queryset=EstadoPedido.objects.select_related('usuario')),
+            Prefetch('abonos', queryset=Abono.objects.select_related('usuario')),
+            'venta__items__producto', 'venta__items__variante', 'venta__items__color',
+        )
+
+
 class Pedido(models.Model):
     ESTADO_PAGO_CHOICES = [
         ('pendiente', 'Pendiente'),
@@ -68,6 +105,8 @@ class Pedido(models.Model):
     # Campos para seguimiento
     codigo_seguimiento = models.CharField(max_length=50, blank=True)
     empresa_envio = models.CharField(max_length=100, blank=True)
+
+    objects = PedidoQuerySet.as_manager()
     
     class Meta:
         ordering = ['-fecha_creacion']
@@ -83,30 +122,25 @@ class Pedido(models.Model):
         return f"Pedido {self.numero_pedido} - {self.cliente.nombre}"
     
     def save(self, *args, **kwargs):
-        if not self.numero_pedido:
-            # Generar número de pedido automático
-            ultimo_pedido = Pedido.objects.order_by('-id').first()
-            if ultimo_pedido:
-                try:
-                    # Intentar extraer el número del formato PED-XXXXXX
-                    partes = ultimo_pedido.numero_pedido.split('-')
-                    if len(partes) >= 2:
-                        ultimo_numero = int(partes[1])
-                        self.numero_pedido = f"PED-{ultimo_numero + 1:06d}"
-                    else:
-                        # Si no tiene el formato esperado, empezar desde 1
-                        self.numero_pedido = "PED-000001"
-                except (ValueError, IndexError):
-                    # Si hay error al convertir a int o al dividir, empezar desde 1
-                    self.numero_pedido = "PED-000001"
-            else:
-                self.numero_pedido = "PED-000001"
-        
         # Establecer estado de pago según tipo de venta SOLO si hay venta asociada
         if self.venta and self.tipo_venta == 'fisica' and self.estado_pago == 'pendiente':
             self.estado_pago = 'pagado'
         
-        super().save(*args, **kwargs)
+        if self.numero_pedido:
+            super().save(*args, **kwargs)
+            invalidar_estadisticas(self.usuario_id)
+            return
+        # Generar número de pedido automático; el contador se confirma junto con el pedido
+        with transaction.atomic():
+            self.numero_pedido = siguiente_documento(self.usuario_id, 'pedido')
+            super().save(*args, **kwargs)
+            invalidar_estadisticas(self.usuario_id)
+    
+    def delete(self, *args, **kwargs):
+        usuario_id = self.usuario_id
+        resultado = super().delete(*args, **kwargs)
+        invalidar_estadisticas(usuario_id)
+        return resultado
     
     @property
     def total_pedido(self):
@@ -241,14 +275,23 @@ class Abono(models.Model):
     
     def actualizar_montos_pedido(self):
         """
-        Actualiza los montos de abono y pendiente en el pedido
+        Actualiza los montos de abono y pendiente en el pedido: el total se suma
+        en la base de datos y solo se escriben esos dos campos
         """
-        abonos_confirmados = self.pedido.abonos.filter(estado_abono='confirmado')
-        total_abonado = sum(abono.monto for abono in abonos_confirmados)
-        
-        self.pedido.monto_abono = total_abonado
-        self.pedido.monto_pendiente = self.pedido.total_pedido - total_abonado
-        self.pedido.save()
+        with transaction.atomic():
+            # El pedido queda bloqueado: dos abonos simultáneos no se pisan los montos
+            total_pedido = Pedido.objects.select_for_update(of=('self',)).filter(
+                pk=self.pedido_id
+            ).values_list('venta__total', flat=True).get() or CERO
+            total_abonado = Abono.objects.filter(pedido_id=self.pedido_id).aggregate(
+                total=total_abonos_confirmados()
+            )['total']
+            Pedido.objects.filter(pk=self.pedido_id).update(
+                monto_abono=total_abonado, monto_pendiente=total_pedido - total_abonado
+            )
+        if Abono.pedido.is_cached(self):
+            self.pedido.monto_abono = total_abonado
+            self.pedido.monto_pendiente = total_pedido - total_abonado
     
     def __str__(self):
         return f"Abono {self.monto} - {self.pedido.numero_pedido}"
\ No newline at end of file
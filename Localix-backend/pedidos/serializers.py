@@ -1,6 +1,5 @@
 from rest_framework import serializers
-from django.db import models
-from .models import Pedido, ItemPedido, HistorialPedido, EstadoPedido, Abono
+from .models import Pedido, ItemPedido, HistorialPedido, EstadoPedido, Abono, total_abonos_confirmados
 from ventas.serializers import ClienteSerializer, VentaSerializer, ColorProductoSerializer
 from productos.serializers import ProductoSerializer
 
@@ -88,24 +87,28 @@ class PedidoSerializer(serializers.ModelSerializer):
         read_only_fields = ['numero_pedido', 'fecha_creacion']
     
     def get_estado_actual(self, obj):
-        """Obtiene el estado actual activo del pedido"""
-        estado_actual = obj.estados.filter(activo=True).first()
+        """Obtiene el estado actual activo del pedido (de los estados precargados)"""
+        estado_actual = next((estado for estado in obj.estados.all() if estado.activo), None)
         if estado_actual:
             return EstadoPedidoSerializer(estado_actual).data
         return None
     
     def get_total_abonado(self, obj):
-        """Calcula el total de abonos confirmados"""
-        return sum(abono.monto for abono in obj.abonos.filter(estado_abono='confirmado'))
+        """Total de abonos confirmados: anotado en el listado o sumado en la base de datos"""
+        total = getattr(obj, 'total_abonado_confirmado', None)
+        if total is None:
+            total = obj.abonos.aggregate(total=total_abonos_confirmados())['total']
+        return total
     
     def get_abonos_detalle(self, obj):
         """Muestra información detallada de abonos cuando el pedido está separado"""
         # Solo mostrar detalles si el pedido está separado
         if obj.estado_pedido == 'separado':
-            # Filtrar abonos que tengan monto mayor a 0 o que estén confirmados
-            abonos = obj.abonos.filter(
-                models.Q(monto__gt=0) | models.Q(estado_abono='confirmado')
-            ).order_by('-fecha_abono')
+            # Abonos con monto mayor a 0 o confirmados, de los precargados (ya ordenados por -fecha_abono)
+            abonos = [
+                abono for abono in obj.abonos.all()
+                if abono.monto > 0 or abono.estado_abono == 'confirmado'
+            ]
             return AbonoSerializer(abonos, many=True).data
         return []
 
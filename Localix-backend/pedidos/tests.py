@@ -0,0 +1,214 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from productos.models import ColorProducto, Producto
+from usuarios.models import Usuario
+from ventas.models import Cliente, ItemVenta, Venta
+from .estadisticas import obtener_estadisticas, resumen_abonos
+from .models import Abono, EstadoPedido, HistorialPedido, ItemPedido, Pedido
+
+
+class EstadisticasPedidosTest(TestCase):
+    """Las estadísticas solo cuentan los pedidos del usuario y usan una consulta"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        otro_usuario = Usuario.objects.create(username='otra', email='otra@example.com')
+        cliente = Cliente.objects.create(usuario=self.usuario, nombre='Ana')
+        cliente_ajeno = Cliente.objects.create(usuario=otro_usuario, nombre='Luis')
+        for estado in ['pendiente', 'enviado', 'confirmado']:
+            Pedido.objects.create(usuario=self.usuario, cliente=cliente, estado_pedido=estado)
+        Pedido.objects.create(usuario=otro_usuario, cliente=cliente_ajeno)
+
+    def test_estadisticas_por_usuario(self):
+        with CaptureQueriesContext(connection) as contexto:
+            datos = obtener_estadisticas(self.usuario.id)
+
+        self.assertEqual(len(contexto.captured_queries), 1)
+        self.assertEqual(datos['total_pedidos'], 3)
+        self.assertEqual(datos['pedidos_pendientes'], 1)
+        self.assertEqual(datos['pedidos_en_proceso'], 1)
+        self.assertEqual(datos['pedidos_enviados'], 1)
+
+    def test_snapshot_se_invalida_al_guardar(self):
+        obtener_estadisticas(self.usuario.id)
+        with self.assertNumQueries(0):
+            obtener_estadisticas(self.usuario.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = Pedido.objects.filter(usuario=self.usuario, estado_pedido='pendiente').get()
+            pedido.estado_pedido = 'entregado'
+            pedido.save()
+
+        datos = obtener_estadisticas(self.usuario.id)
+        self.assertEqual(datos['pedidos_pendientes'], 0)
+        self.assertEqual(datos['pedidos_entregados'], 1)
+
+    def test_snapshot_se_invalida_al_cambiar_la_venta(self):
+        producto = Producto.objects.create(
+            usuario=self.usuario, sku='GOR-01', nombre='Gorra', slug='gorra',
+            descripcion_corta='Gorra', descripcion_larga='Gorra',
+            precio=Decimal('10.00'), costo=Decimal('4.00'), gestion_stock=False,
+        )
+        cliente = Cliente.objects.get(usuario=self.usuario)
+        venta = Venta.objects.create(usuario=self.usuario, cliente=cliente, estado='completada')
+        Pedido.objects.create(usuario=self.usuario, cliente=cliente, venta=venta)
+        self.assertEqual(obtener_estadisticas(self.usuario.id)['total_ingresos'], 0.0)
+
+        # Agregar un item suma al total de la venta con un UPDATE atómico
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemVenta.objects.create(venta=venta, producto=producto, cantidad=2)
+        self.assertEqual(obtener_estadisticas(self.usuario.id)['total_ingresos'], 20.0)
+
+        # Recalcular con descuento guarda los totales con save()
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.porcentaje_descuento = Decimal('50.00')
+            venta.calcular_totales()
+        self.assertEqual(obtener_estadisticas(self.usuario.id)['total_ingresos'], 10.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.delete()
+        self.assertEqual(obtener_estadisticas(self.usuario.id)['total_ingresos'], 0.0)
+
+
+class AbonosPedidoTest(TestCase):
+    """Los totales de abonos se suman en la base de datos y el listado cuesta las mismas consultas"""
+    URL = '/api/pedidos/pedidos/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.cliente = Cliente.objects.create(usuario=self.usuario, nombre='Ana')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='CAM-01', nombre='Camisa', slug='camisa',
+            descripcion_corta='Camisa', descripcion_larga='Camisa',
+            precio=Decimal('50.00'), costo=Decimal('20.00'),
+        )
+        self.rojo = ColorProducto.objects.create(producto=self.producto, nombre='Rojo', hex_code='#FF0000', stock=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _pedido(self):
+        venta = Venta.objects.create(usuario=self.usuario, cliente=self.cliente, metodo_pago='separado')
+        ItemVenta.objects.create(venta=venta, producto=self.producto, color=self.rojo, cantidad=2)
+        pedido = Pedido.objects.create(
+            usuario=self.usuario, cliente=self.cliente, venta=venta,
+            tipo_venta='digital', estado_pedido='separado'
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, producto=self.producto, color=self.rojo, cantidad=2,
+            precio_unitario=Decimal('50.00'), subtotal=Decimal('100.00')
+        )
+        HistorialPedido.objects.create(pedido=pedido, estado_nuevo='separado', usuario=self.usuario)
+        EstadoPedido.objects.create(pedido=pedido, estado='separado', usuario=self.usuario)
+        return pedido
+
+    def _abonar(self, pedido, monto, estado='confirmado'):
+        return Abono.objects.create(
+            pedido=pedido, monto=Decimal(monto), metodo_pago='efectivo', estado_abono=estado, usuario=self.usuario
+        )
+
+    def test_montos_del_pedido(self):
+        pedido = self._pedido()
+        total = pedido.venta.total
+        self._abonar(pedido, '30.00')
+        self._abonar(pedido, '25.00', estado='pendiente')
+        abono = self._abonar(pedido, '20.00')
+        # El pedido en memoria del abono queda sincronizado
+        self.assertEqual(abono.pedido.monto_abono, Decimal('50.00'))
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.monto_abono, Decimal('50.00'))
+        self.assertEqual(pedido.monto_pendiente, total - Decimal('50.00'))
+
+        abono.estado_abono = 'rechazado'
+        abono.save()
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.monto_abono, Decimal('30.00'))
+
+    def test_listado_con_consultas_constantes(self):
+        def listar(cantidad):
+            for _ in range(cantidad):
+                pedido = self._pedido()
+                self._abonar(pedido, '30.00')
+                self._abonar(pedido, '0.00', estado='rechazado')
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self.client.get(self.URL)
+            self.assertEqual(respuesta.status_code, 200, respuesta.content)
+            return respuesta.json()['results'], len(contexto)
+
+        _, consultas_pocos = listar(2)
+        pedidos, consultas_muchos = listar(5)
+        self.assertEqual(consultas_pocos, consultas_muchos)
+        self.assertEqual(len(pedidos), 7)
+        self.assertEqual({p['total_abonado'] for p in pedidos}, {30.0})
+        self.assertEqual({len(p['abonos_detalle']) for p in pedidos}, {1})
+        self.assertEqual({p['estado_actual']['estado'] for p in pedidos}, {'separado'})
+        self.assertEqual({p['productos_count'] for p in pedidos}, {1})
+
+
+class ResumenAbonosTest(TestCase):
+    """El resumen de abonos es una sola consulta agrupada, filtrable por pedido y fechas"""
+    URL = '/api/pedidos/abonos/resumen_abonos/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        cliente = Cliente.objects.create(usuario=self.usuario, nombre='Ana')
+        self.pedido = Pedido.objects.create(usuario=self.usuario, cliente=cliente, estado_pedido='separado')
+        otro_pedido = Pedido.objects.create(usuario=self.usuario, cliente=cliente, estado_pedido='separado')
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        for pedido, monto, metodo, estado, fecha in [
+            (self.pedido, '10.00', 'efectivo', 'confirmado', timezone.now()),
+            (self.pedido, '15.00', 'efectivo', 'confirmado', timezone.now()),
+            (self.pedido, '20.00', 'tarjeta', 'confirmado', timezone.now()),
+            (self.pedido, '5.00', 'efectivo', 'pendiente', timezone.now()),
+            (self.pedido, '7.00', 'transferencia', 'rechazado', timezone.now()),
+            (otro_pedido, '100.00', 'efectivo', 'confirmado', hace_una_semana),
+        ]:
+            Abono.objects.create(pedido=pedido, monto=Decimal(monto), metodo_pago=metodo, estado_abono=estado, fecha_abono=fecha)
+
+        ajeno = Usuario.objects.create(username='otra', email='otra@example.com')
+        pedido_ajeno = Pedido.objects.create(usuario=ajeno, cliente=Cliente.objects.create(usuario=ajeno, nombre='Luis'))
+        Abono.objects.create(pedido=pedido_ajeno, monto=Decimal('999.00'), metodo_pago='efectivo', estado_abono='confirmado')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_resumen_de_un_pedido(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resumen = resumen_abonos(Abono.objects.filter(pedido=self.pedido))
+        self.assertEqual(len(contexto), 1)
+
+        respuesta = self.client.get(self.URL, {'pedido_id': self.pedido.id})
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos, {
+            'total_abonos': 5,
+            'total_confirmado': 45.0,
+            'total_pendiente': 5.0,
+            'total_rechazado': 7.0,
+            'abonos_por_metodo': {
+                'efectivo': {'cantidad': 2, 'total': 25.0},
+                'tarjeta': {'cantidad': 1, 'total': 20.0},
+            },
+        })
+        self.assertEqual(resumen['total_confirmado'], Decimal('45.00'))
+
+    def test_reporte_de_caja_por_fechas(self):
+        respuesta = self.client.get(self.URL)
+        self.assertEqual(respuesta.json()['total_confirmado'], 145.0)
+
+        hoy = timezone.localdate().isoformat()
+        respuesta = self.client.get(self.URL, {'fecha_desde': hoy, 'fecha_hasta': hoy})
+        self.assertEqual(respuesta.json()['total_confirmado'], 45.0)
+
+        self.assertEqual(self.client.get(self.URL, {'fecha_desde': 'ayer'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'pedido_id': 'x'}).status_code, 400)
+
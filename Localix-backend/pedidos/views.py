@@ -4,12 +4,14 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import Pedido, ItemPedido, HistorialPedido, EstadoPedido, Abono
+from .estadisticas import obtener_estadisticas, resumen_abonos
 from .serializers import (
     PedidoSerializer, PedidoCreateSerializer, PedidoUpdateSerializer,
     ItemPedidoSerializer, HistorialPedidoSerializer, EstadoPedidoSerializer,
     AbonoSerializer, AbonoCreateSerializer
 )
 from rest_framework.decorators import api_view
+from ventas.reportes import filtrar_por_fechas
 
 class PedidoViewSet(viewsets.ModelViewSet):
     queryset = Pedido.objects.all().select_related('cliente', 'venta')
@@ -22,9 +24,13 @@ class PedidoViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Filtra los pedidos por usuario autenticado
+        Filtra los pedidos por usuario autenticado.
+        El listado y el detalle anotan los totales y precargan sus relaciones.
         """
-        return Pedido.objects.filter(usuario=self.request.user).select_related('cliente', 'venta')
+        queryset = Pedido.objects.filter(usuario=self.request.user).select_related('cliente', 'venta')
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.para_listado()
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -145,41 +151,11 @@ class PedidoViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
-        from django.db.models import Count, Sum
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Estadísticas generales
-        total_pedidos = Pedido.objects.count()
-        pedidos_pendientes = Pedido.objects.filter(estado_pedido='pendiente').count()
-        pedidos_en_proceso = Pedido.objects.filter(estado_pedido__in=['confirmado', 'en_preparacion']).count()
-        pedidos_enviados = Pedido.objects.filter(estado_pedido='enviado').count()
-        pedidos_entregados = Pedido.objects.filter(estado_pedido='entregado').count()
-        
-        # Ventas por tipo
-        ventas_fisicas = Pedido.objects.filter(tipo_venta='fisica').count()
-        ventas_digitales = Pedido.objects.filter(tipo_venta='digital').count()
-        
-        # Total de ingresos
-        total_ingresos = Pedido.objects.aggregate(
-            total=Sum('venta__total')
-        )['total'] or 0
-        
-        # Pedidos del último mes
-        hace_30_dias = timezone.now() - timedelta(days=30)
-        pedidos_ultimo_mes = Pedido.objects.filter(fecha_creacion__gte=hace_30_dias).count()
-        
-        return Response({
-            'total_pedidos': total_pedidos,
-            'pedidos_pendientes': pedidos_pendientes,
-            'pedidos_en_proceso': pedidos_en_proceso,
-            'pedidos_enviados': pedidos_enviados,
-            'pedidos_entregados': pedidos_entregados,
-            'ventas_fisicas': ventas_fisicas,
-            'ventas_digitales': ventas_digitales,
-            'total_ingresos': float(total_ingresos),
-            'pedidos_ultimo_mes': pedidos_ultimo_mes
-        })
+        """
+        Estadísticas de los pedidos del usuario autenticado.
+        Se calculan con una sola consulta y se cachean hasta que un pedido cambia.
+        """
+        return Response(obtener_estadisticas(request.user.id))
 
 class ItemPedidoViewSet(viewsets.ModelViewSet):
     queryset = ItemPedido.objects.all().select_related('pedido', 'producto')
@@ -314,7 +290,7 @@ class AbonoViewSet(viewsets.ModelViewSet):
             return Response({'error': 'El monto debe ser mayor a 0'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            pedido = Pedido.objects.get(id=pedido_id, usuario=request.user)
+            pedido = Pedido.objects.select_related('venta').get(id=pedido_id, usuario=request.user)
         except Pedido.DoesNotExist:
             return Response({'error': 'Pedido no encontrado'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -335,13 +311,13 @@ class AbonoViewSet(viewsets.ModelViewSet):
             notas=notas or f'Pago registrado para pedido separado #{pedido.numero_pedido}'
         )
         
-        # Verificar si el pedido está completamente pagado
-        total_abonado = sum(a.monto for a in pedido.abonos.filter(estado_abono='confirmado'))
+        # Verificar si el pedido está completamente pagado (el abono ya actualizó monto_abono)
+        total_abonado = pedido.monto_abono
         if total_abonado >= pedido.total_pedido:
             # Cambiar estado del pedido a pendiente (ya está pagado)
             pedido.estado_pedido = 'pendiente'
             pedido.estado_pago = 'pagado'
-            pedido.save()
+            pedido.save(update_fields=['estado_pedido', 'estado_pago'])
             
             # Crear registro de cambio de estado
             EstadoPedido.objects.create(
@@ -361,28 +337,20 @@ class AbonoViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def resumen_abonos(self, request):
-        """Obtiene un resumen de abonos por pedido"""
+        """
+        Resumen de abonos por estado y por método de pago, con una sola consulta.
+        Filtros opcionales: pedido_id y fecha_desde / fecha_hasta (AAAA-MM-DD, sobre fecha_abono).
+        Sin pedido_id resume los abonos de todos los pedidos del usuario (reporte de caja).
+        """
+        abonos = Abono.objects.filter(pedido__usuario=request.user)
         pedido_id = request.query_params.get('pedido_id')
-        if not pedido_id:
-            return Response({'error': 'pedido_id es requerido'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        abonos = self.queryset.filter(pedido_id=pedido_id)
-        
-        resumen = {
-            'total_abonos': abonos.count(),
-            'total_confirmado': sum(a.monto for a in abonos.filter(estado_abono='confirmado')),
-            'total_pendiente': sum(a.monto for a in abonos.filter(estado_abono='pendiente')),
-            'total_rechazado': sum(a.monto for a in abonos.filter(estado_abono='rechazado')),
-            'abonos_por_metodo': {}
-        }
-        
-        # Agrupar por método de pago
-        for metodo, _ in Abono.METODO_PAGO_CHOICES:
-            abonos_metodo = abonos.filter(metodo_pago=metodo, estado_abono='confirmado')
-            if abonos_metodo.exists():
-                resumen['abonos_por_metodo'][metodo] = {
-                    'cantidad': abonos_metodo.count(),
-                    'total': sum(a.monto for a in abonos_metodo)
-                }
+        if pedido_id:
+            if not pedido_id.isdigit():
+                return Response({'error': 'pedido_id inválido'}, status=status.HTTP_400_BAD_REQUEST)
+            abonos = abonos.filter(pedido_id=pedido_id)
+        try:
+            abonos = filtrar_por_fechas(abonos, request.query_params, 'fecha_abono')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(resumen)
\ No newline at end of file
+        return Response(resumen_abonos(abonos))
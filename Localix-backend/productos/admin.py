@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from nested_admin import NestedModelAdmin, NestedTabularInline
-from .models import Producto, VarianteProducto, ColorProducto, ImagenProducto
+from .models import Producto, VarianteProducto, ColorProducto, ImagenProducto, TrabajoImagen, BlobMedia, MovimientoStock, InstantaneaStock
 from categorias.models import CategoriaProducto
 
 class ImagenProductoInline(NestedTabularInline):
@@ -167,4 +167,38 @@ class VarianteProductoAdmin(admin.ModelAdmin):
     list_display = ('producto', 'nombre', 'valor', 'precio_extra', 'stock')
     list_filter = ('producto', 'nombre')
     search_fields = ('producto__nombre', 'valor', 'sku')
-    list_editable = ('precio_extra', 'stock')
\ No newline at end of file
+    list_editable = ('precio_extra', 'stock')
+
+@admin.register(TrabajoImagen)
+class TrabajoImagenAdmin(admin.ModelAdmin):
+    list_display = ('tipo', 'objeto_id', 'estado', 'intentos', 'fecha_creacion', 'fecha_actualizacion')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('tipo', 'objeto_id', 'archivo', 'intentos', 'error', 'fecha_creacion', 'fecha_actualizacion')
+
+
+@admin.register(BlobMedia)
+class BlobMediaAdmin(admin.ModelAdmin):
+    list_display = ('archivo', 'usuario', 'referencias', 'tamano', 'fecha_actualizacion')
+    search_fields = ('archivo', 'resumen')
+    readonly_fields = ('usuario', 'archivo', 'resumen', 'tamano', 'referencias', 'fecha_creacion', 'fecha_actualizacion')
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'tipo', 'sku', 'descripcion', 'stock', 'reservado', 'referencia')
+    list_filter = ('tipo', 'fila', 'fecha')
+    search_fields = ('referencia', 'sku', 'descripcion')
+    readonly_fields = ('fila', 'producto', 'color', 'variante', 'sku', 'descripcion', 'tipo', 'stock', 'reservado', 'referencia', 'fecha')
+
+    def has_add_permission(self, request):
+        # El libro solo se escribe desde las operaciones de stock
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InstantaneaStock)
+class InstantaneaStockAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'fila', 'producto', 'color', 'variante', 'stock', 'reservado', 'hasta_movimiento')
+    readonly_fields = ('fila', 'producto', 'color', 'variante', 'stock', 'reservado', 'hasta_movimiento', 'fecha')
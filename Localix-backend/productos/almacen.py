@@ -0,0 +1,125 @@
+"""
+Almacén de medios direccionado por contenido
+
+Cada archivo se guarda como contenido/<usuario>/<ab>/<sha256><ext>: el nombre
+depende solo del contenido y de la tienda, de modo que
+
+- una imagen idéntica (la misma foto en varios colores, o subida otra vez)
+  se guarda una sola vez por usuario;
+- la URL de un archivo nunca cambia de contenido y se puede cachear para
+  siempre (Cache-Control: immutable, ver openlitespeed_config.txt).
+
+BlobMedia cuenta cuántas referencias tiene cada archivo. guardar_blob suma
+una referencia y liberar la resta; el archivo se elimina cuando la última
+referencia se libera y la transacción se confirma. Los nombres que no son
+blobs (subidas sin procesar, archivos anteriores a este almacén) se eliminan
+directamente.
+"""
+
+import logging
+from collections import Counter
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .procesamiento_imagenes import resumen_contenido
+
+logger = logging.getLogger(__name__)
+
+CARPETA = 'contenido'
+
+
+def nombre_blob(usuario_id, resumen, ext):
+    """Nombre en el storage de un contenido para un usuario"""
+    return f"{CARPETA}/{usuario_id or 'comun'}/{resumen[:2]}/{resumen}{ext}"
+
+
+def es_blob(nombre):
+    return bool(nombre) and nombre.startswith(f"{CARPETA}/")
+
+
+def eliminar_archivo(storage, nombre):
+    """
+    Elimina un archivo sin interrumpir el flujo si falla (p. ej. bloqueado en Windows).
+    Retorna False si no se pudo; el comando limpiar_media lo reintenta después.
+    """
+    if not nombre:
+        return True
+    try:
+        storage.delete(nombre)
+    except OSError as e:
+        logger.warning(f"No se pudo eliminar {nombre}: {e}")
+        return False
+    return True
+
+
+def _escribir(storage, nombre, datos):
+    """Escribe el contenido si aún no existe; una escritura concurrente deja el mismo contenido"""
+    if storage.exists(nombre):
+        return
+    guardado = storage.save(nombre, ContentFile(datos))
+    if guardado != nombre:
+        # Otro proceso escribió el mismo contenido entre exists() y save()
+        eliminar_archivo(storage, guardado)
+
+
+def guardar_blob(storage, usuario_id, datos, ext):
+    """
+    Guarda `datos` en el almacén del usuario y suma una referencia.
+    Retorna el nombre del archivo (el mismo para contenidos idénticos).
+    """
+    from .models import BlobMedia
+
+    resumen = resumen_contenido(datos)
+    nombre = nombre_blob(usuario_id, resumen, ext)
+    with transaction.atomic():
+        if BlobMedia.objects.filter(archivo=nombre).update(referencias=F('referencias') + 1, fecha_actualizacion=timezone.now()):
+            return nombre
+        # El archivo se escribe siempre al crear el registro: si una liberación
+        # concurrente lo acaba de eliminar, se vuelve a escribir
+        _escribir(storage, nombre, datos)
+        try:
+            with transaction.atomic():
+                BlobMedia.objects.create(
+                    usuario_id=usuario_id, archivo=nombre, resumen=resumen,
+                    tamano=len(datos), referencias=1
+                )
+        except IntegrityError:
+            # Otro proceso creó el registro al mismo tiempo
+            BlobMedia.objects.filter(archivo=nombre).update(referencias=F('referencias') + 1, fecha_actualizacion=timezone.now())
+    return nombre
+
+
+def _eliminar_si_huerfano(storage, nombre):
+    from .models import BlobMedia
+
+    if not BlobMedia.objects.filter(archivo=nombre).exists():
+        eliminar_archivo(storage, nombre)
+
+
+def liberar(storage, nombres):
+    """
+    Resta una referencia por cada aparición de cada nombre. Los blobs que
+    quedan sin referencias y los archivos que no son blobs se eliminan del
+    storage al confirmarse la transacción.
+    """
+    from .models import BlobMedia
+
+    for nombre, cantidad in Counter(n for n in nombres if n).items():
+        if not es_blob(nombre):
+            transaction.on_commit(lambda nombre=nombre: eliminar_archivo(storage, nombre))
+            continue
+        with transaction.atomic():
+            blob = BlobMedia.objects.select_for_update().filter(archivo=nombre).first()
+            if blob is None:
+                continue
+            if blob.referencias > cantidad:
+                BlobMedia.objects.filter(pk=blob.pk).update(
+                    referencias=F('referencias') - cantidad, fecha_actualizacion=timezone.now()
+                )
+                continue
+            blob.delete()
+            # Si otro objeto vuelve a guardar el mismo contenido antes de confirmar, el archivo se conserva
+            transaction.on_commit(lambda nombre=nombre: _eliminar_si_huerfano(storage, nombre))
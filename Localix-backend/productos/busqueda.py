@@ -0,0 +1,118 @@
+"""
+Búsqueda de productos por nombre, SKU y descripciones
+
+Producto.texto_busqueda guarda sku, nombre y descripciones normalizados
+(minúsculas, sin acentos) y se mantiene en Producto.save().
+
+- PostgreSQL: la columna generada vector_busqueda (tsvector sobre texto_busqueda)
+  tiene un índice GIN; cada término se busca por prefijo (término:*) y los
+  nombres/SKU con errores de tipeo coinciden por trigramas (pg_trgm). Los
+  resultados se ordenan por ts_rank más la similitud del nombre.
+- Otros motores (SQLite en tests): los términos normalizados se buscan como
+  subcadenas de texto_busqueda y se ordenan por coincidencia de SKU y nombre.
+"""
+
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import BooleanField, Case, F, Func, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+_NO_ALFANUMERICO = re.compile(r'[^\w]+')
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Canción Ñandú' -> 'cancion nandu'"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def terminos(texto):
+    """Términos normalizados de una consulta, solo caracteres alfanuméricos"""
+    return [termino for termino in _NO_ALFANUMERICO.split(normalizar(texto)) if termino]
+
+
+def texto_busqueda_producto(producto):
+    """Contenido de Producto.texto_busqueda"""
+    partes = [producto.sku, producto.nombre, producto.descripcion_corta, producto.descripcion_larga]
+    return ' '.join(normalizar(parte) for parte in partes if parte)
+
+
+class _TrigramaSimilar(Func):
+    """
+    columna % 'texto' (pg_trgm), aprovecha los índices gin_trgm_ops.
+    El umbral es pg_trgm.similarity_threshold (0.3 por defecto).
+    """
+    arg_joiner = ' %% '
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+
+def _buscar_postgresql(queryset, texto, lista_terminos, ordenar):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity
+
+    qn = connection.ops.quote_name
+    vector = RawSQL(
+        f"{qn(queryset.model._meta.db_table)}.{qn('vector_busqueda')}", [],
+        output_field=SearchVectorField()
+    )
+    consulta = SearchQuery(
+        ' & '.join(f"{termino}:*" for termino in lista_terminos),
+        search_type='raw', config='simple'
+    )
+    queryset = queryset.alias(vector_busqueda=vector).filter(
+        Q(vector_busqueda=consulta) |
+        Q(_TrigramaSimilar(F('nombre'), Value(texto))) |
+        Q(_TrigramaSimilar(F('sku'), Value(texto)))
+    )
+    if not ordenar:
+        return queryset
+    return queryset.annotate(
+        relevancia=SearchRank(vector, consulta) + TrigramSimilarity('nombre', texto)
+    ).order_by('-relevancia', '-id')
+
+
+def _buscar_generico(queryset, texto, lista_terminos, ordenar):
+    for termino in lista_terminos:
+        queryset = queryset.filter(texto_busqueda__contains=termino)
+    if not ordenar:
+        return queryset
+    return queryset.annotate(
+        relevancia=Case(
+            When(sku__iexact=texto, then=Value(4)),
+            When(sku__istartswith=texto, then=Value(3)),
+            When(nombre__istartswith=texto, then=Value(2)),
+            When(nombre__icontains=texto, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    ).order_by('-relevancia', '-id')
+
+
+def buscar_productos(queryset, texto, ordenar=True):
+    """
+    Filtra un queryset de productos por el texto buscado y, si ordenar=True,
+    lo ordena por relevancia (anotada como `relevancia`).
+    """
+    texto = (texto or '').strip()
+    lista_terminos = terminos(texto)
+    if not lista_terminos:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _buscar_postgresql(queryset, texto, lista_terminos, ordenar)
+    return _buscar_generico(queryset, texto, lista_terminos, ordenar)
+
+
+class BusquedaProductosFilter(filters.SearchFilter):
+    """
+    SearchFilter de productos sobre el índice de búsqueda en lugar de icontains.
+    Ordena por relevancia salvo que la petición pida un ?ordering explícito,
+    por eso debe ir después de OrderingFilter en filter_backends.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, '')
+        ordering_param = getattr(view, 'ordering_param', filters.OrderingFilter.ordering_param)
+        return buscar_productos(queryset, texto, ordenar=not request.query_params.get(ordering_param))
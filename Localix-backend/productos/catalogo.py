@@ -0,0 +1,88 @@
+"""
+Catálogo público de productos (tienda virtual y punto de venta)
+
+Las páginas se paginan por cursor (keyset sobre id) y se cachean por usuario.
+Cada usuario tiene una versión de catálogo que forma parte de la clave de caché;
+cualquier cambio en sus productos o colores incrementa la versión, de modo que
+las páginas anteriores dejan de leerse sin tener que borrarlas una por una.
+La versión solo invalida las páginas de otros workers si comparten la caché
+(DatabaseCache en Backend/settings_production.py).
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.pagination import CursorPagination
+
+# Segundos que se conserva cada página cacheada; 0 desactiva la caché
+CATALOGO_CACHE_TIMEOUT = getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 300)
+
+
+class CatalogoCursorPagination(CursorPagination):
+    """Paginación por cursor: el costo de cada página no depende de su posición"""
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+
+def _clave_version(usuario_id):
+    return f"catalogo_version:{usuario_id}"
+
+
+def _version_inicial():
+    # Basada en el reloj para no reutilizar una versión anterior si la clave fue desalojada
+    return int(time.time() * 1000)
+
+
+def version_catalogo(usuario_id):
+    """Versión vigente del catálogo del usuario"""
+    clave = _clave_version(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, _version_inicial(), None)
+        version = cache.get(clave, _version_inicial())
+    return version
+
+
+def _incrementar_version(usuario_id):
+    clave = _clave_version(usuario_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, _version_inicial(), None)
+
+
+def invalidar_catalogo(usuario_id):
+    """
+    Incrementa la versión del catálogo del usuario cuando la transacción se confirma,
+    para que una lectura concurrente no vuelva a cachear datos sin confirmar.
+    """
+    if usuario_id is None:
+        return
+    transaction.on_commit(lambda: _incrementar_version(usuario_id))
+
+
+def invalidar_catalogo_de_productos(producto_ids):
+    """Invalida el catálogo de los usuarios dueños de los productos indicados"""
+    from .models import Producto
+
+    usuarios = (
+        Producto.objects.filter(pk__in=set(producto_ids))
+        .order_by().values_list('usuario_id', flat=True).distinct()
+    )
+    for usuario_id in usuarios:
+        invalidar_catalogo(usuario_id)
+
+
+def clave_pagina_catalogo(request):
+    """Clave de caché de una página: usuario, versión vigente, host y parámetros"""
+    usuario_id = request.user.id
+    # Parámetros ordenados: ?a=1&b=2 y ?b=2&a=1 comparten la misma entrada
+    parametros = f"{request.get_host()}?{urlencode(sorted(request.GET.lists()), doseq=True)}"
+    resumen = hashlib.sha1(parametros.encode('utf-8')).hexdigest()
+    return f"catalogo:{usuario_id}:v{version_catalogo(usuario_id)}:{resumen}"
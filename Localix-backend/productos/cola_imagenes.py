@@ -0,0 +1,285 @@
+"""
+Cola de procesamiento de imágenes con un pool local de procesos
+
+Las subidas guardan el archivo tal como llega, registran un TrabajoImagen y
+responden de inmediato. Al confirmarse la transacción el trabajo se envía a un
+ProcessPoolExecutor (sin broker externo): el proceso hijo decodifica,
+corrige la orientación, redimensiona y genera las rendiciones, y este proceso
+guarda los archivos resultantes y actualiza el objeto.
+
+La imagen procesada y sus rendiciones (miniatura y escalera de anchos en
+AVIF/WebP/JPEG) se guardan en el almacén direccionado por contenido
+(productos/almacen.py): se deduplican por usuario y sus URLs se pueden cachear
+para siempre. El campo de rendiciones lista todos esos archivos, incluida la
+imagen procesada ('original'), y es la fuente de las referencias del objeto.
+
+Con IMAGENES_ASYNC = False el trabajo se procesa en la misma petición
+(útil en tests o en entornos sin multiprocessing).
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from . import procesamiento_imagenes
+from .almacen import es_blob, guardar_blob, liberar
+from .procesamiento_imagenes import procesar_imagen
+
+logger = logging.getLogger(__name__)
+
+# tipo de trabajo -> (modelo, campo de imagen, campo de rendiciones, campo de estado)
+DESTINOS = {
+    'producto': ('productos.Producto', 'imagen_principal', 'imagen_rendiciones', 'imagen_estado'),
+    'color': ('productos.ImagenProducto', 'imagen', 'rendiciones', None),
+    'categoria': ('categorias.CategoriaProducto', 'imagen', 'imagen_rendiciones', None),
+}
+
+# tipo de trabajo -> campo con el usuario dueño del objeto (el almacén deduplica por usuario)
+USUARIO_DESTINO = {
+    'producto': 'usuario_id',
+    'color': 'color__producto__usuario_id',
+    'categoria': 'usuario_id',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _procesar_en_segundo_plano():
+    return getattr(settings, 'IMAGENES_ASYNC', True)
+
+
+def _limite_pixeles():
+    return getattr(settings, 'IMAGENES_MAX_PIXELES', procesamiento_imagenes.MAX_PIXELES)
+
+
+def _opciones_procesamiento():
+    return {
+        'anchos': tuple(getattr(settings, 'IMAGENES_ANCHOS', procesamiento_imagenes.ANCHOS)),
+        'formatos': tuple(getattr(settings, 'IMAGENES_FORMATOS', procesamiento_imagenes.FORMATOS)),
+        'max_pixeles': _limite_pixeles(),
+    }
+
+
+def verificar_subida(archivo):
+    """
+    Valida una imagen subida solo por su cabecera, con el límite IMAGENES_MAX_PIXELES.
+    Retorna el formato; lanza ImagenDemasiadoGrande o una excepción de Pillow.
+    """
+    return procesamiento_imagenes.verificar_imagen(archivo, max_pixeles=_limite_pixeles())
+
+
+def _obtener_pool():
+    """Pool creado a demanda; 'spawn' evita heredar hilos y conexiones del servidor"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGENES_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _destino(tipo):
+    modelo, campo_imagen, campo_rendiciones, campo_estado = DESTINOS[tipo]
+    return apps.get_model(modelo), campo_imagen, campo_rendiciones, campo_estado
+
+
+def _storage(tipo):
+    modelo, campo_imagen, _, _ = _destino(tipo)
+    return modelo._meta.get_field(campo_imagen).storage
+
+
+def archivos_de_rendiciones(rendiciones):
+    """Nombres de todos los archivos referenciados en un campo de rendiciones"""
+    if isinstance(rendiciones, str):
+        yield rendiciones
+    elif isinstance(rendiciones, dict):
+        for valor in rendiciones.values():
+            yield from archivos_de_rendiciones(valor)
+    elif isinstance(rendiciones, list):
+        for valor in rendiciones:
+            yield from archivos_de_rendiciones(valor)
+
+
+def archivos_referenciados(imagen, rendiciones):
+    """
+    Archivos que un objeto mantiene referenciados: los de sus rendiciones y,
+    si aún no se procesó (o es anterior al almacén), el de su imagen.
+    """
+    archivos = list(archivos_de_rendiciones(rendiciones))
+    if imagen and imagen not in archivos:
+        archivos.append(imagen)
+    return archivos
+
+
+def liberar_imagen(tipo, imagen, rendiciones):
+    """Libera los archivos de la imagen de un objeto (al eliminarla o eliminar el objeto)"""
+    liberar(_storage(tipo), archivos_referenciados(imagen, rendiciones))
+
+
+def eliminar_imagen_producto(producto):
+    """Libera la imagen principal y sus rendiciones y limpia los campos (sin guardar)"""
+    liberar_imagen('producto', producto.imagen_principal.name, producto.imagen_rendiciones)
+    producto.imagen_principal = None
+    producto.imagen_rendiciones = {}
+    producto.imagen_estado = 'sin_imagen'
+
+
+def _encolar(tipo, objeto_id, archivo, despachar_al_confirmar):
+    from .models import TrabajoImagen
+
+    trabajo = TrabajoImagen.objects.create(tipo=tipo, objeto_id=objeto_id, archivo=archivo)
+    if despachar_al_confirmar:
+        transaction.on_commit(lambda: despachar(trabajo.pk))
+    return trabajo
+
+
+def encolar_imagen_producto(producto, despachar_al_confirmar=True):
+    """
+    Marca la imagen principal como pendiente y encola su procesamiento.
+    Con despachar_al_confirmar=False el trabajo queda pendiente para procesar_imagenes.
+    """
+    from .models import Producto
+
+    if not producto.imagen_principal:
+        return None
+    producto.imagen_estado = 'pendiente'
+    Producto.objects.filter(pk=producto.pk).update(imagen_estado='pendiente')
+    return _encolar('producto', producto.pk, producto.imagen_principal.name, despachar_al_confirmar)
+
+
+def encolar_imagen_color(imagen_producto, despachar_al_confirmar=True):
+    """Encola la redimensión y las rendiciones de una imagen de color"""
+    if not imagen_producto.imagen:
+        return None
+    return _encolar('color', imagen_producto.pk, imagen_producto.imagen.name, despachar_al_confirmar)
+
+
+def encolar_imagen_categoria(categoria, despachar_al_confirmar=True):
+    """Encola la redimensión de la imagen de una categoría (los SVG se guardan tal cual)"""
+    if not categoria.imagen or categoria.imagen.name.lower().endswith('.svg'):
+        return None
+    return _encolar('categoria', categoria.pk, categoria.imagen.name, despachar_al_confirmar)
+
+
+def _iniciar(trabajo_id):
+    """Marca el trabajo como en proceso; retorna el trabajo y el origen para Pillow"""
+    from .models import TrabajoImagen
+
+    TrabajoImagen.objects.filter(pk=trabajo_id).update(estado='procesando', intentos=F('intentos') + 1)
+    trabajo = TrabajoImagen.objects.get(pk=trabajo_id)
+    modelo, campo_imagen, _, campo_estado = _destino(trabajo.tipo)
+    if campo_estado:
+        modelo.objects.filter(pk=trabajo.objeto_id, **{campo_imagen: trabajo.archivo}).update(**{campo_estado: 'procesando'})
+
+    storage = _storage(trabajo.tipo)
+    try:
+        # Con almacenamiento local el proceso hijo lee el archivo directamente
+        origen = storage.path(trabajo.archivo)
+    except NotImplementedError:
+        with storage.open(trabajo.archivo, 'rb') as archivo:
+            origen = archivo.read()
+    return trabajo, origen
+
+
+def _guardar_rendiciones(storage, usuario_id, resultado):
+    """Guarda cada archivo generado en el almacén (una referencia por aparición)"""
+    datos, ext = resultado['original']
+    rendiciones = {'original': guardar_blob(storage, usuario_id, datos, ext)}
+    datos, ext = resultado['miniatura']
+    rendiciones['miniatura'] = guardar_blob(storage, usuario_id, datos, ext)
+    rendiciones['fuentes'] = {}
+    for fuente in resultado['fuentes']:
+        rendiciones['fuentes'].setdefault(fuente['tipo'], []).append({
+            'ancho': fuente['ancho'],
+            'archivo': guardar_blob(storage, usuario_id, fuente['datos'], fuente['ext']),
+        })
+    return rendiciones
+
+
+def _guardar_resultado(trabajo, resultado):
+    """Guarda los archivos generados y los asigna si la imagen no cambió entretanto"""
+    from .catalogo import invalidar_catalogo_de_productos
+
+    modelo, campo_imagen, campo_rendiciones, campo_estado = _destino(trabajo.tipo)
+    storage = _storage(trabajo.tipo)
+
+    with transaction.atomic():
+        objetos = modelo.objects.select_for_update(of=('self',)).filter(pk=trabajo.objeto_id, **{campo_imagen: trabajo.archivo})
+        actual = objetos.values(campo_rendiciones, propietario=F(USUARIO_DESTINO[trabajo.tipo])).first()
+        if actual is not None:
+            rendiciones = _guardar_rendiciones(storage, actual['propietario'], resultado)
+            cambios = {campo_imagen: rendiciones['original'], campo_rendiciones: rendiciones}
+            if campo_estado:
+                cambios[campo_estado] = 'lista'
+            objetos.update(**cambios)
+            # Las referencias de la imagen anterior (subida sin procesar, rendiciones previas) se liberan
+            liberar(storage, archivos_referenciados(trabajo.archivo, actual[campo_rendiciones]))
+            if trabajo.tipo == 'producto':
+                invalidar_catalogo_de_productos([trabajo.objeto_id])
+        elif not es_blob(trabajo.archivo):
+            # El objeto se eliminó o recibió otra imagen mientras se procesaba; la subida
+            # sin procesar es del trabajo (un blob, en cambio, lo liberan las rendiciones del objeto)
+            liberar(storage, [trabajo.archivo])
+
+        trabajo.estado = 'completado'
+        trabajo.error = ''
+        trabajo.save(update_fields=['estado', 'error', 'fecha_actualizacion'])
+
+
+def _registrar_error(trabajo_id, error):
+    from .models import TrabajoImagen
+
+    logger.error(f"Error procesando la imagen del trabajo {trabajo_id}: {error}")
+    TrabajoImagen.objects.filter(pk=trabajo_id).update(estado='error', error=str(error))
+    trabajo = TrabajoImagen.objects.filter(pk=trabajo_id).first()
+    if trabajo:
+        modelo, campo_imagen, _, campo_estado = _destino(trabajo.tipo)
+        if campo_estado:
+            modelo.objects.filter(pk=trabajo.objeto_id, **{campo_imagen: trabajo.archivo}).update(**{campo_estado: 'error'})
+
+
+def procesar_trabajo(trabajo_id):
+    """Procesa un trabajo en el proceso actual. Retorna True si terminó sin errores"""
+    try:
+        trabajo, origen = _iniciar(trabajo_id)
+        _guardar_resultado(trabajo, procesar_imagen(origen, **_opciones_procesamiento()))
+        return True
+    except Exception as e:
+        _registrar_error(trabajo_id, e)
+        return False
+
+
+def _completar(trabajo_id, futuro):
+    """Callback del pool: corre en un hilo de este proceso, con su propia conexión"""
+    from .models import TrabajoImagen
+
+    close_old_connections()
+    try:
+        _guardar_resultado(TrabajoImagen.objects.get(pk=trabajo_id), futuro.result())
+    except Exception as e:
+        _registrar_error(trabajo_id, e)
+    finally:
+        close_old_connections()
+
+
+def despachar(trabajo_id):
+    """Envía el trabajo al pool de procesos (o lo procesa aquí si IMAGENES_ASYNC es False)"""
+    if not _procesar_en_segundo_plano():
+        return procesar_trabajo(trabajo_id)
+    try:
+        _, origen = _iniciar(trabajo_id)
+        futuro = _obtener_pool().submit(procesar_imagen, origen, **_opciones_procesamiento())
+    except Exception as e:
+        _registrar_error(trabajo_id, e)
+        return False
+    futuro.add_done_callback(lambda f: _completar(trabajo_id, f))
+    return True
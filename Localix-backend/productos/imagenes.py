@@ -0,0 +1,45 @@
+"""
+Representación de imágenes con rendiciones para los serializers
+"""
+
+
+def imagen_responsive(archivo, rendiciones, request=None):
+    """
+    Estructura lista para <picture>/srcset a partir de un ImageField y su campo
+    de rendiciones:
+
+    {
+        "src": url de la imagen original,
+        "miniatura": url de la miniatura 300x300 (o null),
+        "anchos": [320, 640, ...],
+        "fuentes": [{"tipo": "image/avif", "srcset": "url 320w, url 640w"}, ...]
+    }
+
+    Las fuentes van en orden de preferencia (AVIF, WebP, JPEG). Mientras la
+    imagen se procesa, "fuentes" está vacío y "src" apunta a la subida original.
+    """
+    if not archivo:
+        return None
+
+    def url(nombre):
+        valor = archivo.storage.url(nombre)
+        return request.build_absolute_uri(valor) if request is not None else valor
+
+    rendiciones = rendiciones or {}
+    fuentes = []
+    anchos = set()
+    for tipo, variantes in (rendiciones.get('fuentes') or {}).items():
+        variantes = sorted(variantes, key=lambda variante: variante['ancho'])
+        anchos.update(variante['ancho'] for variante in variantes)
+        fuentes.append({
+            'tipo': tipo,
+            'srcset': ', '.join(f"{url(variante['archivo'])} {variante['ancho']}w" for variante in variantes),
+        })
+
+    miniatura = rendiciones.get('miniatura')
+    return {
+        'src': url(archivo.name),
+        'miniatura': url(miniatura) if miniatura else None,
+        'anchos': sorted(anchos),
+        'fuentes': fuentes,
+    }
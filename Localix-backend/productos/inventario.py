@@ -0,0 +1,160 @@
+"""
+Operaciones atómicas de stock sobre productos, colores y variantes
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .catalogo import invalidar_catalogo_de_productos
+from .movimientos import movimiento, registrar
+
+
+def descontar_stock(model, pk, cantidad):
+    """
+    Descuenta stock con un UPDATE condicional:
+    UPDATE ... SET stock = stock - cantidad WHERE id = pk AND stock >= cantidad
+    Retorna True si había stock suficiente y la fila fue actualizada.
+    """
+    actualizados = model.objects.filter(pk=pk, stock__gte=cantidad).update(
+        stock=F('stock') - cantidad
+    )
+    return actualizados == 1
+
+
+def reponer_stock(model, pk, cantidad):
+    """Aumenta el stock de una fila con un UPDATE atómico"""
+    actualizados = model.objects.filter(pk=pk).update(stock=F('stock') + cantidad)
+    return actualizados == 1
+
+
+def reservar_stock(model, pk, cantidad):
+    """
+    Reserva stock con un UPDATE condicional:
+    UPDATE ... SET stock_reservado = stock_reservado + cantidad
+    WHERE id = pk AND stock >= stock_reservado + cantidad
+    Retorna True si había stock disponible suficiente y la fila fue actualizada.
+    """
+    actualizados = model.objects.filter(pk=pk, stock__gte=F('stock_reservado') + cantidad).update(
+        stock_reservado=F('stock_reservado') + cantidad
+    )
+    return actualizados == 1
+
+
+def _case_por_pk(valores):
+    """Expresión CASE WHEN id = pk THEN valor ... ELSE 0 para UPDATE por lotes"""
+    return Case(
+        *[When(pk=pk, then=Value(valor)) for pk, valor in valores.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def descontar_stock_lote(model, cantidades, **incrementos):
+    """
+    Descuenta stock de varias filas con un único UPDATE condicional.
+    `cantidades` es un dict {pk: cantidad_a_descontar}; `incrementos` permite sumar
+    otros contadores en la misma sentencia, p. ej. vendidos={pk: cantidad}.
+    Las filas solo se actualizan si su stock alcanza; retorna True si todas
+    las filas involucradas fueron actualizadas.
+    """
+    pks = set(cantidades) | {pk for valores in incrementos.values() for pk in valores}
+    if not pks:
+        return True
+    
+    condicion = Q(pk__in=pks - set(cantidades))
+    for pk, cantidad in cantidades.items():
+        condicion |= Q(pk=pk, stock__gte=cantidad)
+    
+    cambios = {campo: F(campo) + _case_por_pk(valores) for campo, valores in incrementos.items()}
+    if cantidades:
+        cambios['stock'] = F('stock') - _case_por_pk(cantidades)
+    
+    actualizados = model.objects.filter(condicion).update(**cambios)
+    return actualizados == len(pks)
+
+
+def liberar_reservado_lote(model, cantidades):
+    """
+    Resta stock reservado de varias filas con un único UPDATE ... CASE.
+    `cantidades` es un dict {pk: unidades_a_liberar}; quien llama debe haber
+    bloqueado las filas y acotado las cantidades a su stock_reservado.
+    """
+    if cantidades:
+        model.objects.filter(pk__in=cantidades).update(stock_reservado=F('stock_reservado') - _case_por_pk(cantidades))
+
+
+def _filas_bloqueadas(model, pks, usuario):
+    """Stock actual de las filas del usuario, bloqueadas hasta el fin de la transacción"""
+    if not pks:
+        return {}
+    filas = (
+        model.objects.select_for_update(of=('self',))
+        .filter(pk__in=pks, producto__usuario=usuario)
+        .values('pk', 'producto_id', 'stock', 'stock_reservado')
+    )
+    return {fila['pk']: fila for fila in filas}
+
+
+def ajustar_stock_lote(usuario, ajustes):
+    """
+    Aplica un lote de ajustes de stock de colores y variantes del usuario.
+    Cada ajuste es un dict con 'color' o 'variante' y 'stock' (absoluto) o
+    'delta'; las líneas sobre la misma fila se aplican en orden.
+
+    Todo ocurre en una transacción: las filas se bloquean con una sola
+    consulta por modelo, el stock nuevo se escribe con un UPDATE ... CASE por
+    modelo, los movimientos del libro con un solo INSERT y el stock total de
+    cada producto afectado se recalcula una vez.
+    Si alguna línea es inválida no se aplica ninguna.
+    Retorna (aplicado, resultados por línea).
+    """
+    from .models import ColorProducto, Producto, VarianteProducto
+
+    modelos = {'color': ColorProducto, 'variante': VarianteProducto}
+    with transaction.atomic():
+        filas = {
+            tipo: _filas_bloqueadas(model, {a[tipo] for a in ajustes if tipo in a}, usuario)
+            for tipo, model in modelos.items()
+        }
+        nuevos = {tipo: {} for tipo in modelos}
+        resultados = []
+        for linea, ajuste in enumerate(ajustes):
+            tipo = 'color' if 'color' in ajuste else 'variante'
+            pk = ajuste[tipo]
+            resultado = {'linea': linea, 'tipo': tipo, 'id': pk}
+            resultados.append(resultado)
+            fila = filas[tipo].get(pk)
+            if fila is None:
+                resultado.update(ok=False, error=f"{tipo.capitalize()} no encontrado")
+                continue
+            anterior = nuevos[tipo].get(pk, fila['stock'])
+            stock = ajuste['stock'] if 'stock' in ajuste else anterior + ajuste['delta']
+            resultado.update(producto=fila['producto_id'], stock_anterior=anterior)
+            if stock < 0:
+                resultado.update(ok=False, error="El stock no puede quedar negativo")
+            elif stock < fila['stock_reservado']:
+                resultado.update(ok=False, error=f"El stock no puede ser menor que el reservado ({fila['stock_reservado']})")
+            else:
+                nuevos[tipo][pk] = stock
+                resultado.update(ok=True, stock=stock)
+
+        if not all(resultado['ok'] for resultado in resultados):
+            return False, resultados
+
+        productos = set()
+        movimientos = []
+        for tipo, model in modelos.items():
+            cambios = {pk: stock for pk, stock in nuevos[tipo].items() if stock != filas[tipo][pk]['stock']}
+            if cambios:
+                model.objects.filter(pk__in=cambios).update(stock=_case_por_pk(cambios))
+                productos.update(filas[tipo][pk]['producto_id'] for pk in cambios)
+                movimientos.extend(
+                    movimiento('ajuste', filas[tipo][pk]['producto_id'], stock=stock - filas[tipo][pk]['stock'],
+                               referencia='ajuste_masivo', **{f'{tipo}_id': pk})
+                    for pk, stock in cambios.items()
+                )
+        registrar(movimientos)
+        if productos:
+            Producto.objects.filter(pk__in=productos).actualizar_stock_total()
+            invalidar_catalogo_de_productos(productos)
+    return True, resultados
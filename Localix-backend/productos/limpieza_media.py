@@ -0,0 +1,195 @@
+"""
+Recolección de archivos de medios huérfanos (comando limpiar_media)
+
+Los archivos quedan huérfanos cuando una eliminación falla (p. ej. un
+PermissionError en Windows) o cuando se borran filas sin pasar por delete()
+(ColorProducto elimina en cascada sus ImagenProducto). El recolector:
+
+1. Reconcilia las referencias de BlobMedia con las que realmente tienen los
+   objetos, usuario por usuario (la memoria depende del tamaño de una tienda,
+   no del total).
+2. Recorre las carpetas de los ImageField de productos, categorias y usuarios
+   y del almacén de contenido por lotes; cada lote se cruza con la base de
+   datos mediante consultas `__in` y se resta como conjunto.
+3. Elimina (o solo informa, en modo simulación) los archivos sin referencias
+   cuya última modificación es anterior al período de gracia, para no tocar
+   subidas en curso.
+"""
+
+from collections import Counter
+from itertools import islice
+
+from django.apps import apps
+from django.db import models
+
+from .almacen import CARPETA, eliminar_archivo, es_blob
+from .cola_imagenes import DESTINOS, USUARIO_DESTINO, archivos_de_rendiciones, archivos_referenciados
+
+APPS = ('productos', 'categorias', 'usuarios')
+
+TAMANO_LOTE = 1000
+
+
+def campos_de_archivo():
+    """(modelo, nombre del campo) de cada FileField/ImageField de las apps revisadas"""
+    for app_label in APPS:
+        for modelo in apps.get_app_config(app_label).get_models():
+            for campo in modelo._meta.get_fields():
+                if isinstance(campo, models.FileField):
+                    yield modelo, campo.name
+
+
+def carpetas_revisadas():
+    """
+    Carpetas de upload_to de esos campos más la del almacén de contenido,
+    sin repetir subcarpetas ('productos/colores/' ya está en 'productos/').
+    Los upload_to calculados con funciones no se pueden acotar y se omiten.
+    """
+    carpetas = {f"{CARPETA}/"}
+    for modelo, nombre in campos_de_archivo():
+        upload_to = modelo._meta.get_field(nombre).upload_to
+        if isinstance(upload_to, str) and upload_to and '%' not in upload_to:
+            carpetas.add(upload_to.rstrip('/') + '/')
+    resultado = []
+    for carpeta in sorted(carpetas):
+        if not any(carpeta.startswith(padre) for padre in resultado):
+            resultado.append(carpeta)
+    return resultado
+
+
+def recorrer(storage, carpeta):
+    """Nombres de los archivos bajo `carpeta`, uno a uno (no lista el árbol completo en memoria)"""
+    try:
+        directorios, archivos = storage.listdir(carpeta)
+    except FileNotFoundError:
+        return
+    for archivo in archivos:
+        yield f"{carpeta}{archivo}"
+    for directorio in directorios:
+        yield from recorrer(storage, f"{carpeta}{directorio}/")
+
+
+def _lotes(nombres, tamano):
+    iterador = iter(nombres)
+    while lote := set(islice(iterador, tamano)):
+        yield lote
+
+
+def _destinos():
+    for tipo, (modelo, campo_imagen, campo_rendiciones, _) in DESTINOS.items():
+        yield apps.get_model(modelo), campo_imagen, campo_rendiciones, USUARIO_DESTINO[tipo]
+
+
+def _conteo_de_usuario(usuario_id):
+    """Referencias a blobs que tienen los objetos de un usuario"""
+    conteo = Counter()
+    for modelo, campo_imagen, campo_rendiciones, campo_usuario in _destinos():
+        filas = modelo.objects.filter(**{campo_usuario: usuario_id}).values_list(campo_imagen, campo_rendiciones)
+        for imagen, rendiciones in filas.iterator():
+            conteo.update(n for n in archivos_referenciados(imagen, rendiciones) if es_blob(n))
+    return conteo
+
+
+def reconciliar_referencias(storage, limite, aplicar):
+    """
+    Recalcula las referencias de cada BlobMedia a partir de los objetos, un
+    usuario a la vez. Solo corrige blobs sin cambios desde `limite` (los
+    recientes pueden estar en medio de una transacción); los blobs usados que
+    perdieron su registro se vuelven a registrar. Retorna
+    (corregidas, nombres sin referencias, nombres usados sin registro).
+    """
+    from django.contrib.auth import get_user_model
+    from .models import BlobMedia
+
+    corregidas = 0
+    sin_referencias = set()
+    sin_registro = set()
+    usuarios = [*get_user_model().objects.order_by().values_list('pk', flat=True).iterator(), None]
+    for usuario_id in usuarios:
+        conteo = _conteo_de_usuario(usuario_id)
+        registrados = set()
+        for blob in BlobMedia.objects.filter(usuario_id=usuario_id).iterator():
+            registrados.add(blob.archivo)
+            reales = conteo.get(blob.archivo, 0)
+            if reales == blob.referencias or blob.fecha_actualizacion >= limite:
+                continue
+            corregidas += 1
+            if reales == 0:
+                sin_referencias.add(blob.archivo)
+            if aplicar:
+                if reales == 0:
+                    blob.delete()
+                else:
+                    BlobMedia.objects.filter(pk=blob.pk).update(referencias=reales)
+
+        for nombre in conteo.keys() - registrados:
+            corregidas += 1
+            sin_registro.add(nombre)
+            if aplicar and storage.exists(nombre):
+                BlobMedia.objects.get_or_create(archivo=nombre, defaults={
+                    'usuario_id': usuario_id, 'resumen': nombre.rsplit('/', 1)[-1].split('.')[0],
+                    'tamano': storage.size(nombre), 'referencias': conteo[nombre],
+                })
+    return corregidas, sin_referencias, sin_registro
+
+
+def rendiciones_de_legado():
+    """Archivos de rendiciones anteriores al almacén de contenido (desaparecen con procesar_imagenes --regenerar)"""
+    legado = set()
+    for modelo, _, campo_rendiciones, _ in _destinos():
+        filas = modelo.objects.exclude(**{campo_rendiciones: {}}).values_list(campo_rendiciones, flat=True)
+        for rendiciones in filas.iterator():
+            legado.update(n for n in archivos_de_rendiciones(rendiciones) if not es_blob(n))
+    return legado
+
+
+def _referenciados(lote, limite, sin_referencias, protegidos):
+    """Nombres del lote que algún objeto, blob o trabajo pendiente todavía usa"""
+    from .models import BlobMedia, TrabajoImagen
+
+    usados = lote & protegidos
+    for modelo, nombre in campos_de_archivo():
+        usados.update(modelo._default_manager.filter(**{f"{nombre}__in": lote}).values_list(nombre, flat=True))
+    # Un blob sin referencias al reconciliar que volvió a usarse desde entonces se conserva
+    blobs = BlobMedia.objects.filter(archivo__in=lote, referencias__gt=0).values_list('archivo', 'fecha_actualizacion')
+    usados.update(archivo for archivo, fecha in blobs if archivo not in sin_referencias or fecha >= limite)
+    # Subidas esperando su procesamiento (las fallidas se pueden reintentar)
+    usados.update(
+        TrabajoImagen.objects.filter(archivo__in=lote, estado__in=['pendiente', 'procesando', 'error'])
+        .values_list('archivo', flat=True)
+    )
+    return usados
+
+
+def limpiar(storage, limite, aplicar=True, tamano_lote=TAMANO_LOTE, al_encontrar=None):
+    """
+    Reconcilia referencias y elimina los archivos huérfanos modificados antes
+    de `limite`. Con aplicar=False no modifica nada y solo informa.
+    `al_encontrar(nombre, tamano)` se llama por cada huérfano (para el reporte).
+    Retorna un Counter con: revisados, huerfanos, bytes_huerfanos, eliminados,
+    errores, en_gracia, referencias_corregidas y blobs_sin_referencias.
+    """
+    resultado = Counter()
+    corregidas, sin_referencias, sin_registro = reconciliar_referencias(storage, limite, aplicar)
+    resultado['referencias_corregidas'] = corregidas
+    resultado['blobs_sin_referencias'] = len(sin_referencias)
+    protegidos = sin_registro | rendiciones_de_legado()
+
+    for carpeta in carpetas_revisadas():
+        for lote in _lotes(recorrer(storage, carpeta), tamano_lote):
+            resultado['revisados'] += len(lote)
+            for nombre in sorted(lote - _referenciados(lote, limite, sin_referencias, protegidos)):
+                if storage.get_modified_time(nombre) >= limite:
+                    resultado['en_gracia'] += 1
+                    continue
+                tamano = storage.size(nombre)
+                resultado['huerfanos'] += 1
+                resultado['bytes_huerfanos'] += tamano
+                if al_encontrar:
+                    al_encontrar(nombre, tamano)
+                if aplicar:
+                    if eliminar_archivo(storage, nombre):
+                        resultado['eliminados'] += 1
+                    else:
+                        resultado['errores'] += 1
+    return resultado
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from productos import movimientos
+
+
+class Command(BaseCommand):
+    help = (
+        'Guarda instantáneas del libro de movimientos de stock y registra una '
+        'conciliación cuando el libro no coincide con el stock de colores, variantes y productos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=movimientos.TAMANO_LOTE,
+            help=f'Filas bloqueadas y consolidadas por transacción (por defecto {movimientos.TAMANO_LOTE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        resultado = movimientos.consolidar(tamano_lote=options['lote'])
+        if resultado['conciliaciones']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {resultado['conciliaciones']} filas no coincidían con el libro; se registró su conciliación"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Filas revisadas: {resultado['filas']}, instantáneas guardadas: {resultado['instantaneas']}"
+        ))
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from productos import limpieza_media
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los archivos de media que ya no usa ningún producto, color, categoría '
+        'o usuario, y corrige las referencias del almacén de contenido'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa los archivos huérfanos, sin modificar nada')
+        parser.add_argument(
+            '--horas-gracia', type=int, default=24,
+            help='Conserva los archivos modificados en las últimas N horas (subidas en curso; por defecto 24)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=limpieza_media.TAMANO_LOTE,
+            help=f'Archivos cruzados con la base de datos por consulta (por defecto {limpieza_media.TAMANO_LOTE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['horas_gracia'] < 1:
+            raise CommandError('--horas-gracia debe ser al menos 1')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        simulacion = options['dry_run']
+        detallado = simulacion or options['verbosity'] > 1
+
+        def informar(nombre, tamano):
+            if detallado:
+                self.stdout.write(f'  {nombre} ({tamano} bytes)')
+
+        resultado = limpieza_media.limpiar(
+            default_storage,
+            limite=timezone.now() - timedelta(hours=options['horas_gracia']),
+            aplicar=not simulacion,
+            tamano_lote=options['lote'],
+            al_encontrar=informar,
+        )
+
+        megabytes = resultado['bytes_huerfanos'] / (1024 * 1024)
+        self.stdout.write(
+            f"Archivos revisados: {resultado['revisados']}, huérfanos: {resultado['huerfanos']} ({megabytes:.1f} MB), "
+            f"en período de gracia: {resultado['en_gracia']}"
+        )
+        self.stdout.write(
+            f"Referencias corregidas: {resultado['referencias_corregidas']}, "
+            f"blobs sin referencias: {resultado['blobs_sin_referencias']}"
+        )
+        if simulacion:
+            self.stdout.write(self.style.WARNING('Simulación: no se eliminó ni modificó nada'))
+            return
+        if resultado['errores']:
+            self.stdout.write(self.style.WARNING(f"⚠️ No se pudieron eliminar {resultado['errores']} archivos; se reintentarán en la próxima ejecución"))
+        self.stdout.write(self.style.SUCCESS(f"✅ Archivos eliminados: {resultado['eliminados']}"))
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from categorias.models import CategoriaProducto
+from productos.cola_imagenes import encolar_imagen_categoria, encolar_imagen_color, encolar_imagen_producto, procesar_trabajo
+from productos.models import ImagenProducto, Producto, TrabajoImagen
+
+
+class Command(BaseCommand):
+    help = (
+        'Procesa los trabajos de imágenes pendientes (p. ej. tras un reinicio del servidor) '
+        'y los que quedaron en proceso sin terminar'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutos', type=int, default=15,
+            help='Antigüedad mínima de un trabajo "procesando" para considerarlo interrumpido (por defecto 15)'
+        )
+        parser.add_argument('--reintentar-errores', action='store_true', help='Reintenta también los trabajos con error')
+        parser.add_argument(
+            '--regenerar', action='store_true',
+            help='Encola antes las imágenes existentes que aún no están en el almacén de contenido (rendiciones incluidas)'
+        )
+
+    def _encolar_sin_rendiciones(self):
+        """Crea trabajos para productos, imágenes de color y categorías fuera del almacén de contenido"""
+        encolados = 0
+        grupos = [
+            (Producto.objects.exclude(imagen_principal='').exclude(imagen_principal__isnull=True), 'imagen_rendiciones', encolar_imagen_producto),
+            (ImagenProducto.objects.exclude(imagen=''), 'rendiciones', encolar_imagen_color),
+            (CategoriaProducto.objects.exclude(imagen='').exclude(imagen__isnull=True), 'imagen_rendiciones', encolar_imagen_categoria),
+        ]
+        for queryset, campo_rendiciones, encolar in grupos:
+            for objeto in queryset.iterator():
+                if not (getattr(objeto, campo_rendiciones) or {}).get('original') and encolar(objeto, despachar_al_confirmar=False):
+                    encolados += 1
+        return encolados
+
+    def handle(self, *args, **options):
+        if options['regenerar']:
+            self.stdout.write(f'Imágenes encoladas para regenerar: {self._encolar_sin_rendiciones()}')
+
+        limite = timezone.now() - timedelta(minutes=options['minutos'])
+        condicion = Q(estado='pendiente') | Q(estado='procesando', fecha_actualizacion__lt=limite)
+        if options['reintentar_errores']:
+            condicion |= Q(estado='error')
+
+        procesados = errores = 0
+        for trabajo_id in TrabajoImagen.objects.filter(condicion).values_list('id', flat=True).iterator():
+            if procesar_trabajo(trabajo_id):
+                procesados += 1
+            else:
+                errores += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Imágenes procesadas: {procesados}, con error: {errores}'))
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:06
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    """Minúsculas y sin acentos: 'Canción Ñandú' -> 'cancion nandu'"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def texto_busqueda_producto(producto):
+    partes = [producto.sku, producto.nombre, producto.descripcion_corta, producto.descripcion_larga]
+    return ' '.join(_normalizar(parte) for parte in partes if parte)
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    """Calcula texto_busqueda de los productos existentes"""
+    Producto = apps.get_model('productos', 'Producto')
+    lote = []
+    for producto in Producto.objects.only('id', 'sku', 'nombre', 'descripcion_corta', 'descripcion_larga').iterator():
+        producto.texto_busqueda = texto_busqueda_producto(producto)
+        lote.append(producto)
+        if len(lote) >= 1000:
+            Producto.objects.bulk_update(lote, ['texto_busqueda'])
+            lote = []
+    Producto.objects.bulk_update(lote, ['texto_busqueda'])
+
+
+def _tabla_producto(apps, schema_editor):
+    return schema_editor.quote_name(apps.get_model('productos', 'Producto')._meta.db_table)
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    """
+    Solo PostgreSQL: columna generada vector_busqueda con índice GIN para la
+    búsqueda de texto completo e índices de trigramas para nombre y SKU.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+    tabla = _tabla_producto(apps, schema_editor)
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"ALTER TABLE {tabla} ADD COLUMN {qn('vector_busqueda')} tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce({qn('texto_busqueda')}, ''))) STORED"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {qn('productos_producto_vector_busqueda_gin')} ON {tabla} USING GIN ({qn('vector_busqueda')})"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {qn('productos_producto_nombre_trgm')} ON {tabla} USING GIN ({qn('nombre')} gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {qn('productos_producto_sku_trgm')} ON {tabla} USING GIN ({qn('sku')} gin_trgm_ops)"
+    )
+
+
+def eliminar_indices_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+    tabla = _tabla_producto(apps, schema_editor)
+    schema_editor.execute(f"DROP INDEX IF EXISTS {qn('productos_producto_sku_trgm')}")
+    schema_editor.execute(f"DROP INDEX IF EXISTS {qn('productos_producto_nombre_trgm')}")
+    schema_editor.execute(f"ALTER TABLE {tabla} DROP COLUMN IF EXISTS {qn('vector_busqueda')}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_colorproducto_stock_reservado_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, help_text='SKU, nombre y descripciones normalizados; se actualiza al guardar', verbose_name='Texto de búsqueda'),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_busqueda, eliminar_indices_busqueda),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+def marcar_imagenes_existentes(apps, schema_editor):
+    """Las imágenes subidas antes de la cola ya se procesaron en la petición"""
+    Producto = apps.get_model('productos', 'Producto')
+    Producto.objects.exclude(imagen_principal__isnull=True).exclude(imagen_principal='').update(imagen_estado='lista')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0004_texto_busqueda_producto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_estado',
+            field=models.CharField(choices=[('sin_imagen', 'Sin imagen'), ('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('lista', 'Lista'), ('error', 'Error')], default='sin_imagen', editable=False, max_length=10, verbose_name='Estado de la imagen'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_rendiciones',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Archivos generados a partir de la imagen principal (miniatura, mediana)', verbose_name='Rendiciones de la imagen'),
+        ),
+        migrations.CreateModel(
+            name='TrabajoImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('producto', 'Imagen principal de producto'), ('categoria', 'Imagen de categoría')], max_length=10, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveBigIntegerField(verbose_name='ID del objeto')),
+                ('archivo', models.CharField(help_text='Nombre en el storage de la imagen subida', max_length=255, verbose_name='Archivo de origen')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=10, verbose_name='Estado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Último error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de imagen',
+                'verbose_name_plural': 'Trabajos de imágenes',
+                'ordering': ['fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_actualizacion'], name='productos_t_estado_bbd652_idx'), models.Index(fields=['tipo', 'objeto_id'], name='productos_t_tipo_f4de5a_idx')],
+            },
+        ),
+        migrations.RunPython(marcar_imagenes_existentes, migrations.RunPython.noop),
+    ]
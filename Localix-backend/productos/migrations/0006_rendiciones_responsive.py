@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_trabajoimagen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagenproducto',
+            name='rendiciones',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Miniatura y anchos en AVIF/WebP/JPEG generados en segundo plano', verbose_name='Rendiciones'),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen_rendiciones',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Miniatura y anchos en AVIF/WebP/JPEG generados a partir de la imagen principal', verbose_name='Rendiciones de la imagen'),
+        ),
+        migrations.AlterField(
+            model_name='trabajoimagen',
+            name='tipo',
+            field=models.CharField(choices=[('producto', 'Imagen principal de producto'), ('color', 'Imagen de color'), ('categoria', 'Imagen de categoría')], max_length=10, verbose_name='Tipo'),
+        ),
+    ]
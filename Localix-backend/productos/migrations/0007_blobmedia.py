@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_rendiciones_responsive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.CharField(help_text='Nombre en el storage; no cambia mientras no cambie el contenido', max_length=255, unique=True, verbose_name='Archivo')),
+                ('resumen', models.CharField(max_length=64, verbose_name='SHA-256 del contenido')),
+                ('tamano', models.PositiveBigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('referencias', models.PositiveIntegerField(default=0, verbose_name='Referencias')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='blobs_media', to=settings.AUTH_USER_MODEL, verbose_name='Usuario propietario')),
+            ],
+            options={
+                'verbose_name': 'Archivo de medios',
+                'verbose_name_plural': 'Archivos de medios',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['usuario', 'resumen'], name='productos_b_usuario_20bd3f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0007_blobmedia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(default=0, verbose_name='Stock')),
+                ('reservado', models.IntegerField(default=0, verbose_name='Stock reservado')),
+                ('hasta_movimiento', models.PositiveBigIntegerField(default=0, help_text='ID del último movimiento incluido', verbose_name='Hasta el movimiento')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('color', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='instantaneas_stock', to='productos.colorproducto', verbose_name='Color')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instantaneas_stock', to='productos.producto', verbose_name='Producto')),
+                ('variante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='instantaneas_stock', to='productos.varianteproducto', verbose_name='Variante')),
+            ],
+            options={
+                'verbose_name': 'Instantánea de stock',
+                'verbose_name_plural': 'Instantáneas de stock',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['color', 'hasta_movimiento'], name='productos_i_color_i_edda9b_idx'), models.Index(fields=['variante', 'hasta_movimiento'], name='productos_i_variant_047e6e_idx'), models.Index(fields=['producto', 'hasta_movimiento'], name='productos_i_product_a1bc0a_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('venta', 'Venta'), ('reserva', 'Reserva'), ('liberacion', 'Liberación de reserva'), ('ajuste', 'Ajuste'), ('conciliacion', 'Conciliación')], max_length=12, verbose_name='Tipo')),
+                ('stock', models.IntegerField(default=0, verbose_name='Variación del stock')),
+                ('reservado', models.IntegerField(default=0, verbose_name='Variación del stock reservado')),
+                ('referencia', models.CharField(blank=True, default='', help_text='Origen del movimiento, p. ej. venta:15 o reserva:3', max_length=50, verbose_name='Referencia')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('color', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='productos.colorproducto', verbose_name='Color')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='productos.producto', verbose_name='Producto')),
+                ('variante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='productos.varianteproducto', verbose_name='Variante')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='productos_m_product_21750f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat, Left
+
+
+def _de_la_fila(queryset, campo, **valores):
+    """Subconsultas que leen `valores` de la fila referenciada por `campo`"""
+    return {
+        nombre: Subquery(
+            queryset.filter(pk=OuterRef(campo)).annotate(dato_fila=Left(expresion, 255)).values('dato_fila')[:1],
+            output_field=CharField()
+        )
+        for nombre, expresion in valores.items()
+    }
+
+
+def poblar_filas(apps, schema_editor):
+    """Tipo de fila, SKU y descripción de los movimientos e instantáneas existentes"""
+    MovimientoStock = apps.get_model('productos', 'MovimientoStock')
+    InstantaneaStock = apps.get_model('productos', 'InstantaneaStock')
+    ColorProducto = apps.get_model('productos', 'ColorProducto')
+    VarianteProducto = apps.get_model('productos', 'VarianteProducto')
+    Producto = apps.get_model('productos', 'Producto')
+
+    for modelo in (MovimientoStock, InstantaneaStock):
+        modelo.objects.filter(color__isnull=False).update(fila='color')
+        modelo.objects.filter(color__isnull=True, variante__isnull=False).update(fila='variante')
+
+    MovimientoStock.objects.filter(fila='color').update(**_de_la_fila(
+        ColorProducto.objects.all(), 'color_id',
+        sku=F('producto__sku'),
+        descripcion=Concat('producto__nombre', Value(' / '), 'nombre', output_field=CharField()),
+    ))
+    MovimientoStock.objects.filter(fila='variante').update(**_de_la_fila(
+        VarianteProducto.objects.all(), 'variante_id',
+        sku=F('sku'),
+        descripcion=Concat('producto__nombre', Value(' / '), 'nombre', Value(': '), 'valor', output_field=CharField()),
+    ))
+    MovimientoStock.objects.filter(fila='producto').update(**_de_la_fila(
+        Producto.objects.all(), 'producto_id', sku=F('sku'), descripcion=F('nombre'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_movimientos_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instantaneastock',
+            name='fila',
+            field=models.CharField(choices=[('color', 'Color'), ('variante', 'Variante'), ('producto', 'Producto')], default='producto', max_length=8, verbose_name='Fila'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='descripcion',
+            field=models.CharField(blank=True, default='', help_text='Producto y color o variante al registrar el movimiento', max_length=255, verbose_name='Descripción'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='fila',
+            field=models.CharField(choices=[('color', 'Color'), ('variante', 'Variante'), ('producto', 'Producto')], default='producto', max_length=8, verbose_name='Fila'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='sku',
+            field=models.CharField(blank=True, default='', help_text='SKU de la variante o del producto al registrar el movimiento', max_length=50, verbose_name='SKU'),
+        ),
+        migrations.AlterField(
+            model_name='instantaneastock',
+            name='color',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='instantaneas_stock', to='productos.colorproducto', verbose_name='Color'),
+        ),
+        migrations.AlterField(
+            model_name='instantaneastock',
+            name='producto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='instantaneas_stock', to='productos.producto', verbose_name='Producto'),
+        ),
+        migrations.AlterField(
+            model_name='instantaneastock',
+            name='variante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='instantaneas_stock', to='productos.varianteproducto', verbose_name='Variante'),
+        ),
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='color',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='productos.colorproducto', verbose_name='Color'),
+        ),
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='producto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='productos.producto', verbose_name='Producto'),
+        ),
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='variante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='productos.varianteproducto', verbose_name='Variante'),
+        ),
+        migrations.RunPython(poblar_filas, migrations.RunPython.noop),
+    ]
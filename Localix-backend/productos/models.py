@@ -1,10 +1,65 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 from django.core.validators import MinValueValidator
 from colorfield.fields import ColorField
 from categorias.models import CategoriaProducto  # Importamos desde la nueva app
+from productos.inventario import descontar_stock, reponer_stock
+from productos.movimientos import movimiento, registrar
+from productos.busqueda import texto_busqueda_producto
+from productos.cola_imagenes import encolar_imagen_color, liberar_imagen
+from productos.catalogo import invalidar_catalogo, invalidar_catalogo_de_productos
+
+def _suma_stock_subquery(model, **filtros):
+    """Subconsulta correlacionada con la suma de stock de un modelo hijo por producto"""
+    suma = model.objects.filter(
+        producto=OuterRef('pk'), **filtros
+    ).order_by().values('producto').annotate(total=Sum('stock')).values('total')
+    return Coalesce(Subquery(suma, output_field=models.IntegerField()), Value(0))
+
+
+class ProductoQuerySet(models.QuerySet):
+    def con_stock_calculado(self):
+        """
+        Anota la suma de stock de variantes y de colores activos de cada producto
+        (stock_variantes_total, stock_colores_total) con subconsultas, sin
+        multiplicar filas y sin consultas adicionales por producto.
+        """
+        return self.annotate(
+            stock_variantes_total=_suma_stock_subquery(VarianteProducto),
+            stock_colores_total=_suma_stock_subquery(ColorProducto, activo=True)
+        )
+
+    def para_listado(self):
+        """Queryset del listado de productos con costo de consultas constante"""
+        return self.con_stock_calculado().select_related('categoria').prefetch_related(
+            'variantes',
+            models.Prefetch('colores', queryset=ColorProducto.objects.prefetch_related('imagenes')),
+        )
+
+    def actualizar_stock_total(self):
+        """
+        ✅ Recalcula en la base de datos el stock total (variantes + colores activos)
+        de todos los productos del queryset con un único UPDATE.
+        Solo se modifican los productos que tienen colores o variantes y cuyo
+        stock almacenado difiere del calculado. Retorna la cantidad de filas actualizadas.
+        """
+        stock_calculado = (
+            _suma_stock_subquery(VarianteProducto) +
+            _suma_stock_subquery(ColorProducto, activo=True)
+        )
+        tiene_desglose = (
+            Exists(VarianteProducto.objects.filter(producto=OuterRef('pk'))) |
+            Exists(ColorProducto.objects.filter(producto=OuterRef('pk'), activo=True))
+        )
+        return self.filter(tiene_desglose).exclude(
+            stock=stock_calculado
+        ).update(stock=stock_calculado)
+
 
 class Producto(models.Model):
     """
@@ -57,6 +112,31 @@ class Producto(models.Model):
         verbose_name=_("Imagen principal"),
         help_text=_("Imagen destacada del producto")
     )
+    
+    # Procesamiento en segundo plano de la imagen principal (ver productos/cola_imagenes.py)
+    IMAGEN_ESTADO_CHOICES = [
+        ('sin_imagen', _('Sin imagen')),
+        ('pendiente', _('Pendiente')),
+        ('procesando', _('Procesando')),
+        ('lista', _('Lista')),
+        ('error', _('Error')),
+    ]
+    
+    imagen_estado = models.CharField(
+        max_length=10,
+        choices=IMAGEN_ESTADO_CHOICES,
+        default='sin_imagen',
+        editable=False,
+        verbose_name=_("Estado de la imagen")
+    )
+    
+    imagen_rendiciones = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Rendiciones de la imagen"),
+        help_text=_("Miniatura y anchos en AVIF/WebP/JPEG generados a partir de la imagen principal")
+    )
 
     
     
@@ -72,6 +152,15 @@ class Producto(models.Model):
         help_text=_("Descripción completa con características")
     )
     
+    # Índice de búsqueda (ver productos/busqueda.py)
+    texto_busqueda = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_("Texto de búsqueda"),
+        help_text=_("SKU, nombre y descripciones normalizados; se actualiza al guardar")
+    )
+    
     # Clasificación
     tipo = models.CharField(
         max_length=10,
@@ -195,6 +284,8 @@ class Producto(models.Model):
         verbose_name=_("Última actualización")
     )
 
+    objects = ProductoQuerySet.as_manager()
+
     @property
     def margen_ganancia(self):
         """Calcula el porcentaje de ganancia de forma segura"""
@@ -211,42 +302,24 @@ class Producto(models.Model):
 
     def actualizar_stock_total(self):
         """✅ Actualiza el stock total sumando todas las variantes y colores"""
-        try:
-            # Verificar si el producto tiene colores configurados
-            colores_activos = self.colores.filter(activo=True)
-            variantes = self.variantes.all()
-            
-            if colores_activos.exists() or variantes.exists():
-                # Si tiene colores o variantes, calcular stock total sumando
-                stock_variantes = sum(variante.stock for variante in variantes)
-                stock_colores = sum(color.stock for color in colores_activos)
-                nuevo_stock = stock_variantes + stock_colores
-                
-                # Solo actualizar si el stock cambió
-                if self.stock != nuevo_stock:
-                    self.stock = nuevo_stock
-                    self.save(update_fields=['stock'])
-                    print(f"🔄 Stock actualizado para {self.nombre}:")
-                    print(f"   - Stock variantes: {stock_variantes}")
-                    print(f"   - Stock colores: {stock_colores}")
-                    print(f"   - Stock total: {self.stock}")
-                else:
-                    print(f"ℹ️ Stock de {self.nombre} ya está actualizado: {self.stock}")
-            else:
-                # Si no tiene colores ni variantes, mantener el stock actual del producto
-                print(f"ℹ️ Producto {self.nombre} no tiene colores ni variantes configurados, manteniendo stock actual: {self.stock}")
-                
-        except Exception as e:
-            print(f"❌ Error actualizando stock para {self.nombre}: {str(e)}")
-            # En caso de error, intentar una actualización básica
-            try:
-                stock_total = sum(color.stock for color in self.colores.filter(activo=True))
-                stock_total += sum(variante.stock for variante in self.variantes.all())
-                self.stock = stock_total
-                self.save(update_fields=['stock'])
-                print(f"✅ Stock actualizado con método de respaldo: {self.stock}")
-            except Exception as e2:
-                print(f"❌ Error crítico actualizando stock: {str(e2)}")
+        actualizados = Producto.objects.filter(pk=self.pk).actualizar_stock_total()
+        if actualizados:
+            self.refresh_from_db(fields=['stock'])
+            invalidar_catalogo(self.usuario_id)
+        return actualizados
+
+    def save(self, *args, **kwargs):
+        self.texto_busqueda = texto_busqueda_producto(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'sku', 'nombre', 'descripcion_corta', 'descripcion_larga'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'texto_busqueda'}
+        super().save(*args, **kwargs)
+        invalidar_catalogo(self.usuario_id)
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        invalidar_catalogo(self.usuario_id)
+        return resultado
 
     class Meta:
         verbose_name = _("Producto")
@@ -419,28 +492,31 @@ class ColorProducto(models.Model):
 
     def save(self, *args, **kwargs):
         """✅ Sobrescribir save para actualizar stock total del producto"""
-        print(f"🔄 Guardando color: {self.nombre} (stock: {self.stock})")
-        
         # Guardar el color
         super().save(*args, **kwargs)
         
         # Actualizar el stock total del producto
-        print(f"🔄 Llamando actualizar_stock_total para producto: {self.producto.nombre}")
-        self.producto.actualizar_stock_total()
+        self._actualizar_stock_producto()
 
     def delete(self, *args, **kwargs):
         """✅ Sobrescribir delete para actualizar stock total del producto"""
-        print(f"🗑️ Eliminando color: {self.nombre}")
-        
-        # Obtener referencia al producto antes de eliminar
-        producto = self.producto
-        
-        # Eliminar el color
-        super().delete(*args, **kwargs)
+        result = super().delete(*args, **kwargs)
         
         # Actualizar el stock total del producto
-        print(f"🔄 Llamando actualizar_stock_total para producto: {producto.nombre}")
-        producto.actualizar_stock_total()
+        self._actualizar_stock_producto()
+        return result
+
+    def _actualizar_stock_producto(self):
+        """
+        Recalcula el stock del producto sin cargarlo si no está ya en memoria
+        e invalida el catálogo cacheado (el color y su stock forman parte de él)
+        """
+        if ColorProducto.producto.is_cached(self):
+            self.producto.actualizar_stock_total()
+            invalidar_catalogo(self.producto.usuario_id)
+        else:
+            Producto.objects.filter(pk=self.producto_id).actualizar_stock_total()
+            invalidar_catalogo_de_productos([self.producto_id])
 
     @property
     def cantidad_imagenes(self):
@@ -461,17 +537,21 @@ class ColorProducto(models.Model):
         return self.activo and self.stock > 0
 
     def reducir_stock(self, cantidad=1):
-        """✅ Reduce el stock del color y actualiza el producto"""
-        if self.stock >= cantidad:
-            self.stock -= cantidad
-            self.save()
-            return True
-        return False
+        """✅ Reduce el stock del color de forma atómica y actualiza el producto"""
+        if not descontar_stock(ColorProducto, self.pk, cantidad):
+            return False
+        registrar([movimiento('ajuste', self.producto_id, self.pk, stock=-cantidad)])
+        self.stock -= cantidad
+        self._actualizar_stock_producto()
+        return True
 
     def aumentar_stock(self, cantidad=1):
-        """✅ Aumenta el stock del color y actualiza el producto"""
+        """✅ Aumenta el stock del color de forma atómica y actualiza el producto"""
+        if not reponer_stock(ColorProducto, self.pk, cantidad):
+            return False
+        registrar([movimiento('ajuste', self.producto_id, self.pk, stock=cantidad)])
         self.stock += cantidad
-        self.save()
+        self._actualizar_stock_producto()
         return True
 
 
@@ -503,6 +583,14 @@ class ImagenProducto(models.Model):
         help_text=_("Indica si es la imagen principal del color")
     )
     
+    rendiciones = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Rendiciones"),
+        help_text=_("Miniatura y anchos en AVIF/WebP/JPEG generados en segundo plano")
+    )
+    
     fecha_creacion = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_("Fecha de creación")
@@ -527,6 +615,17 @@ class ImagenProducto(models.Model):
     def __str__(self):
         return f"{self.color.producto.nombre} - {self.color.nombre} - Imagen {self.orden}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Archivo guardado, para encolar el procesamiento solo si cambia
+        instancia._imagen_original = instancia.__dict__.get('imagen')
+        return instancia
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._imagen_original = self.imagen.name if self.imagen else None
+
     def save(self, *args, **kwargs):
         # Si esta imagen se marca como principal, desmarcar las demás
         if self.es_principal:
@@ -534,11 +633,255 @@ class ImagenProducto(models.Model):
                 color=self.color,
                 es_principal=True
             ).exclude(id=self.id).update(es_principal=False)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.imagen and self.imagen.name != getattr(self, '_imagen_original', None):
+                encolar_imagen_color(self)
+                self._imagen_original = self.imagen.name
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # La imagen puede estar compartida con otros colores: solo se libera su referencia
+            liberar_imagen('color', self.imagen.name, self.rendiciones)
+        return resultado
 
     @property
     def url_imagen(self):
         """Retorna la URL de la imagen"""
         if self.imagen:
             return self.imagen.url
-        return None
\ No newline at end of file
+        return None
+
+
+class TrabajoImagen(models.Model):
+    """
+    Trabajo de procesamiento de una imagen subida (redimensión y rendiciones).
+    La subida responde de inmediato y el pool de procesos lo resuelve después;
+    los trabajos pendientes sobreviven a un reinicio y se pueden reprocesar con
+    el comando procesar_imagenes.
+    """
+    TIPO_CHOICES = [
+        ('producto', _('Imagen principal de producto')),
+        ('color', _('Imagen de color')),
+        ('categoria', _('Imagen de categoría')),
+    ]
+
+    ESTADO_CHOICES = [
+        ('pendiente', _('Pendiente')),
+        ('procesando', _('Procesando')),
+        ('completado', _('Completado')),
+        ('error', _('Error')),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, verbose_name=_("Tipo"))
+    objeto_id = models.PositiveBigIntegerField(verbose_name=_("ID del objeto"))
+    archivo = models.CharField(
+        max_length=255,
+        verbose_name=_("Archivo de origen"),
+        help_text=_("Nombre en el storage de la imagen subida")
+    )
+    estado = models.CharField(
+        max_length=10,
+        choices=ESTADO_CHOICES,
+        default='pendiente',
+        verbose_name=_("Estado")
+    )
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name=_("Intentos"))
+    error = models.TextField(blank=True, default='', verbose_name=_("Último error"))
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de creación"))
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name=_("Última actualización"))
+
+    class Meta:
+        verbose_name = _("Trabajo de imagen")
+        verbose_name_plural = _("Trabajos de imágenes")
+        ordering = ['fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_actualizacion']),
+            models.Index(fields=['tipo', 'objeto_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.objeto_id} ({self.estado})"
+
+
+class BlobMedia(models.Model):
+    """
+    Archivo de medios direccionado por contenido (ver productos/almacen.py).
+    El nombre deriva del hash SHA-256 del contenido y del usuario, así un mismo
+    archivo se guarda una sola vez por tienda aunque lo usen varios objetos.
+    `referencias` cuenta los objetos que lo usan; al llegar a cero se elimina.
+    """
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='blobs_media',
+        verbose_name=_("Usuario propietario")
+    )
+    archivo = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name=_("Archivo"),
+        help_text=_("Nombre en el storage; no cambia mientras no cambie el contenido")
+    )
+    resumen = models.CharField(max_length=64, verbose_name=_("SHA-256 del contenido"))
+    tamano = models.PositiveBigIntegerField(default=0, verbose_name=_("Tamaño (bytes)"))
+    referencias = models.PositiveIntegerField(default=0, verbose_name=_("Referencias"))
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de creación"))
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name=_("Última actualización"))
+
+    class Meta:
+        verbose_name = _("Archivo de medios")
+        verbose_name_plural = _("Archivos de medios")
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['usuario', 'resumen']),
+        ]
+
+    def __str__(self):
+        return f"{self.archivo} ({self.referencias} ref.)"
+
+
+class MovimientoStock(models.Model):
+    """
+    Movimiento del libro de stock (ver productos/movimientos.py).
+    Registra la variación del stock y del stock reservado de una fila: un
+    color, una variante o un producto sin desglose. Solo se insertan, nunca
+    se modifican ni eliminan: al eliminar el producto, el color o la variante
+    el movimiento se conserva con la referencia en NULL, y `fila`, `sku` y
+    `descripcion` siguen identificando de qué fila era.
+    """
+    TIPO_CHOICES = [
+        ('venta', _('Venta')),
+        ('reserva', _('Reserva')),
+        ('liberacion', _('Liberación de reserva')),
+        ('ajuste', _('Ajuste')),
+        ('conciliacion', _('Conciliación')),
+    ]
+    FILA_CHOICES = [
+        ('color', _('Color')),
+        ('variante', _('Variante')),
+        ('producto', _('Producto')),
+    ]
+
+    fila = models.CharField(max_length=8, choices=FILA_CHOICES, default='producto', verbose_name=_("Fila"))
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name=_("Producto")
+    )
+    color = models.ForeignKey(
+        ColorProducto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name=_("Color")
+    )
+    variante = models.ForeignKey(
+        VarianteProducto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name=_("Variante")
+    )
+    sku = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name=_("SKU"),
+        help_text=_("SKU de la variante o del producto al registrar el movimiento")
+    )
+    descripcion = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name=_("Descripción"),
+        help_text=_("Producto y color o variante al registrar el movimiento")
+    )
+    tipo = models.CharField(max_length=12, choices=TIPO_CHOICES, verbose_name=_("Tipo"))
+    stock = models.IntegerField(default=0, verbose_name=_("Variación del stock"))
+    reservado = models.IntegerField(default=0, verbose_name=_("Variación del stock reservado"))
+    referencia = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name=_("Referencia"),
+        help_text=_("Origen del movimiento, p. ej. venta:15 o reserva:3")
+    )
+    fecha = models.DateTimeField(default=timezone.now, verbose_name=_("Fecha"))
+
+    class Meta:
+        verbose_name = _("Movimiento de stock")
+        verbose_name_plural = _("Movimientos de stock")
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.stock:+d}/{self.reservado:+d} ({self.referencia or self.sku})"
+
+
+class InstantaneaStock(models.Model):
+    """
+    Stock y stock reservado de una fila según el libro de movimientos, hasta
+    el movimiento `hasta_movimiento` inclusive. El comando consolidar_stock
+    las crea periódicamente; el stock en una fecha se lee de la última
+    instantánea más los movimientos posteriores. Como los movimientos, se
+    conservan al eliminar la fila.
+    """
+    fila = models.CharField(
+        max_length=8, choices=MovimientoStock.FILA_CHOICES, default='producto', verbose_name=_("Fila")
+    )
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='instantaneas_stock',
+        verbose_name=_("Producto")
+    )
+    color = models.ForeignKey(
+        ColorProducto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='instantaneas_stock',
+        verbose_name=_("Color")
+    )
+    variante = models.ForeignKey(
+        VarianteProducto,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='instantaneas_stock',
+        verbose_name=_("Variante")
+    )
+    stock = models.IntegerField(default=0, verbose_name=_("Stock"))
+    reservado = models.IntegerField(default=0, verbose_name=_("Stock reservado"))
+    hasta_movimiento = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_("Hasta el movimiento"),
+        help_text=_("ID del último movimiento incluido")
+    )
+    fecha = models.DateTimeField(default=timezone.now, verbose_name=_("Fecha"))
+
+    class Meta:
+        verbose_name = _("Instantánea de stock")
+        verbose_name_plural = _("Instantáneas de stock")
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['color', 'hasta_movimiento']),
+            models.Index(fields=['variante', 'hasta_movimiento']),
+            models.Index(fields=['producto', 'hasta_movimiento']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.stock} ({self.fecha:%Y-%m-%d %H:%M})"
@@ -0,0 +1,251 @@
+"""
+Libro de movimientos de stock
+
+Cada cambio del stock o del stock reservado de una fila (un color, una
+variante o un producto sin desglose) queda registrado como un MovimientoStock
+con su variación: venta, reserva, liberación o ajuste. El libro solo crece.
+Cada operación inserta todos sus movimientos con un único bulk_create, dentro
+de su transacción y después del UPDATE de las filas, es decir, con las filas
+ya bloqueadas.
+
+Eliminar un producto, un color o una variante no borra sus movimientos ni sus
+instantáneas: la referencia queda en NULL y el tipo de fila, el SKU y la
+descripción guardados en el movimiento siguen identificándolo.
+
+El comando consolidar_stock guarda periódicamente una InstantaneaStock por
+fila: la instantánea anterior más los movimientos siguientes. Si esa suma no
+coincide con las columnas de stock (stock inicial, ediciones desde el admin o
+los formularios) antes registra un movimiento de conciliación por la
+diferencia. El stock en una fecha se lee de la última instantánea anterior
+más los pocos movimientos que la siguen, sin recorrer las ventas.
+"""
+
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import BigIntegerField, Exists, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# tipo de fila -> modelo (los productos no tienen stock reservado propio)
+FILAS = {
+    'color': 'productos.ColorProducto',
+    'variante': 'productos.VarianteProducto',
+    'producto': 'productos.Producto',
+}
+
+TAMANO_LOTE = 500
+
+
+def movimiento(tipo, producto_id, color_id=None, variante_id=None, stock=0, reservado=0, referencia=''):
+    """
+    Movimiento sin guardar. La fila es el color si lo hay, si no la variante
+    y si no el producto (igual que al descontar stock en una venta).
+    """
+    from .models import MovimientoStock
+
+    variante_id = None if color_id else variante_id
+    return MovimientoStock(
+        tipo=tipo, fila=_tipo_de_fila(color_id, variante_id), producto_id=producto_id,
+        color_id=color_id, variante_id=variante_id,
+        stock=stock, reservado=reservado, referencia=referencia
+    )
+
+
+def _tipo_de_fila(color_id, variante_id):
+    if color_id:
+        return 'color'
+    return 'variante' if variante_id else 'producto'
+
+
+def _identificar(movimientos):
+    """
+    Completa el SKU y la descripción de los movimientos con una consulta por
+    tipo de fila presente (una sola en una venta sin variantes).
+    """
+    from .models import ColorProducto, Producto, VarianteProducto
+
+    por_fila = {}
+    for m in movimientos:
+        por_fila.setdefault(m.fila, set()).add(getattr(m, f'{m.fila}_id'))
+    datos = {}
+    if 'color' in por_fila:
+        for pk, nombre, sku, producto in ColorProducto.objects.filter(pk__in=por_fila['color']).values_list(
+            'pk', 'nombre', 'producto__sku', 'producto__nombre'
+        ):
+            datos['color', pk] = (sku, f'{producto} / {nombre}')
+    if 'variante' in por_fila:
+        for pk, nombre, valor, sku, producto in VarianteProducto.objects.filter(pk__in=por_fila['variante']).values_list(
+            'pk', 'nombre', 'valor', 'sku', 'producto__nombre'
+        ):
+            datos['variante', pk] = (sku, f'{producto} / {nombre}: {valor}')
+    if 'producto' in por_fila:
+        for pk, sku, nombre in Producto.objects.filter(pk__in=por_fila['producto']).values_list('pk', 'sku', 'nombre'):
+            datos['producto', pk] = (sku, nombre)
+    for m in movimientos:
+        sku, descripcion = datos.get((m.fila, getattr(m, f'{m.fila}_id')), ('', ''))
+        m.sku, m.descripcion = sku, descripcion[:255]
+
+
+def registrar(movimientos):
+    """Inserta con un único INSERT los movimientos que tienen alguna variación"""
+    from .models import MovimientoStock
+
+    movimientos = [m for m in movimientos if m is not None and (m.stock or m.reservado)]
+    if movimientos:
+        _identificar(movimientos)
+        MovimientoStock.objects.bulk_create(movimientos)
+    return movimientos
+
+
+def _filtro(fila, pks):
+    """Movimientos o instantáneas de las filas `pks` de un tipo"""
+    return Q(fila=fila, **{f'{fila}_id__in': pks})
+
+
+def _ultimas_instantaneas(fila, fecha):
+    """Instantáneas de la misma fila que la consulta externa, de la más nueva a la más vieja"""
+    from .models import InstantaneaStock
+
+    instantaneas = InstantaneaStock.objects.filter(fila=fila, **{f'{fila}_id': OuterRef(f'{fila}_id')})
+    if fecha is not None:
+        instantaneas = instantaneas.filter(fecha__lte=fecha)
+    return instantaneas.order_by('-hasta_movimiento')
+
+
+def stock_en(fila, pks, fecha=None):
+    """
+    Stock según el libro de las filas `pks` de un tipo ('color', 'variante' o
+    'producto') en `fecha` (por defecto, ahora). Usa la última instantánea
+    anterior a la fecha y suma en la base de datos los movimientos que la
+    siguen: dos consultas sin importar la cantidad de filas. Retorna
+    {pk: {'stock', 'reservado', 'hasta', 'instantanea'}}, donde `hasta` es el
+    último movimiento incluido e `instantanea` el de la instantánea usada
+    (None si la fila no tiene).
+    """
+    from .models import InstantaneaStock, MovimientoStock
+
+    pks = set(pks)
+    clave = f'{fila}_id'
+    ultimas = _ultimas_instantaneas(fila, fecha)
+    resultado = {pk: {'stock': 0, 'reservado': 0, 'hasta': 0, 'instantanea': None} for pk in pks}
+
+    instantaneas = InstantaneaStock.objects.filter(
+        _filtro(fila, pks), pk=Subquery(ultimas.values('pk')[:1])
+    ).values(clave, 'stock', 'reservado', 'hasta_movimiento')
+    for instantanea in instantaneas:
+        resultado[instantanea[clave]].update(
+            stock=instantanea['stock'], reservado=instantanea['reservado'],
+            hasta=instantanea['hasta_movimiento'], instantanea=instantanea['hasta_movimiento']
+        )
+
+    movimientos = MovimientoStock.objects.filter(
+        _filtro(fila, pks),
+        id__gt=Coalesce(Subquery(ultimas.values('hasta_movimiento')[:1]), Value(0), output_field=BigIntegerField())
+    )
+    if fecha is not None:
+        movimientos = movimientos.filter(fecha__lte=fecha)
+    sumas = movimientos.order_by().values(clave).annotate(
+        variacion_stock=Sum('stock'), variacion_reservado=Sum('reservado'), ultimo=Max('id')
+    )
+    for suma in sumas:
+        actual = resultado[suma[clave]]
+        actual['stock'] += suma['variacion_stock']
+        actual['reservado'] += suma['variacion_reservado']
+        actual['hasta'] = suma['ultimo']
+    return resultado
+
+
+def filas_a_consolidar(fila):
+    """Queryset de las filas con stock propio de un tipo"""
+    from .models import ColorProducto, VarianteProducto
+
+    modelo = apps.get_model(FILAS[fila])
+    if fila != 'producto':
+        return modelo.objects.all()
+    # El stock de un producto con colores activos o variantes es la suma de ellos
+    return modelo.objects.filter(gestion_stock=True).exclude(
+        Exists(VarianteProducto.objects.filter(producto=OuterRef('pk'))) |
+        Exists(ColorProducto.objects.filter(producto=OuterRef('pk'), activo=True))
+    )
+
+
+def _consolidar_lote(fila, pks):
+    """Concilia y guarda las instantáneas de un lote de filas, bloqueadas mientras tanto"""
+    from .models import InstantaneaStock, MovimientoStock
+
+    resultado = Counter()
+    with transaction.atomic():
+        # Los movimientos se escriben con la fila bloqueada: mientras dure el
+        # bloqueo el libro y las columnas no cambian
+        bloqueadas = (
+            apps.get_model(FILAS[fila]).objects.select_for_update(of=('self',))
+            .filter(pk__in=pks).order_by('pk')
+        )
+        if fila == 'producto':
+            filas = [(pk, stock, 0, pk) for pk, stock in bloqueadas.values_list('pk', 'stock')]
+        else:
+            filas = list(bloqueadas.values_list('pk', 'stock', 'stock_reservado', 'producto_id'))
+        libro = stock_en(fila, pks)
+        conciliaciones = []
+        nuevas = []
+        for pk, stock, reservado, producto_id in filas:
+            actual = libro[pk]
+            conciliacion = movimiento(
+                'conciliacion', producto_id, stock=stock - actual['stock'],
+                reservado=reservado - actual['reservado'], referencia='consolidar_stock',
+                **({f'{fila}_id': pk} if fila != 'producto' else {})
+            )
+            if conciliacion.stock or conciliacion.reservado:
+                conciliaciones.append(conciliacion)
+            elif actual['instantanea'] is not None and actual['hasta'] == actual['instantanea']:
+                # Sin movimientos desde la última instantánea
+                continue
+            nuevas.append(InstantaneaStock(
+                fila=fila, producto_id=producto_id, stock=stock, reservado=reservado,
+                **({f'{fila}_id': pk} if fila != 'producto' else {})
+            ))
+        registrar(conciliaciones)
+        # Los movimientos futuros de estas filas tendrán un id mayor: se crean tras liberar el bloqueo
+        hasta = MovimientoStock.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        for instantanea in nuevas:
+            instantanea.hasta_movimiento = hasta
+        InstantaneaStock.objects.bulk_create(nuevas)
+    resultado['filas'] += len(filas)
+    resultado['conciliaciones'] += len(conciliaciones)
+    resultado['instantaneas'] += len(nuevas)
+    return resultado
+
+
+def consolidar(tamano_lote=TAMANO_LOTE):
+    """
+    Guarda instantáneas de todas las filas con movimientos desde la última,
+    conciliando antes las diferencias con las columnas de stock. Procesa por
+    lotes para no bloquear muchas filas a la vez. Retorna un Counter con:
+    filas, conciliaciones e instantaneas.
+    """
+    resultado = Counter()
+    for fila in FILAS:
+        pks = list(filas_a_consolidar(fila).order_by('pk').values_list('pk', flat=True))
+        for inicio in range(0, len(pks), tamano_lote):
+            resultado += _consolidar_lote(fila, pks[inicio:inicio + tamano_lote])
+    return resultado
+
+
+def stock_de_producto(producto, fecha=None):
+    """
+    Stock según el libro de cada color y variante de un producto (o del
+    producto mismo si no tiene desglose) en `fecha`.
+    """
+    filas = [('color', pk, nombre) for pk, nombre in producto.colores.values_list('pk', 'nombre')]
+    filas += [('variante', pk, f'{nombre}: {valor}') for pk, nombre, valor in producto.variantes.values_list('pk', 'nombre', 'valor')]
+    if not filas:
+        filas = [('producto', producto.pk, producto.nombre)]
+    libro = {
+        tipo: stock_en(tipo, [pk for t, pk, _ in filas if t == tipo], fecha)
+        for tipo in {t for t, _, _ in filas}
+    }
+    return [
+        {'tipo': tipo, 'id': pk, 'nombre': nombre, 'stock': libro[tipo][pk]['stock'], 'reservado': libro[tipo][pk]['reservado']}
+        for tipo, pk, nombre in filas
+    ]
@@ -0,0 +1,198 @@
+"""
+Procesamiento de imágenes (solo Pillow, sin Django)
+
+Este módulo se ejecuta dentro de los procesos del pool de imágenes, por eso
+no importa Django: recibe una ruta (o bytes) y retorna los archivos generados.
+"""
+
+import hashlib
+import math
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Lado más largo de la imagen original guardada
+TAMANO_MAXIMO = 2000
+
+# Máximo de píxeles (ancho x alto) que se acepta decodificar; 50 MP cubre cámaras de teléfono
+MAX_PIXELES = 50_000_000
+
+# Miniatura cuadrada para listados y el panel de administración
+MINIATURA = (300, 300)
+
+# Escalera de anchos y formatos de las rendiciones (se sobreescriben desde settings)
+ANCHOS = (320, 640, 960, 1280)
+FORMATOS = ('avif', 'webp', 'jpeg')
+
+FONDO = (255, 255, 255)
+
+_SIN_REDUCE = ('P', '1', 'I;16')
+
+# formato -> (nombre en Pillow, tipo MIME, extensión, opciones de guardado)
+_CODIFICADORES = {
+    'avif': ('AVIF', 'image/avif', '.avif', {'quality': 60, 'speed': 8}),
+    'webp': ('WEBP', 'image/webp', '.webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImagenDemasiadoGrande(ValueError):
+    """La imagen declara más píxeles de los permitidos (se detecta antes de decodificarla)"""
+
+
+def formatos_soportados(formatos=FORMATOS):
+    """Formatos pedidos que esta instalación de Pillow puede codificar (AVIF es opcional)"""
+    Image.init()
+    return [f for f in formatos if f in _CODIFICADORES and _CODIFICADORES[f][0] in Image.SAVE]
+
+
+def resumen_contenido(datos):
+    """SHA-256 del contenido, base de los nombres de archivo inmutables"""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _a_rgb(img):
+    """Aplana transparencias sobre fondo blanco para guardar en JPEG"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, FONDO)
+        fondo.paste(img, mask=img.split()[-1])
+        return fondo
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _codificar(img, formato):
+    """Codifica la imagen conservando PNG/WEBP; el resto se guarda como JPEG"""
+    salida = BytesIO()
+    if formato == 'PNG':
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        img.save(salida, format='PNG', optimize=True)
+        return salida.getvalue(), '.png'
+    if formato == 'WEBP':
+        img.save(salida, format='WEBP', quality=85)
+        return salida.getvalue(), '.webp'
+    _a_rgb(img).save(salida, format='JPEG', quality=85, optimize=True)
+    return salida.getvalue(), '.jpg'
+
+
+def _miniatura(img):
+    ancho, alto = MINIATURA
+    # thumbnail() modifica en sitio: se trabaja sobre una copia para no reducir las rendiciones
+    copia = _a_rgb(img).copy()
+    copia.thumbnail((ancho, alto), Image.LANCZOS)
+    if copia.size != (ancho, alto):
+        fondo = Image.new('RGB', (ancho, alto), FONDO)
+        fondo.paste(copia, ((ancho - copia.size[0]) // 2, (alto - copia.size[1]) // 2))
+        copia = fondo
+    salida = BytesIO()
+    copia.save(salida, format='JPEG', quality=85, optimize=True)
+    return salida.getvalue(), '.jpg'
+
+
+def _anchos_para(img, anchos):
+    """Anchos de la escalera sin agrandar la imagen; como mínimo uno (su propio ancho)"""
+    validos = sorted(a for a in set(anchos) if a < img.width)
+    if not validos or validos[-1] < img.width:
+        validos.append(min(img.width, max(anchos)))
+    return sorted(set(validos))
+
+
+def _rendiciones(img, anchos, formatos):
+    fuentes = []
+    conservar_alfa = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    base = img.convert('RGBA') if conservar_alfa else _a_rgb(img)
+    for ancho in _anchos_para(img, anchos):
+        alto = max(1, round(img.height * ancho / img.width))
+        redimensionada = base if ancho == img.width else base.resize((ancho, alto), Image.LANCZOS)
+        for formato in formatos:
+            nombre_pillow, tipo, ext, opciones = _CODIFICADORES[formato]
+            copia = _a_rgb(redimensionada) if formato == 'jpeg' else redimensionada
+            salida = BytesIO()
+            copia.save(salida, format=nombre_pillow, **opciones)
+            fuentes.append({'tipo': tipo, 'ancho': ancho, 'datos': salida.getvalue(), 'ext': ext})
+    return fuentes
+
+
+def _comprobar_pixeles(img, max_pixeles):
+    """Usa solo las dimensiones de la cabecera: no reserva memoria para los píxeles"""
+    if max_pixeles and img.width * img.height > max_pixeles:
+        raise ImagenDemasiadoGrande(
+            f"La imagen tiene {img.width}x{img.height} píxeles; el máximo es {max_pixeles:,} píxeles"
+        )
+
+
+def _decodificar_reducida(img, tamano_maximo):
+    """
+    Decodifica la imagen ya reducida cerca de `tamano_maximo`.
+    JPEG usa draft(): el decodificador escala por 1/2, 1/4 u 1/8 sin pasar por
+    la resolución completa. El resto se decodifica y se reduce con reduce(),
+    que promedia bloques de píxeles y es mucho más barato que LANCZOS.
+    El ajuste fino a `tamano_maximo` lo hace luego thumbnail().
+    """
+    escala = tamano_maximo / max(img.size)
+    if escala >= 1:
+        img.load()
+        return img
+    if img.format == 'JPEG':
+        # draft() elige la mayor reducción que deja la imagen >= al tamaño pedido
+        img.draft(img.mode, (math.ceil(img.width * escala), math.ceil(img.height * escala)))
+        img.load()
+        return img
+    factor = int(1 / escala)
+    img.load()
+    # reduce() no admite modos con paleta ni de 1 bit; esos quedan para thumbnail()
+    if factor < 2 or img.mode in _SIN_REDUCE:
+        return img
+    return img.reduce(factor)
+
+
+def procesar_imagen(origen, rendiciones=True, anchos=ANCHOS, formatos=FORMATOS,
+                    tamano_maximo=TAMANO_MAXIMO, max_pixeles=MAX_PIXELES):
+    """
+    Corrige la orientación EXIF y limita el lado más largo a `tamano_maximo`.
+    Si rendiciones=True genera además la miniatura y la escalera de anchos en
+    cada formato soportado. `origen` es una ruta (preferible: Pillow lee el
+    archivo por partes) o bytes. Retorna:
+    {'original': (bytes, ext), 'miniatura': (bytes, ext),
+     'fuentes': [{'tipo': 'image/webp', 'ancho': 640, 'datos': bytes, 'ext': '.webp'}, ...]}
+    Lanza ImagenDemasiadoGrande si supera `max_pixeles`.
+    """
+    if isinstance(origen, (bytes, bytearray)):
+        origen = BytesIO(origen)
+
+    with Image.open(origen) as img:
+        formato = img.format
+        _comprobar_pixeles(img, max_pixeles)
+        # La orientación se corrige después de reducir: transponer la imagen completa la decodificaría entera
+        img = ImageOps.exif_transpose(_decodificar_reducida(img, tamano_maximo))
+        if max(img.size) > tamano_maximo:
+            img.thumbnail((tamano_maximo, tamano_maximo), Image.LANCZOS)
+
+        resultado = {'original': _codificar(img, formato)}
+        if rendiciones:
+            resultado['miniatura'] = _miniatura(img)
+            resultado['fuentes'] = _rendiciones(img, anchos, formatos_soportados(formatos))
+    return resultado
+
+
+def verificar_imagen(archivo, max_pixeles=MAX_PIXELES):
+    """
+    Verifica que el archivo sea una imagen legible sin decodificar sus píxeles:
+    lee la cabecera, comprueba el límite de píxeles y valida la estructura.
+    Las subidas grandes (TemporaryUploadedFile) se leen desde su archivo
+    temporal, sin copiarlas a memoria. Retorna el formato detectado; lanza
+    ImagenDemasiadoGrande o una excepción de Pillow si no es válida.
+    """
+    ruta = archivo.temporary_file_path() if hasattr(archivo, 'temporary_file_path') else None
+    if ruta is None and hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    with Image.open(ruta or archivo) as img:
+        formato = img.format
+        _comprobar_pixeles(img, max_pixeles)
+        img.verify()
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    return formato
@@ -7,6 +7,7 @@ from .color import (
     ColorProductoListSerializer,
     ImagenProductoSerializer
 )
+from .stock import AjusteStockLineaSerializer, AjusteStockLoteSerializer
 
 __all__ = [
     'ProductoSerializer',
@@ -15,4 +16,6 @@ __all__ = [
     'ColorProductoCreateSerializer',
     'ColorProductoListSerializer',
     'ImagenProductoSerializer',
+    'AjusteStockLineaSerializer',
+    'AjusteStockLoteSerializer',
 ]
\ No newline at end of file
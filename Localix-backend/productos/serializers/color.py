@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from productos.models import ColorProducto, ImagenProducto
+from productos.cola_imagenes import verificar_subida
+from productos.imagenes import imagen_responsive
+from productos.procesamiento_imagenes import ImagenDemasiadoGrande
 
 
 class ImagenProductoSerializer(serializers.ModelSerializer):
@@ -7,15 +10,28 @@ class ImagenProductoSerializer(serializers.ModelSerializer):
     Serializer para imágenes de productos
     """
     url_imagen = serializers.ReadOnlyField()
+    imagen_responsive = serializers.SerializerMethodField()
     
     class Meta:
         model = ImagenProducto
         fields = [
             'id', 'imagen', 'orden', 'es_principal', 
-            'fecha_creacion', 'url_imagen'
+            'fecha_creacion', 'url_imagen', 'imagen_responsive'
         ]
         read_only_fields = ['fecha_creacion']
 
+    def get_imagen_responsive(self, obj):
+        """srcset de la imagen (AVIF/WebP/JPEG por ancho)"""
+        return imagen_responsive(obj.imagen, obj.rendiciones, self.context.get('request'))
+
+    def validate_imagen(self, value):
+        """Límite de píxeles por cabecera, antes de que el worker decodifique la imagen"""
+        try:
+            verificar_subida(value)
+        except ImagenDemasiadoGrande as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
     def validate(self, data):
         """
         Validación personalizada para imágenes
@@ -5,13 +5,13 @@ from categorias.serializers import CategoriaSerializer
 from django.utils.text import slugify
 from django.utils import timezone
 import os
-from io import BytesIO
-from PIL import Image, ImageOps
 import uuid
 from decimal import Decimal
 from django.utils.translation import gettext_lazy as _
-from django.core.files.base import ContentFile
+from productos.cola_imagenes import eliminar_imagen_producto, encolar_imagen_producto, verificar_subida
+from productos.procesamiento_imagenes import ImagenDemasiadoGrande
 from .color import ColorProductoSerializer
+from productos.imagenes import imagen_responsive
 
 class ProductoSerializer(serializers.ModelSerializer):
     # Campos de relación (lectura)
@@ -34,6 +34,7 @@ class ProductoSerializer(serializers.ModelSerializer):
     )
     disponible_para_venta = serializers.BooleanField(read_only=True)
     imagen_principal_url = serializers.SerializerMethodField()
+    imagen_responsive = serializers.SerializerMethodField()
     tipo_display = serializers.SerializerMethodField()
     estado_display = serializers.SerializerMethodField()
     stock_total_calculado = serializers.SerializerMethodField()
@@ -43,7 +44,7 @@ class ProductoSerializer(serializers.ModelSerializer):
         model = Producto
         fields = [
             'id', 'sku', 'nombre', 'slug', 'imagen_principal', 'imagen_principal_url',
-            'descripcion_corta', 'descripcion_larga', 'tipo', 'tipo_display', 'estado',
+            'imagen_estado', 'imagen_responsive', 'descripcion_corta', 'descripcion_larga', 'tipo', 'tipo_display', 'estado',
             'estado_display', 'categoria', 'categoria_id', 'precio', 'precio_comparacion', 'costo',
             'gestion_stock', 'stock', 'stock_minimo', 'vendidos', 'peso', 'dimensiones',
             'meta_titulo', 'meta_descripcion', 'fecha_creacion', 'fecha_publicacion',
@@ -53,7 +54,7 @@ class ProductoSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'slug', 'fecha_creacion', 'fecha_actualizacion', 
             'margen_ganancia', 'disponible_para_venta', 'imagen_principal_url',
-            'tipo_display', 'estado_display'
+            'imagen_estado', 'imagen_responsive', 'tipo_display', 'estado_display'
         ]
         extra_kwargs = {
             'imagen_principal': {
@@ -86,14 +87,22 @@ class ProductoSerializer(serializers.ModelSerializer):
                 return None
         return None
 
+    def get_imagen_responsive(self, obj):
+        """srcset de la imagen principal (AVIF/WebP/JPEG por ancho)"""
+        return imagen_responsive(obj.imagen_principal, obj.imagen_rendiciones, self.context.get('request'))
+
     def get_stock_total_calculado(self, obj):
         """Calcula el stock total sumando variantes y colores sin modificar el stock principal"""
         try:
-            # Sumar stock de variantes
-            stock_variantes = sum(variante.stock for variante in obj.variantes.all())
+            # Usar las sumas anotadas por Producto.objects.con_stock_calculado() si existen
+            stock_variantes = getattr(obj, 'stock_variantes_total', None)
+            if stock_variantes is None:
+                stock_variantes = sum(variante.stock for variante in obj.variantes.all())
             
-            # Sumar stock de colores activos
-            stock_colores = sum(color.stock for color in obj.colores.filter(activo=True))
+            # Sumar stock de colores activos (filtrando en memoria para aprovechar el prefetch)
+            stock_colores = getattr(obj, 'stock_colores_total', None)
+            if stock_colores is None:
+                stock_colores = sum(color.stock for color in obj.colores.all() if color.activo)
             
             # El stock total es la suma de variantes + colores
             return stock_variantes + stock_colores
@@ -152,21 +161,20 @@ class ProductoSerializer(serializers.ModelSerializer):
         if ext not in valid_extensions:
             raise serializers.ValidationError(_("Formato de imagen no soportado. Use JPG, PNG o WEBP"))
         
+        # Verificar que el archivo no esté vacío
+        if value.size == 0:
+            raise serializers.ValidationError(_("El archivo de imagen está vacío"))
+        
+        # Solo se valida la cabecera; redimensión y rendiciones se procesan en segundo plano
         try:
-            # Verificar que el archivo no esté vacío
-            if value.size == 0:
-                raise serializers.ValidationError(_("El archivo de imagen está vacío"))
-            
-            # Procesar la imagen
-            processed_image = self._process_image(value)
-            return processed_image
-            
-        except serializers.ValidationError:
-            raise  # Re-lanzar los errores de validación
-        except Exception as e:
-            raise serializers.ValidationError(
-                _(f"Error procesando la imagen: {str(e)}")
-            )
+            verificar_subida(value)
+        except ImagenDemasiadoGrande as e:
+            raise serializers.ValidationError(str(e))
+        except Exception:
+            raise serializers.ValidationError(_("El archivo no es una imagen válida o está corrupto"))
+        
+        value.name = f"producto_{uuid.uuid4().hex}{ext}"
+        return value
 
     def validate(self, data):
         errors = {}
@@ -207,10 +215,6 @@ class ProductoSerializer(serializers.ModelSerializer):
         if validated_data.get('estado') == 'publicado':
             validated_data['fecha_publicacion'] = now
         
-        # Procesar imagen principal si existe
-        if 'imagen_principal' in validated_data and validated_data['imagen_principal']:
-            validated_data['imagen_principal'] = self._process_image(validated_data['imagen_principal'])
-        
         # Crear producto
         producto = super().create(validated_data)
         
@@ -218,8 +222,8 @@ class ProductoSerializer(serializers.ModelSerializer):
         # Eliminado: if categorias_secundarias_ids:
         # Eliminado:     producto.categorias_secundarias.set(categorias_secundarias_ids)
         
-        # Generar thumbnail
-        self._generate_thumbnail(producto)
+        # Procesar la imagen en segundo plano (redimensión y rendiciones)
+        encolar_imagen_producto(producto)
         
         return producto
 
@@ -246,16 +250,9 @@ class ProductoSerializer(serializers.ModelSerializer):
         if validated_data.get('estado') == 'publicado' and instance.estado != 'publicado':
             validated_data['fecha_publicacion'] = timezone.now()
         
-        # Procesar imagen principal si existe
-        if 'imagen_principal' in validated_data:
-            if validated_data['imagen_principal'] is None:
-                # Eliminar imagen existente si se envía null
-                if instance.imagen_principal:
-                    instance.imagen_principal.delete()
-                    if hasattr(instance, 'imagen_thumbnail') and instance.imagen_thumbnail:
-                        instance.imagen_thumbnail.delete()
-            elif validated_data['imagen_principal']:
-                validated_data['imagen_principal'] = self._process_image(validated_data['imagen_principal'])
+        # Eliminar imagen existente si se envía null
+        if 'imagen_principal' in validated_data and validated_data['imagen_principal'] is None:
+            eliminar_imagen_producto(instance)
         
         print("Final validated data:", validated_data)
         
@@ -266,9 +263,9 @@ class ProductoSerializer(serializers.ModelSerializer):
         # Eliminado: if categorias_secundarias_ids is not None:
         # Eliminado:     producto.categorias_secundarias.set(categorias_secundarias_ids)
         
-        # Regenerar thumbnail si cambió la imagen
-        if 'imagen_principal' in validated_data:
-            self._generate_thumbnail(producto)
+        # Procesar la nueva imagen en segundo plano
+        if validated_data.get('imagen_principal'):
+            encolar_imagen_producto(producto)
         
         print("Product updated successfully:", producto)
         return producto
@@ -291,130 +288,3 @@ class ProductoSerializer(serializers.ModelSerializer):
                 queryset = queryset.exclude(pk=exclude_id)
         
         return slug
-
-    def _process_image(self, image_file):
-        """Procesa la imagen antes de guardarla con manejo robusto de errores"""
-        try:
-            # Asegurarse de que el archivo esté en el inicio
-            if hasattr(image_file, 'seekable') and image_file.seekable():
-                image_file.seek(0)
-            
-            # Leer la imagen directamente desde el archivo subido
-            img_bytes = image_file.read()
-            
-            # Verificar que no esté vacío
-            if not img_bytes or len(img_bytes) == 0:
-                raise serializers.ValidationError(_("El archivo de imagen está vacío o no se pudo leer"))
-            
-            # Crear un BytesIO con los bytes leídos
-            img_io = BytesIO(img_bytes)
-            
-            # Verificar que sea una imagen válida
-            try:
-                img = Image.open(img_io)
-                img.verify()  # Verifica la integridad del archivo
-                img_io.seek(0)  # Volver al inicio después de verify
-                img = Image.open(img_io)  # Necesario volver a abrir después de verify
-            except Exception as e:
-                raise serializers.ValidationError(_("El archivo no es una imagen válida o está corrupto"))
-            
-            # Corregir orientación EXIF
-            try:
-                img = ImageOps.exif_transpose(img)
-            except Exception:
-                pass  # Si falla la corrección EXIF, continuar con la imagen original
-            
-            # Convertir a formato adecuado
-            if img.format in ['JPEG', 'JFIF', 'WEBP']:  # type: ignore
-                img = img.convert('RGB')  # type: ignore
-            elif img.format == 'PNG' and img.mode == 'P':  # type: ignore
-                img = img.convert('RGBA')  # type: ignore
-            
-            # Optimizar tamaño (máximo 2000px en el lado más largo)
-            max_size = 2000
-            if max(img.size) > max_size:  # type: ignore
-                img.thumbnail((max_size, max_size), Image.LANCZOS)  # type: ignore
-            
-            # Guardar en buffer
-            output = BytesIO()
-            
-            # Determinar formato de salida
-            if img.format in ['JPEG', 'JFIF']:  # type: ignore
-                img.save(output, format='JPEG', quality=85, optimize=True)  # type: ignore
-                ext = '.jpg'
-            elif img.format == 'PNG':  # type: ignore
-                img.save(output, format='PNG', optimize=True)  # type: ignore
-                ext = '.png'
-            elif img.format == 'WEBP':  # type: ignore
-                img.save(output, format='WEBP', quality=85)  # type: ignore
-                ext = '.webp'
-            else:
-                # Por defecto guardar como JPEG
-                img.save(output, format='JPEG', quality=85, optimize=True)  # type: ignore
-                ext = '.jpg'
-            
-            # Crear nuevo ContentFile con nombre único
-            new_name = f"producto_{uuid.uuid4().hex}{ext}"
-            return ContentFile(output.getvalue(), name=new_name)
-            
-        except serializers.ValidationError:
-            raise  # Re-lanzar errores de validación
-        except Exception as e:
-            raise serializers.ValidationError(
-                _("Error procesando la imagen: %(error)s") % {'error': str(e)}
-            )
-
-    def _generate_thumbnail(self, producto):
-        """Genera un thumbnail de 300x300px para la imagen principal"""
-        if not producto.imagen_principal:
-            return
-            
-        try:
-            # Abrir imagen original
-            with Image.open(producto.imagen_principal) as img:
-                # Corregir orientación EXIF
-                try:
-                    img = ImageOps.exif_transpose(img)
-                except Exception:
-                    pass  # Si falla la corrección EXIF, continuar
-                
-                # Convertir a RGB si es necesario
-                if img.mode in ('RGBA', 'LA', 'P'):  # type: ignore
-                    background = Image.new('RGB', img.size, (255, 255, 255))  # type: ignore
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)  # type: ignore
-                    img = background
-                
-                # Crear thumbnail manteniendo relación de aspecto
-                img.thumbnail((300, 300), Image.LANCZOS)  # type: ignore
-                
-                # Crear fondo blanco para imágenes no cuadradas
-                if img.size[0] != 300 or img.size[1] != 300:  # type: ignore
-                    background = Image.new('RGB', (300, 300), (255, 255, 255))
-                    offset = (
-                        (300 - img.size[0]) // 2,  # type: ignore
-                        (300 - img.size[1]) // 2  # type: ignore
-                    )
-                    background.paste(img, offset)  # type: ignore
-                    img = background
-                
-                # Guardar thumbnail
-                thumb_io = BytesIO()
-                img.save(thumb_io, format='JPEG', quality=85)  # type: ignore
-                
-                # Si el modelo tiene campo para thumbnail
-                if hasattr(producto, 'imagen_thumbnail'):
-                    # Eliminar thumbnail anterior si existe
-                    if producto.imagen_thumbnail:
-                        producto.imagen_thumbnail.delete()
-                    
-                    # Guardar nuevo thumbnail
-                    thumb_name = f"thumb_{uuid.uuid4().hex}.jpg"
-                    producto.imagen_thumbnail.save(
-                        thumb_name,
-                        ContentFile(thumb_io.getvalue()),
-                        save=False
-                    )
-                    producto.save()
-                
-        except Exception as e:
-            print(f"Error al generar thumbnail: {str(e)}")
\ No newline at end of file
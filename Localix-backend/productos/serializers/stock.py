@@ -0,0 +1,30 @@
+from rest_framework import serializers
+
+# Líneas por petición: un conteo de inventario completo cabe en una sola llamada
+MAX_LINEAS_AJUSTE = 1000
+
+
+class AjusteStockLineaSerializer(serializers.Serializer):
+    """
+    Una línea de ajuste: un color o una variante, con stock absoluto o delta.
+    Ej.: {"color": 12, "stock": 30} o {"variante": 7, "delta": -2}
+    """
+    color = serializers.IntegerField(required=False, min_value=1)
+    variante = serializers.IntegerField(required=False, min_value=1)
+    stock = serializers.IntegerField(required=False, min_value=0, help_text="Stock absoluto (conteo físico)")
+    delta = serializers.IntegerField(required=False, help_text="Unidades a sumar (positivo) o restar (negativo)")
+
+    def validate(self, data):
+        if ('color' in data) == ('variante' in data):
+            raise serializers.ValidationError("Indique 'color' o 'variante' (uno de los dos)")
+        if ('stock' in data) == ('delta' in data):
+            raise serializers.ValidationError("Indique 'stock' o 'delta' (uno de los dos)")
+        return data
+
+
+class AjusteStockLoteSerializer(serializers.Serializer):
+    ajustes = serializers.ListField(
+        child=AjusteStockLineaSerializer(),
+        allow_empty=False,
+        max_length=MAX_LINEAS_AJUSTE
+    )
@@ -0,0 +1,547 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+from rest_framework.test import APIClient
+
+from categorias.models import CategoriaProducto
+from usuarios.models import Usuario
+from .cola_imagenes import archivos_de_rendiciones, encolar_imagen_producto
+from .imagenes import imagen_responsive
+from .models import BlobMedia, Producto, VarianteProducto, ColorProducto, ImagenProducto, MovimientoStock, TrabajoImagen
+from .procesamiento_imagenes import ImagenDemasiadoGrande, procesar_imagen
+
+
+class ListadoProductosConsultasTest(TestCase):
+    """El listado de productos debe costar las mismas consultas sin importar el tamaño de la página"""
+
+    URL = '/api/productos/productos/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.categoria = CategoriaProducto.objects.create(usuario=self.usuario, nombre='Bolsos')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _crear_productos(self, cantidad):
+        for i in range(Producto.objects.count(), Producto.objects.count() + cantidad):
+            producto = Producto.objects.create(
+                usuario=self.usuario, categoria=self.categoria, sku=f'SKU-{i}',
+                nombre=f'Producto {i}', slug=f'producto-{i}',
+                descripcion_corta='Producto', descripcion_larga='Producto',
+                precio=Decimal('10.00'), costo=Decimal('4.00'),
+            )
+            VarianteProducto.objects.create(producto=producto, nombre='Talla', valor='M', sku=f'SKU-{i}-M', stock=2)
+            ColorProducto.objects.create(producto=producto, nombre='Rojo', hex_code='#FF0000', stock=3)
+            ColorProducto.objects.create(producto=producto, nombre='Azul', hex_code='#0000FF', stock=4, activo=False)
+
+    def _consultas_listado(self):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(self.URL)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['results'], len(contexto.captured_queries)
+
+    def test_consultas_constantes(self):
+        self._crear_productos(5)
+        productos, consultas_pocos = self._consultas_listado()
+        self.assertEqual(len(productos), 5)
+
+        self._crear_productos(15)
+        productos, consultas_muchos = self._consultas_listado()
+        self.assertEqual(len(productos), 20)
+
+        self.assertEqual(consultas_pocos, consultas_muchos)
+        self.assertTrue(all(producto['stock_total_calculado'] == 5 for producto in productos))
+        self.assertTrue(all(len(producto['colores']) == 2 for producto in productos))
+
+
+class StockTotalProductoTest(TestCase):
+    """actualizar_stock_total recalcula el stock con un único UPDATE y solo escribe las filas que cambian"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.con_colores = self._crear('COL-01')
+        ColorProducto.objects.create(producto=self.con_colores, nombre='Rojo', hex_code='#FF0000', stock=3)
+        ColorProducto.objects.create(producto=self.con_colores, nombre='Azul', hex_code='#0000FF', stock=4)
+        ColorProducto.objects.create(producto=self.con_colores, nombre='Gris', hex_code='#888888', stock=50, activo=False)
+        self.solo_inactivos = self._crear('INA-01', stock=7)
+        ColorProducto.objects.create(producto=self.solo_inactivos, nombre='Gris', hex_code='#888888', stock=9, activo=False)
+        self.con_variantes = self._crear('VAR-01')
+        VarianteProducto.objects.create(producto=self.con_variantes, nombre='Talla', valor='S', sku='VAR-01-S', stock=2)
+        VarianteProducto.objects.create(producto=self.con_variantes, nombre='Talla', valor='M', sku='VAR-01-M', stock=5)
+        self.sin_desglose = self._crear('SIN-01', stock=11)
+
+    def _crear(self, sku, stock=0):
+        return Producto.objects.create(
+            usuario=self.usuario, sku=sku, nombre=sku, slug=sku.lower(),
+            descripcion_corta=sku, descripcion_larga=sku,
+            precio=Decimal('10.00'), costo=Decimal('4.00'), stock=stock,
+        )
+
+    def _stocks(self):
+        return dict(Producto.objects.values_list('sku', 'stock'))
+
+    def test_stock_por_tipo_de_producto(self):
+        # Se desincroniza el stock guardado sin pasar por save()
+        Producto.objects.update(stock=99)
+
+        actualizados = Producto.objects.filter(usuario=self.usuario).actualizar_stock_total()
+
+        # Los productos sin colores activos ni variantes conservan su stock propio
+        self.assertEqual(actualizados, 2)
+        self.assertEqual(self._stocks(), {'COL-01': 7, 'INA-01': 99, 'VAR-01': 7, 'SIN-01': 99})
+
+    def test_fila_sin_cambios_no_se_escribe(self):
+        Producto.objects.filter(usuario=self.usuario).actualizar_stock_total()
+        self.assertEqual(Producto.objects.filter(usuario=self.usuario).actualizar_stock_total(), 0)
+
+        Producto.objects.filter(pk=self.con_colores.pk).update(stock=0)
+        with CaptureQueriesContext(connection) as contexto:
+            actualizados = Producto.objects.filter(usuario=self.usuario).actualizar_stock_total()
+        self.assertEqual(actualizados, 1)
+        self.assertEqual(len(contexto), 1)
+        self.assertEqual(self._stocks()['COL-01'], 7)
+
+    def test_metodo_de_instancia(self):
+        Producto.objects.filter(pk=self.con_variantes.pk).update(stock=0)
+        self.assertEqual(self.con_variantes.actualizar_stock_total(), 1)
+        self.assertEqual(self.con_variantes.stock, 7)
+        self.assertEqual(self.sin_desglose.actualizar_stock_total(), 0)
+        self.assertEqual(self.sin_desglose.stock, 11)
+
+
+class BusquedaProductosTest(TestCase):
+    """La búsqueda usa el texto normalizado, coincide por prefijo y ordena por relevancia"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.bolso = self._crear('BOL-01', 'Bolso de cuero', 'Bolso artesanal')
+        self.cartera = self._crear('CAR-01', 'Cartera Canción', 'Cartera con bolsillo interior')
+        self._crear('ZAP-01', 'Zapatilla', 'Calzado deportivo')
+
+    def _crear(self, sku, nombre, descripcion):
+        return Producto.objects.create(
+            usuario=self.usuario, sku=sku, nombre=nombre, slug=sku.lower(),
+            descripcion_corta=descripcion, descripcion_larga=descripcion,
+            precio=Decimal('10.00'), costo=Decimal('4.00'), estado='publicado',
+        )
+
+    def _buscar(self, texto):
+        respuesta = self.client.get('/api/productos/productos/', {'search': texto})
+        self.assertEqual(respuesta.status_code, 200)
+        return [producto['sku'] for producto in respuesta.json()['results']]
+
+    def test_texto_busqueda_se_mantiene_al_guardar(self):
+        self.assertIn('cartera cancion', self.cartera.texto_busqueda)
+        self.cartera.nombre = 'Mochila Ñandú'
+        self.cartera.save(update_fields=['nombre'])
+        self.cartera.refresh_from_db()
+        self.assertIn('mochila nandu', self.cartera.texto_busqueda)
+
+    def test_prefijo_acentos_y_relevancia(self):
+        self.assertEqual(self._buscar('CANCION'), ['CAR-01'])
+        self.assertEqual(self._buscar('zapa'), ['ZAP-01'])
+        # El nombre que empieza por el texto va antes que la coincidencia en la descripción
+        self.assertEqual(self._buscar('bols'), ['BOL-01', 'CAR-01'])
+        self.assertEqual(self._buscar('bolso cuero'), ['BOL-01'])
+
+    def test_busqueda_del_punto_de_venta(self):
+        respuesta = self.client.get('/api/ventas/productos/buscar/', {'q': 'car-01'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([producto['sku'] for producto in respuesta.json()], ['CAR-01'])
+
+
+class ProcesamientoImagenesTest(TestCase):
+    """La subida responde de inmediato y el trabajo genera la imagen redimensionada y sus rendiciones"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_ASYNC=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='BOL-01', nombre='Bolso', slug='bolso',
+            descripcion_corta='Bolso', descripcion_larga='Bolso',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _imagen(self, tamano=(2500, 1000)):
+        contenido = BytesIO()
+        Image.new('RGB', tamano, (200, 30, 30)).save(contenido, format='JPEG')
+        return SimpleUploadedFile('foto.jpg', contenido.getvalue(), content_type='image/jpeg')
+
+    def test_subida_encola_y_procesa(self):
+        url = f'/api/productos/productos/{self.producto.slug}/upload_imagen_principal/'
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            respuesta = self.client.post(url, {'imagen_principal': self._imagen()}, format='multipart')
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta.json()['imagen_estado'], 'pendiente')
+
+        for callback in callbacks:
+            callback()
+
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.imagen_estado, 'lista')
+        self.assertEqual(TrabajoImagen.objects.get().estado, 'completado')
+        with Image.open(self.producto.imagen_principal.path) as img:
+            self.assertEqual(img.size, (2000, 800))
+        miniatura = self.producto.imagen_principal.storage.path(self.producto.imagen_rendiciones['miniatura'])
+        with Image.open(miniatura) as img:
+            self.assertEqual(img.size, (300, 300))
+
+    def test_comando_procesa_pendientes(self):
+        self.producto.imagen_principal.save('foto.jpg', self._imagen((400, 300)), save=True)
+        with self.captureOnCommitCallbacks(execute=False):
+            trabajo = encolar_imagen_producto(self.producto)
+
+        call_command('procesar_imagenes', stdout=StringIO())
+
+        trabajo.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual(self.producto.imagen_estado, 'lista')
+        self.assertEqual(set(self.producto.imagen_rendiciones), {'original', 'miniatura', 'fuentes'})
+        self.assertIn('image/webp', self.producto.imagen_rendiciones['fuentes'])
+
+    def test_rendiciones_de_imagen_de_color(self):
+        color = ColorProducto.objects.create(producto=self.producto, nombre='Rojo', hex_code='#FF0000', stock=1)
+        with override_settings(IMAGENES_FORMATOS=['webp', 'jpeg']), self.captureOnCommitCallbacks(execute=True):
+            imagen = ImagenProducto.objects.create(color=color, imagen=self._imagen((800, 600)))
+
+        imagen.refresh_from_db()
+        fuentes = imagen.rendiciones['fuentes']
+        self.assertEqual(set(fuentes), {'image/webp', 'image/jpeg'})
+        # Sin agrandar: los anchos menores de la escalera más el ancho propio
+        self.assertEqual([variante['ancho'] for variante in fuentes['image/webp']], [320, 640, 800])
+        for variante in fuentes['image/webp']:
+            with Image.open(imagen.imagen.storage.path(variante['archivo'])) as img:
+                self.assertEqual((img.format, img.width), ('WEBP', variante['ancho']))
+
+        responsive = imagen_responsive(imagen.imagen, imagen.rendiciones)
+        self.assertEqual(responsive['anchos'], [320, 640, 800])
+        self.assertEqual([fuente['tipo'] for fuente in responsive['fuentes']], ['image/webp', 'image/jpeg'])
+        self.assertTrue(responsive['fuentes'][0]['srcset'].endswith(' 800w'))
+
+        # Guardar sin cambiar el archivo no vuelve a encolar
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen.orden = 1
+            imagen.save()
+        self.assertEqual(TrabajoImagen.objects.filter(tipo='color').count(), 1)
+
+    def test_limite_de_pixeles_por_cabecera(self):
+        url = f'/api/productos/productos/{self.producto.slug}/upload_imagen_principal/'
+        with override_settings(IMAGENES_MAX_PIXELES=1_000_000):
+            respuesta = self.client.post(url, {'imagen_principal': self._imagen((2000, 1000))}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('máximo', respuesta.json()['error'])
+        self.assertFalse(TrabajoImagen.objects.exists())
+
+    def test_jpeg_grande_se_decodifica_reducido(self):
+        contenido = BytesIO()
+        Image.new('RGB', (4000, 3000), (10, 120, 10)).save(contenido, format='JPEG')
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=JpegImageFile.draft) as draft:
+            resultado = procesar_imagen(contenido.getvalue(), rendiciones=False, tamano_maximo=500)
+        # draft pide el menor tamaño >= 500px de lado: el decodificador escala 1/4 (1000x750)
+        self.assertEqual(draft.call_args.args[2], (500, 375))
+        with Image.open(BytesIO(resultado['original'][0])) as img:
+            self.assertEqual(img.size, (500, 375))
+
+        with self.assertRaises(ImagenDemasiadoGrande):
+            procesar_imagen(contenido.getvalue(), max_pixeles=1_000_000)
+
+    def test_pool_de_procesos(self):
+        with open(os.path.join(self.media, 'foto.png'), 'wb') as archivo:
+            Image.new('RGBA', (3000, 3000), (0, 0, 255, 128)).save(archivo, format='PNG')
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            resultado = pool.submit(procesar_imagen, os.path.join(self.media, 'foto.png')).result()
+        self.assertEqual(resultado['original'][1], '.png')
+        self.assertEqual(resultado['miniatura'][1], '.jpg')
+        with Image.open(BytesIO(resultado['original'][0])) as img:
+            self.assertEqual(img.size, (2000, 2000))
+
+
+class AlmacenContenidoTest(TestCase):
+    """Las imágenes idénticas de un usuario comparten archivo y se eliminan con la última referencia"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_ASYNC=False, IMAGENES_FORMATOS=['jpeg'])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='CAM-01', nombre='Camisa', slug='camisa',
+            descripcion_corta='Camisa', descripcion_larga='Camisa',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+
+    def _imagen(self):
+        contenido = BytesIO()
+        Image.new('RGB', (700, 500), (20, 60, 200)).save(contenido, format='JPEG')
+        return SimpleUploadedFile('foto.jpg', contenido.getvalue(), content_type='image/jpeg')
+
+    def _imagen_de_color(self, producto, nombre):
+        color = ColorProducto.objects.create(producto=producto, nombre=nombre, hex_code='#0000FF', stock=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen = ImagenProducto.objects.create(color=color, imagen=self._imagen())
+        imagen.refresh_from_db()
+        return imagen
+
+    def test_deduplica_y_cuenta_referencias(self):
+        azul = self._imagen_de_color(self.producto, 'Azul')
+        marino = self._imagen_de_color(self.producto, 'Marino')
+
+        self.assertEqual(azul.imagen.name, marino.imagen.name)
+        self.assertTrue(azul.imagen.name.startswith(f'contenido/{self.usuario.id}/'))
+        self.assertEqual(BlobMedia.objects.get(archivo=azul.imagen.name).referencias, 2)
+        ruta = azul.imagen.path
+        # Las subidas sin procesar ya se eliminaron
+        self.assertEqual(os.listdir(os.path.join(self.media, 'productos', 'colores')), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            azul.delete()
+        self.assertEqual(BlobMedia.objects.get(archivo=marino.imagen.name).referencias, 1)
+        self.assertTrue(os.path.exists(ruta))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            marino.delete()
+        self.assertFalse(BlobMedia.objects.exists())
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_no_comparte_entre_usuarios(self):
+        otro = Usuario.objects.create(username='otra', email='otra@example.com')
+        producto_otro = Producto.objects.create(
+            usuario=otro, sku='CAM-01', nombre='Camisa', slug='camisa',
+            descripcion_corta='Camisa', descripcion_larga='Camisa',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        propia = self._imagen_de_color(self.producto, 'Azul')
+        ajena = self._imagen_de_color(producto_otro, 'Azul')
+
+        self.assertNotEqual(propia.imagen.name, ajena.imagen.name)
+        self.assertEqual(os.path.basename(propia.imagen.name), os.path.basename(ajena.imagen.name))
+        self.assertEqual(BlobMedia.objects.get(archivo=ajena.imagen.name).usuario, otro)
+
+    def test_eliminar_imagen_principal_libera_blobs(self):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        url = f'/api/productos/productos/{self.producto.slug}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'{url}upload_imagen_principal/', {'imagen_principal': self._imagen()}, format='multipart')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.imagen_principal.name, self.producto.imagen_rendiciones['original'])
+        self.assertTrue(BlobMedia.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = client.delete(f'{url}remove_imagen_principal/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(BlobMedia.objects.exists())
+        archivos = [nombre for _, _, nombres in os.walk(os.path.join(self.media, 'contenido')) for nombre in nombres]
+        self.assertEqual(archivos, [])
+
+
+class LimpiezaMediaTest(TestCase):
+    """limpiar_media elimina solo archivos sin referencias y fuera del período de gracia"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_ASYNC=False, IMAGENES_FORMATOS=['jpeg'])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='GOR-01', nombre='Gorra', slug='gorra',
+            descripcion_corta='Gorra', descripcion_larga='Gorra',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+
+    def _archivo(self, nombre):
+        ruta = os.path.join(self.media, nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(b'x' * 10)
+        return ruta
+
+    def _envejecer(self):
+        """Todo lo existente queda fuera del período de gracia"""
+        hace_dos_dias = time.time() - 2 * 24 * 3600
+        for carpeta, _, nombres in os.walk(self.media):
+            for nombre in nombres:
+                os.utime(os.path.join(carpeta, nombre), (hace_dos_dias, hace_dos_dias))
+        BlobMedia.objects.update(fecha_actualizacion=timezone.now() - timedelta(days=2))
+
+    def _limpiar(self, *argumentos):
+        salida = StringIO()
+        call_command('limpiar_media', *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def test_reclama_huerfanos_y_referencias_perdidas(self):
+        color = ColorProducto.objects.create(producto=self.producto, nombre='Negro', hex_code='#000000', stock=1)
+        contenido = BytesIO()
+        Image.new('RGB', (400, 300), (0, 0, 0)).save(contenido, format='JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            ImagenProducto.objects.create(color=color, imagen=SimpleUploadedFile('negro.jpg', contenido.getvalue()))
+        Producto.objects.filter(pk=self.producto.pk).update(imagen_principal='productos/usada.jpg')
+        huerfano = self._archivo('productos/huerfana.jpg')
+        usada = self._archivo('productos/usada.jpg')
+        ajeno = self._archivo('posts/portada.jpg')
+        # Borrado en cascada: las imágenes del color se eliminan sin liberar sus blobs
+        color.delete()
+        blobs = [os.path.join(self.media, archivo) for archivo in BlobMedia.objects.values_list('archivo', flat=True)]
+        self.assertTrue(blobs)
+        self._envejecer()
+        reciente = self._archivo('productos/colores/reciente.jpg')
+
+        salida = self._limpiar('--dry-run')
+        self.assertIn('productos/huerfana.jpg', salida)
+        self.assertTrue(os.path.exists(huerfano))
+        self.assertEqual(BlobMedia.objects.count(), len(blobs))
+
+        self._limpiar()
+        self.assertFalse(os.path.exists(huerfano))
+        self.assertFalse(any(os.path.exists(ruta) for ruta in blobs))
+        self.assertFalse(BlobMedia.objects.exists())
+        for conservado in (usada, ajeno, reciente):
+            self.assertTrue(os.path.exists(conservado))
+
+    def test_conserva_blobs_en_uso_y_subidas_pendientes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.imagen_principal.save('gorra.jpg', self._imagen_jpeg(), save=True)
+            encolar_imagen_producto(self.producto)
+        self.producto.refresh_from_db()
+        pendiente = self._archivo('productos/pendiente.jpg')
+        TrabajoImagen.objects.create(tipo='producto', objeto_id=self.producto.pk, archivo='productos/pendiente.jpg')
+        self._envejecer()
+
+        self._limpiar()
+        self.assertTrue(os.path.exists(pendiente))
+        for nombre in archivos_de_rendiciones(self.producto.imagen_rendiciones):
+            self.assertTrue(os.path.exists(os.path.join(self.media, nombre)), nombre)
+
+    def _imagen_jpeg(self):
+        contenido = BytesIO()
+        Image.new('RGB', (400, 300), (250, 250, 0)).save(contenido, format='JPEG')
+        return SimpleUploadedFile('gorra.jpg', contenido.getvalue(), content_type='image/jpeg')
+
+
+class AjusteStockLoteTest(TestCase):
+    """Ajuste masivo de stock: todo o nada, consultas constantes y stock total recalculado"""
+    URL = '/api/productos/productos/ajustar_stock/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='ZAP-01', nombre='Zapato', slug='zapato',
+            descripcion_corta='Zapato', descripcion_larga='Zapato',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        self.rojo = ColorProducto.objects.create(producto=self.producto, nombre='Rojo', hex_code='#FF0000', stock=5)
+        self.azul = ColorProducto.objects.create(
+            producto=self.producto, nombre='Azul', hex_code='#0000FF', stock=4, stock_reservado=2
+        )
+        self.talla = VarianteProducto.objects.create(producto=self.producto, nombre='Talla', valor='40', sku='ZAP-01-40', stock=6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _ajustar(self, ajustes):
+        return self.client.post(self.URL, {'ajustes': ajustes}, format='json')
+
+    def test_aplica_lineas_en_orden_y_recalcula_total(self):
+        respuesta = self._ajustar([
+            {'color': self.rojo.id, 'stock': 10},
+            {'color': self.azul.id, 'delta': 3},
+            {'variante': self.talla.id, 'delta': -1},
+            {'color': self.rojo.id, 'delta': -2},
+        ])
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        datos = respuesta.json()
+        self.assertEqual(datos['productos_actualizados'], 1)
+        self.assertEqual([r['stock'] for r in datos['resultados']], [10, 7, 5, 8])
+        self.assertEqual(datos['resultados'][3]['stock_anterior'], 10)
+
+        self.rojo.refresh_from_db()
+        self.azul.refresh_from_db()
+        self.talla.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.rojo.stock, self.azul.stock, self.talla.stock), (8, 7, 5))
+        self.assertEqual(self.producto.stock, 8 + 7 + 5)
+
+    def test_consultas_constantes(self):
+        colores = [
+            ColorProducto.objects.create(producto=self.producto, nombre=f'Color {i}', hex_code='#111111', stock=1)
+            for i in range(20)
+        ]
+
+        def consultas(cantidad):
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self._ajustar([{'color': color.id, 'delta': 1} for color in colores[:cantidad]])
+            self.assertEqual(respuesta.status_code, 200)
+            return len(contexto)
+
+        self.assertEqual(consultas(2), consultas(20))
+
+    def test_aumentar_y_reducir_stock_de_color(self):
+        self.assertTrue(self.rojo.aumentar_stock(3))
+        self.assertTrue(self.rojo.reducir_stock(1))
+        self.rojo.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.rojo.stock, 7)
+        self.assertEqual(self.producto.stock, 7 + 4 + 6)
+        self.assertEqual(list(MovimientoStock.objects.order_by('id').values_list('stock', flat=True)), [3, -1])
+
+        # Si el color ya no existe no se cambia nada en memoria ni se registra el movimiento
+        ColorProducto.objects.filter(pk=self.rojo.pk).delete()
+        self.assertFalse(self.rojo.aumentar_stock(3))
+        self.assertFalse(self.rojo.reducir_stock(1))
+        self.assertEqual(self.rojo.stock, 7)
+        self.assertEqual(MovimientoStock.objects.count(), 2)
+
+    def test_linea_invalida_no_aplica_nada(self):
+        otro = Usuario.objects.create(username='otra', email='otra@example.com')
+        ajeno = Producto.objects.create(
+            usuario=otro, sku='ZAP-01', nombre='Zapato', slug='zapato',
+            descripcion_corta='Zapato', descripcion_larga='Zapato',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        color_ajeno = ColorProducto.objects.create(producto=ajeno, nombre='Rojo', hex_code='#FF0000', stock=5)
+
+        respuesta = self._ajustar([
+            {'color': self.rojo.id, 'stock': 50},
+            {'color': color_ajeno.id, 'stock': 0},
+            {'color': self.azul.id, 'stock': 1},
+        ])
+        self.assertEqual(respuesta.status_code, 400)
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['ok'] for r in resultados], [True, False, False])
+        self.assertIn('reservado', resultados[2]['error'])
+        self.rojo.refresh_from_db()
+        self.assertEqual(self.rojo.stock, 5)
+
+        respuesta = self._ajustar([{'color': self.rojo.id, 'stock': 1, 'delta': 2}])
+        self.assertEqual(respuesta.status_code, 400)
@@ -39,9 +39,8 @@ class ColorProductoListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         producto_id = self.kwargs.get('producto_id')
         producto = get_object_or_404(Producto, id=producto_id)
-        color = serializer.save(producto=producto)
-        # ✅ Actualizar stock total del producto después de crear el color
-        producto.actualizar_stock_total()
+        # ✅ ColorProducto.save recalcula el stock total del producto
+        serializer.save(producto=producto)
 
 
 class ColorProductoDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -57,18 +56,12 @@ class ColorProductoDetailView(generics.RetrieveUpdateDestroyAPIView):
         return ColorProducto.objects.filter(producto_id=producto_id)
     
     def perform_update(self, serializer):
-        # ✅ Obtener el producto antes de actualizar
-        producto = serializer.instance.producto
-        color = serializer.save()
-        # ✅ Actualizar stock total del producto después de actualizar el color
-        producto.actualizar_stock_total()
+        # ✅ ColorProducto.save recalcula el stock total del producto
+        serializer.save()
     
     def perform_destroy(self, instance):
-        # ✅ Obtener el producto antes de eliminar
-        producto = instance.producto
+        # ✅ ColorProducto.delete recalcula el stock total del producto
         instance.delete()
-        # ✅ Actualizar stock total del producto después de eliminar el color
-        producto.actualizar_stock_total()
 
 
 class ImagenProductoListCreateView(generics.ListCreateAPIView):
@@ -1,19 +1,25 @@
 import os
 import uuid
 import logging
-import time
-from io import BytesIO
 from PIL import Image
 from django.db.models import Q
+from datetime import datetime, time
 from django.utils import timezone
-from django.core.files.base import ContentFile
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from productos.models import Producto
+from productos.busqueda import BusquedaProductosFilter
+from productos.cola_imagenes import eliminar_imagen_producto, encolar_imagen_producto, verificar_subida
+from productos.procesamiento_imagenes import ImagenDemasiadoGrande
+from productos.inventario import ajustar_stock_lote
+from productos.movimientos import stock_de_producto
 from productos.serializers.producto import ProductoSerializer
+from productos.serializers.stock import AjusteStockLoteSerializer
 
 class ProductoViewSet(viewsets.ModelViewSet):
     """
@@ -25,15 +31,14 @@ class ProductoViewSet(viewsets.ModelViewSet):
     - Endpoints especiales
     """
     
-    queryset = Producto.objects.all().prefetch_related(
-        'variantes',
-    ).order_by('-fecha_creacion')
+    queryset = Producto.objects.all().para_listado().order_by('-fecha_creacion')
     serializer_class = ProductoSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
+    # La búsqueda va al final para ordenar por relevancia cuando no se pide ?ordering
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BusquedaProductosFilter]
     lookup_field = 'slug'
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
-    # Configuración de filtros y búsqueda
+    # Configuración de filtros y búsqueda (?search= usa productos/busqueda.py sobre estos campos)
     search_fields = ['nombre', 'descripcion_corta', 'descripcion_larga', 'sku']
     filterset_fields = {
         'estado': ['exact', 'in'],
@@ -55,9 +60,8 @@ class ProductoViewSet(viewsets.ModelViewSet):
         """
         Sobreescribe el queryset para incluir filtros personalizados y multi-tenancy
         """
-        queryset = Producto.objects.filter(usuario=self.request.user).prefetch_related(
-            'variantes',
-        ).order_by('-fecha_creacion')
+        # Stock calculado anotado y relaciones precargadas: consultas constantes por página
+        queryset = Producto.objects.filter(usuario=self.request.user).para_listado().order_by('-fecha_creacion')
         
         # Filtro para productos públicos
         if self.request.query_params.get('publicos') == 'true':
@@ -109,18 +113,6 @@ class ProductoViewSet(viewsets.ModelViewSet):
         try:
             imagen = request.FILES['imagen_principal']
             logger.info(f"[upload_imagen_principal] Nombre de archivo: {imagen.name}, tamaño: {imagen.size}, tipo: {imagen.content_type}")
-            # Validaciones de imagen
-            try:
-                img = Image.open(imagen)
-                img.verify()
-                img = Image.open(imagen)
-                logger.info(f"[upload_imagen_principal] Imagen verificada. Formato: {img.format}, tamaño: {img.size}")
-            except Exception as e:
-                logger.error(f"[upload_imagen_principal] El archivo no es una imagen válida: {e}")
-                return Response(
-                    {"error": "El archivo no es una imagen válida"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
             # Tamaño máximo 5MB
             if imagen.size > 5 * 1024 * 1024:
                 logger.error("[upload_imagen_principal] La imagen supera los 5MB")
@@ -128,37 +120,26 @@ class ProductoViewSet(viewsets.ModelViewSet):
                     {"error": "La imagen no puede superar los 5MB"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            # Eliminar imagen anterior si existe
-            if producto.imagen_principal:
-                logger.info("[upload_imagen_principal] Eliminando imagen anterior")
-                try:
-                    producto.imagen_principal.delete()
-                except PermissionError as e:
-                    logger.warning(f"[upload_imagen_principal] No se pudo eliminar imagen anterior inmediatamente: {e}")
-                    # Intentar de nuevo después de un breve retraso
-                    time.sleep(0.5)
-                    try:
-                        producto.imagen_principal.delete()
-                        logger.info("[upload_imagen_principal] Imagen anterior eliminada en segundo intento")
-                    except PermissionError as e2:
-                        logger.warning(f"[upload_imagen_principal] No se pudo eliminar imagen anterior: {e2}")
-                        # Continuar sin eliminar la imagen anterior
-                
-                if hasattr(producto, 'imagen_thumbnail') and producto.imagen_thumbnail:
-                    try:
-                        producto.imagen_thumbnail.delete()
-                    except PermissionError:
-                        logger.warning("[upload_imagen_principal] No se pudo eliminar thumbnail anterior")
-                        pass
-            # Generar nombre único para la imagen
+            # Validación sin decodificar la imagen; el procesamiento se hace en segundo plano
+            try:
+                formato = verificar_subida(imagen)
+                logger.info(f"[upload_imagen_principal] Imagen verificada. Formato: {formato}")
+            except ImagenDemasiadoGrande as e:
+                logger.error(f"[upload_imagen_principal] {e}")
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                logger.error(f"[upload_imagen_principal] El archivo no es una imagen válida: {e}")
+                return Response(
+                    {"error": "El archivo no es una imagen válida"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # La imagen anterior y sus rendiciones se eliminan al terminar el procesamiento
             ext = os.path.splitext(imagen.name)[1]
             new_filename = f"{uuid.uuid4().hex}{ext}"
-            # Asignar nueva imagen
-            producto.imagen_principal.save(new_filename, imagen, save=True)
-            logger.info(f"[upload_imagen_principal] Imagen guardada como: {new_filename}")
-            # Generar thumbnail
-            self._generate_thumbnail(producto)
-            logger.info("[upload_imagen_principal] Thumbnail generado")
+            with transaction.atomic():
+                producto.imagen_principal.save(new_filename, imagen, save=True)
+                encolar_imagen_producto(producto)
+            logger.info(f"[upload_imagen_principal] Imagen guardada como {new_filename}, procesamiento encolado")
             # Construir respuesta
             serializer = self.get_serializer(producto)
             response_data = serializer.data
@@ -167,10 +148,9 @@ class ProductoViewSet(viewsets.ModelViewSet):
                 response_data['imagen_principal_url'] = request.build_absolute_uri(
                     producto.imagen_principal.url
                 )
-            logger.info(f"[upload_imagen_principal] Respuesta exitosa: {response_data}")
             return Response(
                 response_data,
-                status=status.HTTP_200_OK
+                status=status.HTTP_202_ACCEPTED
             )
         except Exception as e:
             logger.error(f"[upload_imagen_principal] Error inesperado: {e}", exc_info=True)
@@ -193,16 +173,10 @@ class ProductoViewSet(viewsets.ModelViewSet):
             )
             
         try:
-            # Eliminar archivos físicos
-            producto.imagen_principal.delete()
-            if hasattr(producto, 'imagen_thumbnail') and producto.imagen_thumbnail:
-                producto.imagen_thumbnail.delete()
-            
-            # Actualizar modelo
-            producto.imagen_principal = None
-            if hasattr(producto, 'imagen_thumbnail'):
-                producto.imagen_thumbnail = None
-            producto.save()
+            # Liberar los archivos (se eliminan si ningún otro objeto los usa) y actualizar el modelo
+            with transaction.atomic():
+                eliminar_imagen_producto(producto)
+                producto.save()
             
             return Response(
                 {"success": "Imagen eliminada correctamente"},
@@ -241,9 +215,11 @@ class ProductoViewSet(viewsets.ModelViewSet):
                 'ultima_modificacion': producto.fecha_actualizacion
             }
             
-            if hasattr(producto, 'imagen_thumbnail') and producto.imagen_thumbnail:
+            response_data['estado_procesamiento'] = producto.imagen_estado
+            miniatura = (producto.imagen_rendiciones or {}).get('miniatura')
+            if miniatura:
                 response_data['thumbnail_url'] = request.build_absolute_uri(
-                    producto.imagen_thumbnail.url
+                    producto.imagen_principal.storage.url(miniatura)
                 )
             
             return Response(response_data)
@@ -317,6 +293,25 @@ class ProductoViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    @action(detail=False, methods=['POST'], parser_classes=[JSONParser])
+    def ajustar_stock(self, request):
+        """
+        Ajuste masivo de stock de colores y variantes (p. ej. un conteo de inventario).
+        Body: {"ajustes": [{"color": 12, "stock": 30}, {"variante": 7, "delta": -2}, ...]}
+        Se aplica todo o nada; la respuesta trae el resultado de cada línea.
+        """
+        serializer = AjusteStockLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        aplicado, resultados = ajustar_stock_lote(request.user, serializer.validated_data['ajustes'])
+        return Response(
+            {
+                'aplicado': aplicado,
+                'productos_actualizados': len({r['producto'] for r in resultados if r['ok']}) if aplicado else 0,
+                'resultados': resultados,
+            },
+            status=status.HTTP_200_OK if aplicado else status.HTTP_400_BAD_REQUEST
+        )
+
     @action(detail=False, methods=['GET'])
     def destacados(self, request):
         """
@@ -383,10 +378,6 @@ class ProductoViewSet(viewsets.ModelViewSet):
             # Usar perform_create para asignar el usuario correctamente
             producto = self.perform_create(serializer)
             
-            # Generar thumbnail si se subió imagen
-            if 'imagen_principal' in request.FILES:
-                self._generate_thumbnail(producto)
-            
             # Construir respuesta
             response_data = self.get_serializer(producto).data
             if producto.imagen_principal:
@@ -425,10 +416,6 @@ class ProductoViewSet(viewsets.ModelViewSet):
         try:
             producto = serializer.save()
             
-            # Regenerar thumbnail si se actualizó la imagen
-            if 'imagen_principal' in request.FILES:
-                self._generate_thumbnail(producto)
-            
             # Construir respuesta
             response_data = self.get_serializer(producto).data
             if producto.imagen_principal:
@@ -448,66 +435,46 @@ class ProductoViewSet(viewsets.ModelViewSet):
         Elimina un producto y sus archivos asociados
         """
         try:
-            # Eliminar imagen principal si existe
-            if instance.imagen_principal:
-                instance.imagen_principal.delete()
-                print(f"✅ Imagen principal eliminada para producto: {instance.nombre}")
-            
-            # Eliminar thumbnail si existe
-            if hasattr(instance, 'imagen_thumbnail') and instance.imagen_thumbnail:
-                instance.imagen_thumbnail.delete()
-                print(f"✅ Thumbnail eliminado para producto: {instance.nombre}")
-            
-            # Eliminar el producto
-            instance.delete()
+            with transaction.atomic():
+                # Liberar imagen principal y rendiciones (se eliminan si ningún otro objeto las usa)
+                if instance.imagen_principal or instance.imagen_rendiciones:
+                    eliminar_imagen_producto(instance)
+                    print(f"✅ Imagen principal liberada para producto: {instance.nombre}")
+                
+                # Eliminar el producto
+                instance.delete()
             print(f"✅ Producto eliminado exitosamente: {instance.nombre}")
             
         except Exception as e:
             print(f"❌ Error eliminando producto {instance.nombre}: {str(e)}")
             raise e
 
-    def _generate_thumbnail(self, producto):
+    @action(detail=True, methods=['GET'])
+    def historial_stock(self, request, slug=None):
         """
-        Genera un thumbnail de 300x300px para la imagen principal
+        Stock de cada color y variante según el libro de movimientos y los últimos 50 movimientos.
+        Parámetro opcional: fecha (AAAA-MM-DD o fecha y hora ISO) para consultar el stock en ese momento;
+        una fecha sin hora se toma al final del día.
         """
-        if not producto.imagen_principal:
-            return
-            
-        try:
-            # Abrir imagen original
-            img = Image.open(producto.imagen_principal)
-            
-            # Convertir a RGB si es necesario
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            
-            # Redimensionar manteniendo relación de aspecto
-            img.thumbnail((300, 300))
-            
-            # Guardar en buffer
-            thumb_io = BytesIO()
-            img.save(thumb_io, format='JPEG', quality=85)
-            thumb_io.seek(0)
-            
-            # Guardar thumbnail si el modelo tiene el campo
-            if hasattr(producto, 'imagen_thumbnail'):
-                # Eliminar thumbnail anterior si existe
-                if producto.imagen_thumbnail:
-                    producto.imagen_thumbnail.delete()
-                
-                # Guardar nuevo thumbnail
-                thumb_name = f"thumb_{uuid.uuid4().hex}.jpg"
-                producto.imagen_thumbnail.save(
-                    thumb_name,
-                    ContentFile(thumb_io.getvalue()),
-                    save=False
+        producto = self.get_object()
+        fecha = None
+        if request.query_params.get('fecha'):
+            fecha = _fecha_de_consulta(request.query_params['fecha'])
+            if fecha is None:
+                return Response(
+                    {'error': 'Fecha inválida, use AAAA-MM-DD o una fecha y hora ISO'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                producto.save()
-                
-        except Exception as e:
-            print(f"[ERROR] No se pudo generar thumbnail: {str(e)}")
+        movimientos = producto.movimientos_stock.all()
+        if fecha:
+            movimientos = movimientos.filter(fecha__lte=fecha)
+        return Response({
+            'fecha': fecha or timezone.now(),
+            'filas': stock_de_producto(producto, fecha),
+            'movimientos': list(movimientos.values(
+                'id', 'tipo', 'fila', 'color_id', 'variante_id', 'sku', 'descripcion', 'stock', 'reservado', 'referencia', 'fecha'
+            )[:50]),
+        })
 
     @action(detail=True, methods=['POST'])
     def forzar_actualizar_stock(self, request, slug=None):
@@ -547,4 +514,20 @@ class ProductoViewSet(viewsets.ModelViewSet):
             raise Exception("Usuario no autenticado")
         
         print(f"✅ Usuario autenticado: {self.request.user.username} (ID: {self.request.user.id})")
-        return serializer.save(usuario=self.request.user)
\ No newline at end of file
+        return serializer.save(usuario=self.request.user)
+
+
+def _fecha_de_consulta(valor):
+    """Fecha y hora de una consulta (?fecha=); una fecha sola es el final de ese día. None si es inválida"""
+    try:
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            dia = parse_date(valor)
+            if dia is None:
+                return None
+            fecha = datetime.combine(dia, time.max)
+    except ValueError:
+        return None
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
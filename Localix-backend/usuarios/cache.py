@@ -0,0 +1,67 @@
+"""
+Caché del estado del plan de uso para el middleware de verificación
+
+UserUsagePlan.save() y delete() invalidan la entrada del usuario, pero solo
+en el backend de caché del proceso que guarda. Con la caché por defecto
+(LocMemCache, una por proceso) un plan extendido desde otro worker, la shell
+o un comando de gestión no se ve en los demás procesos hasta que la entrada
+caduca. En producción con varios workers se requiere un backend compartido
+en CACHES['default']; Backend/settings_production.py usa la caché de base
+de datos (DatabaseCache).
+
+Por eso solo los planes vigentes con fecha de expiración se cachean hasta
+esa fecha (como máximo PLAN_CACHE_TIMEOUT_MAXIMO); los expirados y los que
+no tienen fecha se cachean poco tiempo (PLAN_CACHE_TIMEOUT_CORTO), de modo
+que una extensión bloquea al usuario como mucho unos minutos.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# Tiempo máximo que se conserva la entrada de un plan vigente
+PLAN_CACHE_TIMEOUT_MAXIMO = 60 * 60 * 24
+
+# Tiempo que se conserva la entrada de un plan expirado o sin fecha de expiración
+PLAN_CACHE_TIMEOUT_CORTO = getattr(settings, 'PLAN_CACHE_TIMEOUT_CORTO', 60 * 5)
+
+
+def _cache_key(user_id):
+    return f"usage_plan:{user_id}"
+
+
+def _timeout(end_date):
+    """Segundos que se conserva la entrada de un plan con esta fecha de expiración"""
+    if not end_date:
+        return PLAN_CACHE_TIMEOUT_CORTO
+    restante = (end_date - timezone.now()).total_seconds()
+    if restante <= 0:
+        return PLAN_CACHE_TIMEOUT_CORTO
+    return min(PLAN_CACHE_TIMEOUT_MAXIMO, max(1, int(restante)))
+
+
+def guardar_estado_plan(plan):
+    """
+    Guarda en caché la fecha de expiración del plan.
+    La entrada de un plan vigente caduca justo en end_date, de modo que la
+    siguiente petición vuelve a consultar la base de datos y detecta la expiración.
+    """
+    cache.set(_cache_key(plan.user_id), {'end_date': plan.end_date}, _timeout(plan.end_date))
+
+
+def obtener_estado_plan(user_id):
+    """Retorna el estado cacheado del plan o None si no está en caché"""
+    return cache.get(_cache_key(user_id))
+
+
+def plan_expirado(estado):
+    """Verifica si el estado cacheado corresponde a un plan expirado"""
+    end_date = estado.get('end_date')
+    if not end_date:
+        return False
+    return timezone.now() > end_date
+
+
+def invalidar_estado_plan(user_id):
+    """Elimina la entrada de caché del plan del usuario"""
+    cache.delete(_cache_key(user_id))
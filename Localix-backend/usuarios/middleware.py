@@ -3,6 +3,7 @@ from django.contrib import messages
 from django.urls import reverse
 from django.utils import timezone
 from .models import UserUsagePlan
+from .cache import obtener_estado_plan, guardar_estado_plan, plan_expirado
 
 class UserUsageMiddleware:
     def __init__(self, get_response):
@@ -38,9 +39,17 @@ class UserUsageMiddleware:
         if request.user.is_superuser:
             return self.get_response(request)
         
+        # Consultar primero el estado cacheado del plan (sin tráfico a la base de datos)
+        estado = obtener_estado_plan(request.user.pk)
+        if estado is not None:
+            if plan_expirado(estado):
+                return redirect('usuarios:usage_expired')
+            return self.get_response(request)
+        
         # Solo verificar si el plan está expirado, no bloquear por otros motivos
         try:
             usage_plan = UserUsagePlan.objects.get(user=request.user)
+            guardar_estado_plan(usage_plan)
             
             # Solo bloquear si el plan está realmente expirado
             if usage_plan.is_expired:
@@ -50,7 +59,7 @@ class UserUsageMiddleware:
         except UserUsagePlan.DoesNotExist:
             # Si no hay plan, crear uno por defecto
             if request.user.is_superuser:
-                UserUsagePlan.objects.create(
+                usage_plan = UserUsagePlan.objects.create(
                     user=request.user,
                     plan_type='premium',
                     days_allowed=3650,
@@ -59,7 +68,7 @@ class UserUsageMiddleware:
                     is_active=True
                 )
             else:
-                UserUsagePlan.objects.create(
+                usage_plan = UserUsagePlan.objects.create(
                     user=request.user,
                     plan_type='trial',
                     days_allowed=15,
@@ -67,5 +76,6 @@ class UserUsageMiddleware:
                     end_date=timezone.now() + timezone.timedelta(days=15),
                     is_active=True
                 )
+            guardar_estado_plan(usage_plan)
         
         return self.get_response(request)
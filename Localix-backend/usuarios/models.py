@@ -4,6 +4,7 @@ from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from .cache import invalidar_estado_plan
 
 class Usuario(AbstractUser):
     ROLES = [
@@ -71,6 +72,14 @@ class UserUsagePlan(models.Model):
                 self.start_date = timezone.now()
             self.end_date = self.start_date + timedelta(days=self.days_allowed)
         super().save(*args, **kwargs)
+        # Invalidar el estado cacheado usado por UserUsageMiddleware
+        invalidar_estado_plan(self.user_id)
+    
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        result = super().delete(*args, **kwargs)
+        invalidar_estado_plan(user_id)
+        return result
     
     @property
     def is_expired(self):
@@ -104,7 +113,7 @@ class UserUsagePlan(models.Model):
         """Extiende el plan con días adicionales"""
         self.days_allowed += additional_days
         self.end_date += timedelta(days=additional_days)
-        self.save()
+        self.save()  # save() invalida la caché del plan
     
     def reset_plan(self, new_days):
         """Reinicia el plan con nuevos días"""
@@ -112,7 +121,7 @@ class UserUsagePlan(models.Model):
         self.start_date = timezone.now()
         self.end_date = self.start_date + timedelta(days=new_days)
         self.is_active = True
-        self.save()
+        self.save()  # save() invalida la caché del plan
     
     def __str__(self):
         return f"{self.user.username} - {self.plan_type} ({self.days_remaining} días restantes)"
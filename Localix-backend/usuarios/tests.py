@@ -0,0 +1,79 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from usuarios import cache as cache_plan
+from usuarios.middleware import UserUsageMiddleware
+from usuarios.models import Usuario, UserUsagePlan
+
+
+class EstadoPlanCacheTest(TestCase):
+    """El middleware usa el estado cacheado del plan y la caché sigue los cambios del plan"""
+
+    URL = '/api/ventas/clientes/'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.plan = UserUsagePlan.objects.create(
+            user=self.usuario, plan_type='basic', days_allowed=30,
+            end_date=timezone.now() + timedelta(days=30)
+        )
+        self.middleware = UserUsageMiddleware(lambda request: HttpResponse('ok'))
+
+    def _peticion(self):
+        request = RequestFactory().get(self.URL)
+        request.user = self.usuario
+        return self.middleware(request)
+
+    def test_cache_hit_sin_consultas(self):
+        self.assertEqual(self._peticion().status_code, 200)
+        self.assertIsNotNone(cache_plan.obtener_estado_plan(self.usuario.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual(self._peticion().status_code, 200)
+
+    def test_expira_en_end_date(self):
+        with mock.patch.object(cache_plan.cache, 'set', wraps=cache_plan.cache.set) as guardar:
+            self._peticion()
+        timeout = guardar.call_args.args[2]
+        # La entrada de un plan vigente dura hasta end_date (acotado al máximo)
+        self.assertEqual(timeout, cache_plan.PLAN_CACHE_TIMEOUT_MAXIMO)
+
+        self.plan.end_date = timezone.now() + timedelta(minutes=10)
+        self.plan.save()
+        with mock.patch.object(cache_plan.cache, 'set', wraps=cache_plan.cache.set) as guardar:
+            self._peticion()
+        self.assertTrue(590 <= guardar.call_args.args[2] <= 600)
+
+        # Pasada la fecha, el estado cacheado ya bloquea sin consultar la base de datos
+        despues = self.plan.end_date + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=despues), self.assertNumQueries(0):
+            respuesta = self._peticion()
+        self.assertEqual(respuesta.status_code, 302)
+
+    def test_plan_expirado_se_cachea_poco_tiempo(self):
+        self.plan.end_date = timezone.now() - timedelta(days=1)
+        self.plan.save()
+        with mock.patch.object(cache_plan.cache, 'set', wraps=cache_plan.cache.set) as guardar:
+            self.assertEqual(self._peticion().status_code, 302)
+        self.assertEqual(guardar.call_args.args[2], cache_plan.PLAN_CACHE_TIMEOUT_CORTO)
+
+    def test_invalidacion_al_guardar_y_eliminar(self):
+        self.plan.end_date = timezone.now() - timedelta(days=1)
+        self.plan.save()
+        self.assertEqual(self._peticion().status_code, 302)
+
+        # Extender el plan invalida la entrada: la siguiente petición ya pasa
+        self.plan.end_date = timezone.now() + timedelta(days=30)
+        self.plan.save()
+        self.assertIsNone(cache_plan.obtener_estado_plan(self.usuario.pk))
+        self.assertEqual(self._peticion().status_code, 200)
+        self.assertIsNotNone(cache_plan.obtener_estado_plan(self.usuario.pk))
+
+        self.plan.delete()
+        self.assertIsNone(cache_plan.obtener_estado_plan(self.usuario.pk))
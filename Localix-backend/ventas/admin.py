@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Sum, Count
 from django.utils.translation import gettext_lazy as _
 from .models import Cliente, Venta, ItemVenta
 
@@ -35,7 +34,9 @@ class ClienteAdmin(admin.ModelAdmin):
     readonly_fields = [
         'fecha_registro',
         'total_ventas',
-        'monto_total_compras'
+        'monto_total_compras',
+        'primera_compra',
+        'ultima_compra'
     ]
     
     fieldsets = (
@@ -56,7 +57,7 @@ class ClienteAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Información del Sistema', {
-            'fields': ('fecha_registro', 'total_ventas', 'monto_total_compras'),
+            'fields': ('fecha_registro', 'total_ventas', 'monto_total_compras', 'primera_compra', 'ultima_compra'),
             'classes': ('collapse',)
         }),
     )
@@ -91,23 +92,23 @@ class ClienteAdmin(admin.ModelAdmin):
         return obj.usuario == request.user
     
     def total_ventas(self, obj):
-        """Muestra el total de ventas del cliente"""
-        count = obj.ventas.count()
+        """Muestra las ventas completadas del cliente (guardadas en el cliente)"""
         return format_html(
             '<span style="color: {};">{}</span>',
-            'green' if count > 0 else 'gray',
-            count
+            'green' if obj.compras > 0 else 'gray',
+            obj.compras
         )
     total_ventas.short_description = 'Total Ventas'
+    total_ventas.admin_order_field = 'compras'
     
     def monto_total_compras(self, obj):
-        """Muestra el monto total de compras del cliente"""
-        total = obj.ventas.aggregate(total=Sum('total'))['total'] or 0
+        """Muestra el monto total de compras del cliente (guardado en el cliente)"""
         return format_html(
             '<span style="color: green; font-weight: bold;">S/ {}</span>',
-            f"{float(total):.2f}"
+            f"{float(obj.total_gastado):.2f}"
         )
     monto_total_compras.short_description = 'Total Compras'
+    monto_total_compras.admin_order_field = 'total_gastado'
 
 class ItemVentaInline(admin.TabularInline):
     model = ItemVenta
@@ -0,0 +1,146 @@
+"""
+Búsqueda de clientes por nombre, email, teléfono y documento
+
+Cliente guarda columnas normalizadas que se mantienen en Cliente.save():
+texto_busqueda (términos de nombre y email, en minúsculas y sin acentos),
+telefono_normalizado (solo dígitos), telefono_invertido (los mismos dígitos
+al revés) y documento_normalizado (solo letras y dígitos, en minúsculas).
+
+El teléfono se busca por el principio o por el final del número: el final
+es un prefijo de telefono_invertido. Así el número local '987 654 321'
+encuentra '+51 987-654-321' y 'ana maria' encuentra 'Ana María'.
+
+- PostgreSQL: texto_busqueda tiene un índice de trigramas (pg_trgm) que
+  resuelve las subcadenas y los nombres con errores de tipeo (similitud por
+  palabra); las columnas de teléfono y el documento tienen índices B-tree
+  (usuario, columna) con text_pattern_ops para buscar por prefijo.
+- Otros motores (SQLite en tests): los términos se buscan como subcadenas
+  y el teléfono y el documento por prefijo.
+
+Los resultados se ordenan por relevancia: documento o teléfono exacto,
+luego por prefijo (o final del teléfono), luego nombres que empiezan por el
+texto buscado.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, Func, Q, Value, When
+
+from productos.busqueda import terminos
+
+_NO_DIGITO = re.compile(r'\D+')
+
+# Dígitos mínimos para buscar por teléfono (evita que '9' coincida con todos)
+MIN_DIGITOS = 3
+
+# Dígitos mínimos en común para considerar el mismo teléfono con y sin
+# código de país ('987111222' y '+51 987111222')
+MIN_DIGITOS_DUPLICADO = 7
+
+
+def normalizar_telefono(telefono):
+    """Solo los dígitos: '+51 987-654-321' -> '51987654321'"""
+    return _NO_DIGITO.sub('', str(telefono or ''))
+
+
+def normalizar_documento(documento):
+    """Solo letras y dígitos en minúsculas: '20.123.456-K' -> '20123456k'"""
+    return ''.join(terminos(documento))
+
+
+def texto_busqueda_cliente(cliente):
+    """Contenido de Cliente.texto_busqueda"""
+    return ' '.join(terminos(cliente.nombre) + terminos(cliente.email))
+
+
+def normalizar_cliente(cliente):
+    """Actualiza las columnas de búsqueda del cliente (sin guardar)"""
+    cliente.texto_busqueda = texto_busqueda_cliente(cliente)
+    cliente.telefono_normalizado = normalizar_telefono(cliente.telefono)
+    cliente.telefono_invertido = cliente.telefono_normalizado[::-1]
+    cliente.documento_normalizado = normalizar_documento(cliente.numero_documento)
+
+
+class _PalabraSimilar(Func):
+    """
+    'texto' <% columna (pg_trgm): el texto se parece a alguna parte de la
+    columna. Aprovecha los índices gin_trgm_ops; el umbral es
+    pg_trgm.word_similarity_threshold (0.6 por defecto).
+    """
+    arg_joiner = ' <%% '
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+
+def _telefono_parecido(digitos):
+    """El teléfono empieza o termina por `digitos`"""
+    return Q(telefono_normalizado__startswith=digitos) | Q(telefono_invertido__startswith=digitos[::-1])
+
+
+def _relevancia(consulta, digitos, documento):
+    casos = [When(documento_normalizado=documento, then=Value(6.0))]
+    if digitos:
+        casos.append(When(telefono_normalizado=digitos, then=Value(5.0)))
+    casos.append(When(documento_normalizado__startswith=documento, then=Value(4.0)))
+    if digitos:
+        casos.append(When(_telefono_parecido(digitos), then=Value(3.0)))
+    casos.append(When(texto_busqueda__startswith=consulta, then=Value(2.0)))
+    # En PostgreSQL se suma la similitud por trigramas (entre 0 y 1) para desempatar
+    return Case(*casos, default=Value(1.0), output_field=FloatField())
+
+
+def buscar_clientes(queryset, texto):
+    """
+    Filtra un queryset de clientes por el texto buscado y lo ordena por
+    relevancia (anotada como `relevancia`).
+    """
+    lista_terminos = terminos((texto or '').strip())
+    if not lista_terminos:
+        return queryset.none()
+    consulta = ' '.join(lista_terminos)
+    documento = ''.join(lista_terminos)
+    digitos = normalizar_telefono(texto)
+    if len(digitos) < MIN_DIGITOS:
+        digitos = ''
+
+    por_texto = Q()
+    for termino in lista_terminos:
+        por_texto &= Q(texto_busqueda__contains=termino)
+    condiciones = por_texto | Q(documento_normalizado__startswith=documento)
+    if digitos:
+        condiciones |= _telefono_parecido(digitos)
+    relevancia = _relevancia(consulta, digitos, documento)
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        condiciones |= Q(_PalabraSimilar(Value(consulta), F('texto_busqueda')))
+        relevancia = relevancia + TrigramWordSimilarity(consulta, 'texto_busqueda')
+
+    return queryset.filter(condiciones).annotate(relevancia=relevancia).order_by('-relevancia', 'nombre', '-id')
+
+
+def buscar_duplicado(queryset, datos):
+    """
+    Cliente ya registrado con los mismos datos: el mismo documento o el
+    mismo teléfono y nombre. Un teléfono con código de país y el mismo sin
+    él cuentan como el mismo teléfono. Retorna None si no hay ninguno.
+    """
+    documento = normalizar_documento(datos.get('numero_documento'))
+    if documento:
+        cliente = queryset.filter(documento_normalizado=documento).order_by('pk').first()
+        if cliente is not None:
+            return cliente
+    telefono = normalizar_telefono(datos.get('telefono'))
+    nombre = ' '.join(terminos(datos.get('nombre')))
+    if telefono and nombre:
+        mismo_nombre = Q(texto_busqueda=nombre) | Q(texto_busqueda__startswith=f'{nombre} ')
+        mismo_telefono = Q(telefono_normalizado=telefono)
+        if len(telefono) >= MIN_DIGITOS_DUPLICADO:
+            # El guardado termina por el nuevo o el nuevo termina por el guardado
+            mismo_telefono |= Q(telefono_invertido__startswith=telefono[::-1]) | Q(
+                telefono_normalizado__in=[telefono[i:] for i in range(1, len(telefono) - MIN_DIGITOS_DUPLICADO + 1)]
+            )
+        return queryset.filter(mismo_nombre, mismo_telefono).order_by('pk').first()
+    return None
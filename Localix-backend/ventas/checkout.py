@@ -0,0 +1,205 @@
+"""
+Motor de checkout por lotes para ventas rápidas.
+
+Resuelve productos, variantes y colores con una consulta por modelo, inserta
+los items con bulk_create, aplica los descuentos de stock con un UPDATE por
+tabla y calcula los totales de la venta una sola vez, de modo que el costo
+en consultas de una venta no depende de la cantidad de líneas.
+"""
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from productos.catalogo import invalidar_catalogo
+from productos.inventario import descontar_stock_lote
+from productos.movimientos import movimiento, registrar
+from productos.models import Producto, VarianteProducto, ColorProducto
+from . import rollup
+from .models import ItemVenta
+
+
+class CheckoutError(ValueError):
+    """Error de validación de los items de una venta"""
+
+
+def _parsear_cantidad(item_data):
+    try:
+        cantidad = int(item_data.get('cantidad'))
+    except (TypeError, ValueError):
+        raise CheckoutError('Cantidad inválida en un item')
+    if cantidad < 1:
+        raise CheckoutError('La cantidad de cada item debe ser al menos 1')
+    return cantidad
+
+
+def _parsear_descuento(item_data):
+    try:
+        return Decimal(str(item_data.get('descuento_item', 0) or 0))
+    except InvalidOperation:
+        raise CheckoutError('Descuento inválido en un item')
+
+
+def crear_items_venta(venta, items_data):
+    """
+    Crea los items de la venta y descuenta el stock por lotes.
+    Debe ejecutarse dentro de transaction.atomic(): ante cualquier error se
+    lanza CheckoutError y la transacción completa se revierte.
+    Retorna la lista de ItemVenta creados.
+    """
+    if not items_data or not isinstance(items_data, list):
+        raise CheckoutError('La venta debe tener al menos un item')
+
+    # ✅ Normalizar los ids y validar que no haya productos duplicados
+    lineas = []
+    claves = set()
+    for item_data in items_data:
+        if not item_data.get('producto_id'):
+            raise CheckoutError('Falta producto_id en un item')
+        producto_pk = _pk(item_data['producto_id'])
+        if producto_pk is None:
+            raise CheckoutError(f"Id de producto inválido: {item_data['producto_id']}")
+        variante_pk = None
+        if item_data.get('variante_id'):
+            variante_pk = _pk(item_data['variante_id'])
+            if variante_pk is None:
+                raise CheckoutError(f"Id de variante inválido: {item_data['variante_id']}")
+        color_pk = None
+        if item_data.get('color_id'):
+            color_pk = _pk(item_data['color_id'])
+            if color_pk is None:
+                raise CheckoutError(f"Id de color inválido: {item_data['color_id']}")
+        clave = (producto_pk, variante_pk, color_pk)
+        if clave in claves:
+            raise CheckoutError('Producto duplicado detectado. Cada combinación de producto, variante y color debe ser única.')
+        claves.add(clave)
+        lineas.append((item_data, *clave))
+
+    # Resolver todas las referencias con una consulta por modelo, solo entre los productos del dueño de la venta
+    producto_ids = {producto_pk for _, producto_pk, _, _ in lineas}
+    variante_ids = {variante_pk for _, _, variante_pk, _ in lineas if variante_pk}
+    productos = Producto.objects.filter(usuario_id=venta.usuario_id).in_bulk(producto_ids)
+    variantes = (
+        VarianteProducto.objects.filter(producto__usuario_id=venta.usuario_id).in_bulk(variante_ids)
+        if variante_ids else {}
+    )
+    colores_activos = ColorProducto.objects.filter(producto_id__in=list(productos), activo=True).in_bulk()
+    colores_por_producto = defaultdict(list)
+    for color in colores_activos.values():
+        colores_por_producto[color.producto_id].append(color)
+
+    items = []
+    descuento_colores = defaultdict(int)
+    descuento_variantes = defaultdict(int)
+    descuento_productos = defaultdict(int)
+    vendidos = defaultdict(int)
+
+    for item_data, producto_pk, variante_pk, color_pk in lineas:
+        producto = productos.get(producto_pk)
+        if producto is None:
+            raise CheckoutError(f'Producto con id {producto_pk} no existe')
+        cantidad = _parsear_cantidad(item_data)
+
+        variante = None
+        if variante_pk:
+            variante = variantes.get(variante_pk)
+            if variante is None or variante.producto_id != producto.pk:
+                raise CheckoutError(f'La variante con id {variante_pk} no existe o no pertenece al producto "{producto.nombre}"')
+
+        # ✅ Manejar color específico
+        color = None
+        colores_producto = colores_por_producto.get(producto.pk, [])
+        if colores_producto:
+            # Si el producto tiene colores, es obligatorio especificar uno
+            if not color_pk:
+                colores_disponibles = [f"{c.nombre} (Stock: {c.stock})" for c in colores_producto]
+                raise CheckoutError(
+                    f'El producto "{producto.nombre}" tiene colores configurados. Debe seleccionar un color específico. '
+                    f'Colores disponibles: {", ".join(colores_disponibles)}'
+                )
+            color = colores_activos.get(color_pk)
+            if color is None or color.producto_id != producto.pk:
+                raise CheckoutError(f'El color seleccionado no existe o no está disponible para el producto "{producto.nombre}"')
+            if color.stock < cantidad:
+                raise CheckoutError(
+                    f'Stock insuficiente para el color "{color.nombre}" del producto "{producto.nombre}". '
+                    f'Disponible: {color.stock}, Solicitado: {cantidad}'
+                )
+        elif color_pk:
+            # Si el producto no tiene colores pero se especificó uno, es un error
+            raise CheckoutError(f'El producto "{producto.nombre}" no tiene colores configurados, pero se especificó un color')
+
+        # Acumular los movimientos de stock por tabla
+        if producto.gestion_stock:
+            if color:
+                descuento_colores[color.pk] += cantidad
+            elif variante:
+                descuento_variantes[variante.pk] += cantidad
+            else:
+                descuento_productos[producto.pk] += cantidad
+            vendidos[producto.pk] += cantidad
+
+        item = ItemVenta(
+            venta=venta,
+            producto=producto,
+            variante=variante,
+            color=color,
+            cantidad=cantidad,
+            descuento_item=_parsear_descuento(item_data),
+            costo_unitario=producto.costo
+        )
+        item.calcular_subtotal()
+        items.append(item)
+
+    _validar_stock_variantes_y_productos(descuento_variantes, variantes, descuento_productos, productos)
+
+    ItemVenta.objects.bulk_create(items)
+
+    # Un UPDATE condicional por tabla; si otra venta consumió el stock entretanto, se revierte todo
+    if not descontar_stock_lote(ColorProducto, descuento_colores):
+        raise CheckoutError('Stock insuficiente para uno de los colores: el stock cambió durante la venta')
+    if not descontar_stock_lote(VarianteProducto, descuento_variantes):
+        raise CheckoutError('Stock insuficiente para una de las variantes: el stock cambió durante la venta')
+    if not descontar_stock_lote(Producto, descuento_productos, vendidos=vendidos):
+        raise CheckoutError('Stock insuficiente para uno de los productos: el stock cambió durante la venta')
+    # Los movimientos de todas las líneas se registran en el libro con un solo INSERT
+    registrar(
+        movimiento('venta', item.producto.pk, item.color_id, item.variante_id, stock=-item.cantidad, referencia=f'venta:{venta.pk}')
+        for item in items if item.producto.gestion_stock
+    )
+
+    con_desglose = set()
+    for item in items:
+        if item.producto.pk in vendidos and (item.color or item.variante):
+            con_desglose.add(item.producto.pk)
+    if con_desglose:
+        Producto.objects.filter(pk__in=con_desglose).actualizar_stock_total()
+    # El stock vendido cambia el catálogo cacheado de los dueños de los productos
+    for usuario_id in {productos[producto_id].usuario_id for producto_id in vendidos}:
+        invalidar_catalogo(usuario_id)
+
+    # Calcular totales una sola vez
+    venta.establecer_totales(sum((item.subtotal for item in items), Decimal('0.00')))
+    # bulk_create no pasa por ItemVenta.save, el resumen diario se actualiza aquí
+    if venta.cuenta_en_resumen:
+        rollup.registrar_items(venta, items)
+    return items
+
+
+def _validar_stock_variantes_y_productos(descuento_variantes, variantes, descuento_productos, productos):
+    """Valida con los datos ya cargados para devolver mensajes claros antes de escribir"""
+    for variante_id, cantidad in descuento_variantes.items():
+        variante = variantes[variante_id]
+        if variante.stock < cantidad:
+            raise CheckoutError(f"Stock insuficiente para la variante {variante.nombre}. Disponible: {variante.stock}, Solicitado: {cantidad}")
+    for producto_id, cantidad in descuento_productos.items():
+        producto = productos[producto_id]
+        if producto.stock < cantidad:
+            raise CheckoutError(f"Stock insuficiente para el producto {producto.nombre}. Disponible: {producto.stock}, Solicitado: {cantidad}")
+
+
+def _pk(valor):
+    """Normaliza un id recibido en el JSON (int o str) a entero"""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
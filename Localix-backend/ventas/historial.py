@@ -0,0 +1,115 @@
+"""
+Historial de compras de los clientes
+
+Las estadísticas de compra de cada cliente (compras, total gastado, primera
+y última compra) se guardan en el propio Cliente. Cuando una venta entra o
+sale del estado completada, cambia su total o su cliente, o se elimina, se
+recalculan con un único UPDATE por subconsultas sobre las ventas de esos
+clientes: el costo depende de las ventas de un cliente, no de toda la
+tienda, y el historial no necesita recorrerlas para mostrarlas.
+
+El historial se pagina por cursor sobre (fecha_venta, id), de modo que la
+página cincuenta de un cliente frecuente cuesta lo mismo que la primera.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Max, Min, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework.pagination import CursorPagination
+
+from .rollup import ESTADO_CONTABLE
+
+CENTAVO = Decimal('0.01')
+
+
+class HistorialVentasCursorPagination(CursorPagination):
+    """Paginación por cursor del historial de un cliente, de la venta más reciente a la más antigua"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-fecha_venta', '-id')
+
+
+def _por_cliente(ventas, expresion):
+    """Subconsulta con el valor de `expresion` sobre las ventas completadas del cliente externo"""
+    return Subquery(
+        ventas.filter(cliente_id=OuterRef('pk'), estado=ESTADO_CONTABLE)
+        .order_by().values('cliente_id').annotate(valor=expresion).values('valor')[:1]
+    )
+
+
+def actualizar_estadisticas(clientes):
+    """
+    Recalcula las estadísticas de compra de un queryset de clientes (o de
+    una lista de ids) con un único UPDATE. Retorna los clientes actualizados.
+    """
+    from .models import Cliente, Venta
+
+    if not isinstance(clientes, QuerySet):
+        ids = {pk for pk in clientes if pk}
+        if not ids:
+            return 0
+        clientes = Cliente.objects.filter(pk__in=ids)
+    ventas = Venta.objects.all()
+    return clientes.update(
+        compras=Coalesce(_por_cliente(ventas, Count('id')), Value(0)),
+        total_gastado=Coalesce(
+            _por_cliente(ventas, Sum('total')), Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+        primera_compra=_por_cliente(ventas, Min('fecha_venta')),
+        ultima_compra=_por_cliente(ventas, Max('fecha_venta')),
+    )
+
+
+def estadisticas(cliente):
+    """Estadísticas de compra guardadas en el cliente, con el ticket promedio"""
+    ticket_promedio = (cliente.total_gastado / cliente.compras).quantize(CENTAVO) if cliente.compras else Decimal('0.00')
+    return {
+        'compras': cliente.compras,
+        'total_gastado': str(cliente.total_gastado),
+        'ticket_promedio': str(ticket_promedio),
+        'primera_compra': cliente.primera_compra,
+        'ultima_compra': cliente.ultima_compra,
+    }
+
+
+def venta_de_historial(venta, request=None):
+    """Venta con sus items tal como la muestra el historial del cliente"""
+    items = []
+    for item in venta.items.all():
+        imagen_url = None
+        if item.producto.imagen_principal:
+            imagen_url = item.producto.imagen_principal.url
+            if request is not None:
+                imagen_url = request.build_absolute_uri(imagen_url)
+
+        item_info = {
+            'producto_id': item.producto.id,
+            'producto_nombre': item.producto.nombre,
+            'producto_sku': item.producto.sku,
+            'producto_imagen_url': imagen_url,
+            'cantidad': item.cantidad,
+            'precio_unitario': str(item.precio_unitario),
+            'subtotal': str(item.subtotal),
+            'color': {
+                'id': item.color.id,
+                'nombre': item.color.nombre,
+                'hex_code': item.color.hex_code
+            } if item.color else None
+        }
+        if item.variante:
+            item_info['variante_nombre'] = item.variante.nombre
+            item_info['variante_id'] = item.variante.id
+        items.append(item_info)
+
+    return {
+        'id': venta.id,
+        'numero_venta': venta.numero_venta,
+        'fecha_venta': venta.fecha_venta,
+        'total': str(venta.total),
+        'estado': venta.estado,
+        'metodo_pago': venta.metodo_pago,
+        'items': items,
+    }
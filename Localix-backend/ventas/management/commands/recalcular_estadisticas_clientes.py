@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ventas import historial
+from ventas.models import Cliente
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las estadísticas de compra guardadas en los clientes desde sus ventas completadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, help='ID del usuario a recalcular (por defecto todos)')
+
+    def handle(self, *args, **options):
+        clientes = Cliente.objects.all()
+        if options.get('usuario'):
+            clientes = clientes.filter(usuario_id=options['usuario'])
+        actualizados = historial.actualizar_estadisticas(clientes)
+        self.stdout.write(self.style.SUCCESS(f'✅ Estadísticas recalculadas: {actualizados} clientes'))
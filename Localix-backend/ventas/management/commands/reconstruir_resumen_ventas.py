@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from ventas import rollup
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen diario de ventas (ResumenVentaDiaria) desde los items de venta'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, help='ID del usuario a reconstruir (por defecto todos)')
+        parser.add_argument('--desde', help='Fecha inicial AAAA-MM-DD (inclusive)')
+        parser.add_argument('--hasta', help='Fecha final AAAA-MM-DD (inclusive)')
+
+    def _fecha(self, valor, opcion):
+        if not valor:
+            return None
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise CommandError(f'Fecha inválida en --{opcion}, use el formato AAAA-MM-DD')
+        return fecha
+
+    def handle(self, *args, **options):
+        desde = self._fecha(options.get('desde'), 'desde')
+        hasta = self._fecha(options.get('hasta'), 'hasta')
+        if desde and hasta and desde > hasta:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        filas = rollup.reconstruir(usuario_id=options.get('usuario'), desde=desde, hasta=hasta)
+        self.stdout.write(self.style.SUCCESS(f'✅ Resumen diario reconstruido: {filas} filas'))
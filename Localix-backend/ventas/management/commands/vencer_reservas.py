@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ventas import vencimiento
+
+
+class Command(BaseCommand):
+    help = 'Marca como vencidas las reservas activas con fecha de vencimiento pasada y libera su stock reservado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=vencimiento.TAMANO_LOTE,
+            help=f'Reservas vencidas por transacción (por defecto {vencimiento.TAMANO_LOTE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        resultado = vencimiento.vencer_reservas(tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Reservas vencidas: {resultado['reservas']}, unidades liberadas: {resultado['unidades']}"
+        ))
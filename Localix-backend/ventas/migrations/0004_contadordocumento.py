@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2025-08-22 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _extraer_numero(codigo):
+    """Parte numérica de un código como VEN-000042; None si no tiene el formato"""
+    if not codigo or '-' not in codigo:
+        return None
+    try:
+        return int(codigo.rsplit('-', 1)[1])
+    except ValueError:
+        return None
+
+
+def inicializar_contadores(apps, schema_editor):
+    """Continúa la numeración de cada usuario desde su última venta existente"""
+    Venta = apps.get_model('ventas', 'Venta')
+    ContadorDocumento = apps.get_model('ventas', 'ContadorDocumento')
+
+    maximos = {}
+    for usuario_id, codigo in Venta.objects.values_list('usuario_id', 'numero_venta').iterator():
+        numero = _extraer_numero(codigo)
+        if numero is not None:
+            maximos[usuario_id] = max(numero, maximos.get(usuario_id, 0))
+
+    ContadorDocumento.objects.bulk_create([
+        ContadorDocumento(usuario_id=usuario_id, tipo='venta', ultimo_numero=numero)
+        for usuario_id, numero in maximos.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0003_reserva_pagoreserva_itemreserva'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20, verbose_name='Tipo de documento')),
+                ('ultimo_numero', models.PositiveBigIntegerField(default=0, verbose_name='Último número emitido')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_documento', to=settings.AUTH_USER_MODEL, verbose_name='Usuario propietario')),
+            ],
+            options={
+                'verbose_name': 'Contador de documento',
+                'verbose_name_plural': 'Contadores de documento',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'tipo'), name='contador_documento_usuario_tipo_unico')],
+            },
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
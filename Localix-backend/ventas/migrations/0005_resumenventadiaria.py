@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_colorproducto_stock_reservado_and_more'),
+        ('ventas', '0004_contadordocumento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('unidades', models.IntegerField(default=0, verbose_name='Unidades vendidas')),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Subtotal de los items con el descuento de la venta aplicado', max_digits=14, verbose_name='Ingresos')),
+                ('costo', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Costo')),
+                ('margen', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Margen')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_venta', to='productos.producto', verbose_name='Producto')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuario propietario')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de ventas',
+                'verbose_name_plural': 'Resúmenes diarios de ventas',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['usuario', 'producto', 'fecha'], name='ventas_resu_usuario_267160_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'fecha', 'producto'), name='resumen_venta_usuario_fecha_producto_unico')],
+            },
+        ),
+    ]
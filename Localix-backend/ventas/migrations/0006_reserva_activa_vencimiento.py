@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0005_resumenventadiaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('estado', 'activa')), fields=['fecha_vencimiento'], name='reserva_activa_vencimiento'),
+        ),
+    ]
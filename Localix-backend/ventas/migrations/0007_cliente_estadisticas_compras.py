@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:35
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0006_reserva_activa_vencimiento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='compras',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Compras'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='primera_compra',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Primera compra'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='total_gastado',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Total gastado'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultima_compra',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Última compra'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['cliente', 'fecha_venta'], name='ventas_vent_cliente_795f66_idx'),
+        ),
+    ]
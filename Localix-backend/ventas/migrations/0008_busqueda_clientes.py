@@ -0,0 +1,101 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:38
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+CAMPOS_BUSQUEDA = ['texto_busqueda', 'telefono_normalizado', 'documento_normalizado']
+
+_NO_ALFANUMERICO = re.compile(r'[^\w]+')
+_NO_DIGITO = re.compile(r'\D+')
+
+
+def _terminos(texto):
+    """Términos en minúsculas y sin acentos, solo caracteres alfanuméricos"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return [termino for termino in _NO_ALFANUMERICO.split(texto) if termino]
+
+
+def normalizar_cliente(cliente):
+    cliente.texto_busqueda = ' '.join(_terminos(cliente.nombre) + _terminos(cliente.email))
+    cliente.telefono_normalizado = _NO_DIGITO.sub('', str(cliente.telefono or ''))
+    cliente.documento_normalizado = ''.join(_terminos(cliente.numero_documento))
+
+
+def poblar_busqueda(apps, schema_editor):
+    """Calcula las columnas de búsqueda de los clientes existentes"""
+    Cliente = apps.get_model('ventas', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.only('id', 'nombre', 'email', 'telefono', 'numero_documento').iterator():
+        normalizar_cliente(cliente)
+        lote.append(cliente)
+        if len(lote) >= 1000:
+            Cliente.objects.bulk_update(lote, CAMPOS_BUSQUEDA)
+            lote = []
+    Cliente.objects.bulk_update(lote, CAMPOS_BUSQUEDA)
+
+
+def _tabla_cliente(apps, schema_editor):
+    return schema_editor.quote_name(apps.get_model('ventas', 'Cliente')._meta.db_table)
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    """
+    Solo PostgreSQL: índice de trigramas sobre texto_busqueda e índices por
+    prefijo (text_pattern_ops) de teléfono y documento dentro de cada usuario.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+    tabla = _tabla_cliente(apps, schema_editor)
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX {qn('ventas_cliente_texto_busqueda_trgm')} ON {tabla} USING GIN ({qn('texto_busqueda')} gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {qn('ventas_cliente_telefono_prefijo')} ON {tabla} "
+        f"({qn('usuario_id')}, {qn('telefono_normalizado')} text_pattern_ops)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX {qn('ventas_cliente_documento_prefijo')} ON {tabla} "
+        f"({qn('usuario_id')}, {qn('documento_normalizado')} text_pattern_ops)"
+    )
+
+
+def eliminar_indices_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+    schema_editor.execute(f"DROP INDEX IF EXISTS {qn('ventas_cliente_documento_prefijo')}")
+    schema_editor.execute(f"DROP INDEX IF EXISTS {qn('ventas_cliente_telefono_prefijo')}")
+    schema_editor.execute(f"DROP INDEX IF EXISTS {qn('ventas_cliente_texto_busqueda_trgm')}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0007_cliente_estadisticas_compras'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='documento_normalizado',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20, verbose_name='Documento normalizado'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefono_normalizado',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20, verbose_name='Teléfono normalizado'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Nombre y email normalizados; se actualiza al guardar', verbose_name='Texto de búsqueda'),
+        ),
+        migrations.RunPython(poblar_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_busqueda, eliminar_indices_busqueda),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:47
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def poblar_costo_unitario(apps, schema_editor):
+    """Los items existentes toman el costo actual de su producto (el de la venta no se conoce)"""
+    ItemVenta = apps.get_model('ventas', 'ItemVenta')
+    Producto = apps.get_model('productos', 'Producto')
+    ItemVenta.objects.filter(costo_unitario__isnull=True).update(
+        costo_unitario=Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values('costo')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0008_busqueda_clientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemventa',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Costo del producto al momento de la venta', max_digits=12, null=True, verbose_name='Costo unitario'),
+        ),
+        migrations.RunPython(poblar_costo_unitario, migrations.RunPython.noop),
+    ]
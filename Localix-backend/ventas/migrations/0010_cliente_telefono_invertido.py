@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:57
+
+from django.db import migrations, models
+
+
+def poblar_telefono_invertido(apps, schema_editor):
+    """Invierte el teléfono normalizado de los clientes existentes"""
+    Cliente = apps.get_model('ventas', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.exclude(telefono_normalizado='').only('id', 'telefono_normalizado').iterator():
+        cliente.telefono_invertido = cliente.telefono_normalizado[::-1]
+        lote.append(cliente)
+        if len(lote) >= 1000:
+            Cliente.objects.bulk_update(lote, ['telefono_invertido'])
+            lote = []
+    Cliente.objects.bulk_update(lote, ['telefono_invertido'])
+
+
+def crear_indice(apps, schema_editor):
+    """Solo PostgreSQL: índice por prefijo del teléfono invertido dentro de cada usuario"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+    tabla = qn(apps.get_model('ventas', 'Cliente')._meta.db_table)
+    schema_editor.execute(
+        f"CREATE INDEX {qn('ventas_cliente_telefono_sufijo')} ON {tabla} "
+        f"({qn('usuario_id')}, {qn('telefono_invertido')} text_pattern_ops)"
+    )
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name('ventas_cliente_telefono_sufijo')}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0009_itemventa_costo_unitario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='telefono_invertido',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Dígitos del teléfono al revés, para buscar por el final del número', max_length=20, verbose_name='Teléfono invertido'),
+        ),
+        migrations.RunPython(poblar_telefono_invertido, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
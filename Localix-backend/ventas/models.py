@@ -1,11 +1,21 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from decimal import Decimal
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 from django.core.validators import MinValueValidator
 from productos.models import Producto, VarianteProducto, ColorProducto
+from pedidos.estadisticas import invalidar_estadisticas
+from productos.catalogo import invalidar_catalogo
+from productos.inventario import descontar_stock, liberar_reservado_lote, reservar_stock
+from productos.movimientos import movimiento, registrar
+from .busqueda import normalizar_cliente
+from .numeracion import siguiente_documento
+from . import historial, rollup
 from typing import TYPE_CHECKING, List, Optional, Union, cast
 from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Round
 
 if TYPE_CHECKING:
     from django.db.models import QuerySet
@@ -77,6 +87,69 @@ class Cliente(models.Model):
         verbose_name=_('Cliente activo')
     )
 
+    # Índice de búsqueda (ver ventas/busqueda.py)
+    texto_busqueda = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_("Texto de búsqueda"),
+        help_text=_("Nombre y email normalizados; se actualiza al guardar")
+    )
+
+    telefono_normalizado = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_("Teléfono normalizado")
+    )
+
+    telefono_invertido = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_("Teléfono invertido"),
+        help_text=_("Dígitos del teléfono al revés, para buscar por el final del número")
+    )
+
+    documento_normalizado = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_("Documento normalizado")
+    )
+
+    # Estadísticas de compra (ventas completadas); las mantiene ventas.historial
+    compras = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("Compras")
+    )
+
+    total_gastado = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        verbose_name=_("Total gastado")
+    )
+
+    primera_compra = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("Primera compra")
+    )
+
+    ultima_compra = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("Última compra")
+    )
+
     class Meta:
         verbose_name = _("Cliente")
         verbose_name_plural = _("Clientes")
@@ -87,9 +160,51 @@ class Cliente(models.Model):
             models.Index(fields=['usuario', 'numero_documento']),
         ]
 
+    def save(self, *args, **kwargs):
+        normalizar_cliente(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nombre', 'email', 'telefono', 'numero_documento'} & set(update_fields):
+            kwargs['update_fields'] = {
+                *update_fields, 'texto_busqueda', 'telefono_normalizado', 'telefono_invertido', 'documento_normalizado'
+            }
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return str(self.nombre)
 
+class ContadorDocumento(models.Model):
+    """
+    Último número emitido por tipo de documento para cada usuario.
+    Lo gestiona ventas.numeracion; no debe modificarse directamente.
+    """
+    # Campo para multi-tenancy
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='contadores_documento',
+        verbose_name=_("Usuario propietario")
+    )
+
+    tipo = models.CharField(
+        max_length=20,
+        verbose_name=_("Tipo de documento")
+    )
+
+    ultimo_numero = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_("Último número emitido")
+    )
+
+    class Meta:
+        verbose_name = _("Contador de documento")
+        verbose_name_plural = _("Contadores de documento")
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'tipo'], name='contador_documento_usuario_tipo_unico'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.tipo} #{self.ultimo_numero} ({self.usuario_id})"
+
 class Venta(models.Model):
     """
     Modelo principal para las ventas
@@ -218,19 +333,76 @@ class Venta(models.Model):
     )
 
     def calcular_totales(self) -> None:
-        """Calcula los totales de la venta"""
-        items_queryset = self.items.all()
-        subtotal_sum = sum(float(item.subtotal) for item in items_queryset)
-        self.subtotal = Decimal(str(subtotal_sum))
-        
+        """Calcula los totales de la venta sumando los subtotales en la base de datos"""
+        subtotal = self.items.aggregate(
+            total=Coalesce(Sum('subtotal'), Value(Decimal('0.00')), output_field=models.DecimalField())
+        )['total']
+        self.establecer_totales(subtotal)
+
+    def establecer_totales(self, subtotal: Decimal) -> None:
+        """Aplica el descuento sobre el subtotal dado y guarda los totales"""
+        self.subtotal = subtotal
+        self._aplicar_descuento()
+        self.save(update_fields=['subtotal', 'descuento', 'total'])
+
+    def _aplicar_descuento(self) -> None:
         # Calcular descuento basado en el porcentaje
         if self.porcentaje_descuento and self.porcentaje_descuento > 0:
-            self.descuento = (self.subtotal * self.porcentaje_descuento) / Decimal('100.00')
+            descuento = (self.subtotal * self.porcentaje_descuento) / Decimal('100.00')
+            self.descuento = descuento.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         else:
             self.descuento = Decimal('0.00')
         
         self.total = self.subtotal - self.descuento
-        self.save(update_fields=['subtotal', 'descuento', 'total'])
+
+    def sumar_al_subtotal(self, delta: Decimal) -> None:
+        """
+        Suma `delta` al subtotal con un UPDATE atómico (subtotal = subtotal + delta)
+        y recalcula descuento y total en la misma sentencia, sin releer los items.
+        """
+        subtotal = F('subtotal') + Value(delta, output_field=models.DecimalField())
+        descuento = Round(subtotal * F('porcentaje_descuento') / Value(Decimal('100.00')), 2)
+        Venta.objects.filter(pk=self.pk).update(
+            subtotal=subtotal,
+            descuento=descuento,
+            total=subtotal - descuento
+        )
+        # Mantener la instancia en memoria sincronizada
+        self.subtotal = (self.subtotal or Decimal('0.00')) + delta
+        self._aplicar_descuento()
+        if self.cuenta_en_resumen:
+            historial.actualizar_estadisticas([self.cliente_id])
+        self._invalidar_estadisticas_pedidos()
+
+    @contextmanager
+    def totales_diferidos(self):
+        """
+        Dentro del bloque los items creados no actualizan los totales;
+        se calculan una sola vez al salir. Uso:
+
+            with venta.totales_diferidos():
+                for ...: ItemVenta.objects.create(venta=venta, ...)
+        """
+        self._totales_diferidos = True
+        self._items_diferidos = []
+        try:
+            yield self
+        finally:
+            self._totales_diferidos = False
+        self.calcular_totales()
+        # El resumen diario también se actualiza una sola vez para todo el lote
+        if self.cuenta_en_resumen:
+            rollup.registrar_items(self, self._items_diferidos)
+        self._items_diferidos = []
+
+    @property
+    def difiere_totales(self) -> bool:
+        return getattr(self, '_totales_diferidos', False)
+
+    @property
+    def cuenta_en_resumen(self) -> bool:
+        """Indica si la venta, tal como está guardada, suma en el resumen diario"""
+        return getattr(self, '_estado_original', None) == rollup.ESTADO_CONTABLE
 
     def get_cliente_display(self) -> str:
         """Retorna el nombre del cliente (registrado o anónimo)"""
@@ -247,22 +419,76 @@ class Venta(models.Model):
             models.Index(fields=['usuario', 'fecha_venta']),
             models.Index(fields=['usuario', 'estado']),
             models.Index(fields=['usuario', 'cliente']),
+            models.Index(fields=['cliente', 'fecha_venta']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado guardado, para detectar transiciones en save()
+        instancia._estado_original = instancia.__dict__.get('estado')
+        instancia._cliente_original = instancia.__dict__.get('cliente_id')
+        return instancia
+
     def save(self, *args, **kwargs):
         """Genera automáticamente el número de venta si no existe"""
-        if not self.numero_venta:
-            # Buscar la última venta con formato correcto
-            ultimo_venta = Venta.objects.order_by('-id').first()
-            nuevo_numero = 1
-            if ultimo_venta and ultimo_venta.numero_venta and '-' in ultimo_venta.numero_venta:
-                try:
-                    ultimo_numero = int(ultimo_venta.numero_venta.split('-')[1])
-                    nuevo_numero = ultimo_numero + 1
-                except (IndexError, ValueError):
-                    pass  # Si el formato es incorrecto, empieza desde 1
-            self.numero_venta = f"VEN-{nuevo_numero:06d}"
-        super().save(*args, **kwargs)
+        creando = self.pk is None
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            if not self.numero_venta:
+                # El contador y la venta se confirman juntos para no dejar huecos en la numeración
+                self.numero_venta = siguiente_documento(self.usuario_id, 'venta')
+            super().save(*args, **kwargs)
+            if not creando and (update_fields is None or 'estado' in update_fields):
+                self._actualizar_resumen_por_estado()
+            self._actualizar_estadisticas_clientes(update_fields)
+            if not creando and (update_fields is None or 'total' in update_fields):
+                self._invalidar_estadisticas_pedidos()
+        if update_fields is None or 'estado' in update_fields:
+            self._estado_original = self.estado
+        if update_fields is None or 'cliente' in update_fields:
+            self._cliente_original = self.cliente_id
+
+    def _actualizar_resumen_por_estado(self) -> None:
+        """Suma o resta la venta del resumen diario al entrar o salir del estado completada"""
+        anterior = getattr(self, '_estado_original', None)
+        if anterior == self.estado:
+            return
+        if anterior == rollup.ESTADO_CONTABLE:
+            rollup.registrar_venta(self, -1)
+        elif self.estado == rollup.ESTADO_CONTABLE:
+            rollup.registrar_venta(self, 1)
+
+    def _actualizar_estadisticas_clientes(self, update_fields) -> None:
+        """Recalcula las estadísticas de compra de los clientes a los que la venta suma o sumaba"""
+        if update_fields is not None and not {'estado', 'cliente', 'total', 'fecha_venta'} & set(update_fields):
+            return
+        clientes = set()
+        if self.estado == rollup.ESTADO_CONTABLE:
+            clientes.add(self.cliente_id)
+        if self.cuenta_en_resumen:
+            clientes.add(getattr(self, '_cliente_original', None))
+        historial.actualizar_estadisticas(clientes)
+
+    def _invalidar_estadisticas_pedidos(self) -> None:
+        """
+        Los ingresos de las estadísticas de pedidos suman el total de la venta
+        de cada pedido: al cambiar el total se descarta el snapshot del dueño
+        (el pedido de una venta es del mismo usuario). Sin consultar si la venta
+        tiene pedido: borrar una clave de caché cuesta menos que esa consulta.
+        """
+        invalidar_estadisticas(self.usuario_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self._invalidar_estadisticas_pedidos()
+            cuenta_en_resumen = self.cuenta_en_resumen
+            if cuenta_en_resumen:
+                rollup.registrar_venta(self, -1)
+            resultado = super().delete(*args, **kwargs)
+            if cuenta_en_resumen:
+                historial.actualizar_estadisticas([getattr(self, '_cliente_original', self.cliente_id)])
+            return resultado
 
     def __str__(self) -> str:
         return f"Venta {self.numero_venta} - {self.get_cliente_display()}"
@@ -320,6 +546,17 @@ class ItemVenta(models.Model):
         verbose_name=_("Subtotal del item")
     )
 
+    # El resumen diario suma y resta el margen con este costo, aunque el del producto cambie después
+    costo_unitario = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("Costo unitario"),
+        help_text=_("Costo del producto al momento de la venta")
+    )
+
     @property
     def precio_unitario(self):
         base = Decimal(str(self.producto.precio)) if self.producto else Decimal('0.00')
@@ -336,57 +573,102 @@ class ItemVenta(models.Model):
         return self.subtotal
 
     def save(self, *args, **kwargs) -> None:
+        creando = self.pk is None
         self.calcular_subtotal()
+        if self.costo_unitario is None:
+            self.costo_unitario = self.producto.costo
+        venta = self.venta
         
-        # ✅ Lógica de descuento de stock
-        if self.pk is None:  # Solo si es un nuevo item
-            producto = self.producto
-            if producto and producto.gestion_stock:
-                if self.color:
-                    # Descontar stock del color específico
-                    color = self.color
-                    if color.stock >= self.cantidad:
-                        color.stock = max(0, color.stock - self.cantidad)
-                        color.save()
-                        print(f"🔄 Stock del color {color.nombre} actualizado: {color.stock}")
-                    else:
-                        raise ValueError(f"Stock insuficiente para el color {color.nombre}. Disponible: {color.stock}, Solicitado: {self.cantidad}")
-                elif self.variante:
-                    # Descontar stock de la variante
-                    variante = self.variante
-                    if variante.stock >= self.cantidad:
-                        variante.stock = max(0, variante.stock - self.cantidad)
-                        variante.save()
-                        print(f"🔄 Stock de la variante {variante.nombre} actualizado: {variante.stock}")
-                    else:
-                        raise ValueError(f"Stock insuficiente para la variante {variante.nombre}. Disponible: {variante.stock}, Solicitado: {self.cantidad}")
-                else:
-                    # Para productos sin color específico, verificar si tiene colores configurados
-                    colores_activos = producto.colores.filter(activo=True)
-                    if colores_activos.exists():
-                        # Si el producto tiene colores, no permitir venta sin especificar color
-                        raise ValueError(f"El producto {producto.nombre} tiene colores configurados. Debe especificar un color específico.")
-                    else:
-                        # Solo descontar del stock general si no tiene colores configurados
-                        if producto.stock >= self.cantidad:
-                            producto.stock = max(0, producto.stock - self.cantidad)
-                            producto.save(update_fields=['stock'])
-                            print(f"🔄 Stock del producto {producto.nombre} actualizado: {producto.stock}")
-                        else:
-                            raise ValueError(f"Stock insuficiente para el producto {producto.nombre}. Disponible: {producto.stock}, Solicitado: {self.cantidad}")
-                
-                # Actualizar contador de vendidos
-                producto.vendidos += self.cantidad
-                producto.save(update_fields=['vendidos'])
-                
-                # Actualizar stock total del producto
-                producto.actualizar_stock_total()
+        with transaction.atomic():
+            # ✅ Lógica de descuento de stock
+            if creando:  # Solo si es un nuevo item
+                self._descontar_stock()
+                anterior = None
+            elif venta.cuenta_en_resumen:
+                anterior = ItemVenta.objects.select_related('producto').get(pk=self.pk)
+            
+            super().save(*args, **kwargs)
+            
+            if venta.difiere_totales:
+                if creando:
+                    venta._items_diferidos.append(self)
+                return
+            
+            # Actualiza los totales de la venta y el resumen diario
+            if creando:
+                venta.sumar_al_subtotal(self.subtotal)
+            else:
+                venta.calcular_totales()
+            if venta.cuenta_en_resumen:
+                if anterior is not None:
+                    rollup.registrar_items(venta, [anterior], -1)
+                rollup.registrar_items(venta, [self])
+
+    def delete(self, *args, **kwargs):
+        venta = self.venta
+        subtotal = self.subtotal or Decimal('0.00')
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            if not venta.difiere_totales:
+                venta.sumar_al_subtotal(-subtotal)
+            if venta.cuenta_en_resumen:
+                rollup.registrar_items(venta, [self], -1)
+        return resultado
+
+    def _descontar_stock(self) -> None:
+        """
+        Descuenta el stock con UPDATE condicionales (stock = stock - n WHERE stock >= n).
+        La cantidad de filas afectadas indica si el stock era suficiente, por lo que
+        ventas concurrentes del mismo color no pueden dejar stock negativo.
+        """
+        producto = self.producto
+        if not producto or not producto.gestion_stock:
+            return
         
-        super().save(*args, **kwargs)
+        # Se aplica al confirmar la transacción; si el descuento falla no tiene efecto
+        invalidar_catalogo(producto.usuario_id)
+        
+        if self.color_id:
+            # Descontar stock del color específico
+            if not descontar_stock(ColorProducto, self.color_id, self.cantidad):
+                color = self.color
+                color.refresh_from_db(fields=['stock'])
+                raise ValueError(f"Stock insuficiente para el color {color.nombre}. Disponible: {color.stock}, Solicitado: {self.cantidad}")
+        elif self.variante_id:
+            # Descontar stock de la variante
+            if not descontar_stock(VarianteProducto, self.variante_id, self.cantidad):
+                variante = self.variante
+                variante.refresh_from_db(fields=['stock'])
+                raise ValueError(f"Stock insuficiente para la variante {variante.nombre}. Disponible: {variante.stock}, Solicitado: {self.cantidad}")
+        else:
+            # Para productos sin color específico, verificar si tiene colores configurados
+            if producto.colores.filter(activo=True).exists():
+                # Si el producto tiene colores, no permitir venta sin especificar color
+                raise ValueError(f"El producto {producto.nombre} tiene colores configurados. Debe especificar un color específico.")
+            # Solo descontar del stock general si no tiene colores configurados
+            actualizados = Producto.objects.filter(
+                pk=producto.pk, stock__gte=self.cantidad
+            ).update(
+                stock=F('stock') - self.cantidad,
+                vendidos=F('vendidos') + self.cantidad
+            )
+            if not actualizados:
+                producto.refresh_from_db(fields=['stock'])
+                raise ValueError(f"Stock insuficiente para el producto {producto.nombre}. Disponible: {producto.stock}, Solicitado: {self.cantidad}")
+            self._registrar_movimiento()
+            return
         
-        # Actualiza los totales de la venta
-        if hasattr(self.venta, 'calcular_totales'):
-            self.venta.calcular_totales()  # type: ignore[attr-defined]
+        # Actualizar contador de vendidos y stock total del producto
+        Producto.objects.filter(pk=producto.pk).update(vendidos=F('vendidos') + self.cantidad)
+        Producto.objects.filter(pk=producto.pk).actualizar_stock_total()
+        self._registrar_movimiento()
+
+    def _registrar_movimiento(self) -> None:
+        """Registra la venta en el libro de movimientos de stock"""
+        registrar([movimiento(
+            'venta', self.producto_id, self.color_id, self.variante_id,
+            stock=-self.cantidad, referencia=f'venta:{self.venta_id}'
+        )])
 
     class Meta:
         verbose_name = _("Item de venta")
@@ -400,6 +682,72 @@ class ItemVenta(models.Model):
         return f"{producto_nombre}{color_info} x {self.cantidad} - {venta_numero}"
 
 
+class ResumenVentaDiaria(models.Model):
+    """
+    Acumulado diario de ventas completadas por usuario y producto.
+    Se mantiene de forma incremental desde ventas.rollup y puede
+    reconstruirse con el comando reconstruir_resumen_ventas.
+    """
+    # Campo para multi-tenancy
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name=_("Usuario propietario")
+    )
+
+    fecha = models.DateField(
+        verbose_name=_("Fecha")
+    )
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='resumenes_venta',
+        verbose_name=_("Producto")
+    )
+
+    unidades = models.IntegerField(
+        default=0,
+        verbose_name=_("Unidades vendidas")
+    )
+
+    ingresos = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name=_("Ingresos"),
+        help_text=_("Subtotal de los items con el descuento de la venta aplicado")
+    )
+
+    costo = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name=_("Costo")
+    )
+
+    margen = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name=_("Margen")
+    )
+
+    class Meta:
+        verbose_name = _("Resumen diario de ventas")
+        verbose_name_plural = _("Resúmenes diarios de ventas")
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'fecha', 'producto'], name='resumen_venta_usuario_fecha_producto_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'producto', 'fecha']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.fecha} - {self.producto_id}: {self.unidades} u."
+
+
 class Reserva(models.Model):
 	ESTADO_CHOICES = [
 		('activa', _('Activa')),
@@ -417,6 +765,12 @@ class Reserva(models.Model):
 	monto_pendiente = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 	notas = models.TextField(blank=True, null=True)
 
+	class Meta:
+		indexes = [
+			# Índice parcial: vencer_reservas recorre solo las activas por fecha de vencimiento
+			models.Index(fields=['fecha_vencimiento'], condition=Q(estado='activa'), name='reserva_activa_vencimiento'),
+		]
+
 	def recalcular_montos(self):
 		subtotal = sum((item.subtotal for item in self.items.all()), Decimal('0.00'))
 		self.monto_total = subtotal
@@ -448,16 +802,19 @@ class ItemReserva(models.Model):
 		self.calcular_subtotal()
 		with transaction.atomic():
 			if creating and self.producto and self.producto.gestion_stock:
+				# UPDATE condicional: no pisa liberaciones concurrentes (vencer_reservas, cancelaciones)
 				if self.color:
-					if (self.color.stock - self.color.stock_reservado) < self.cantidad:
+					if not reservar_stock(ColorProducto, self.color_id, self.cantidad):
 						raise ValueError(f"Stock disponible insuficiente para el color {self.color.nombre}")
-					self.color.stock_reservado = max(0, self.color.stock_reservado + self.cantidad)
-					self.color.save(update_fields=['stock_reservado'])
+					self.color.stock_reservado += self.cantidad
+					invalidar_catalogo(self.producto.usuario_id)
+					registrar([self._movimiento('reserva', self.cantidad)])
 				elif self.variante:
-					if (self.variante.stock - self.variante.stock_reservado) < self.cantidad:
+					if not reservar_stock(VarianteProducto, self.variante_id, self.cantidad):
 						raise ValueError(f"Stock disponible insuficiente para la variante {self.variante.nombre}")
-					self.variante.stock_reservado = max(0, self.variante.stock_reservado + self.cantidad)
-					self.variante.save(update_fields=['stock_reservado'])
+					self.variante.stock_reservado += self.cantidad
+					invalidar_catalogo(self.producto.usuario_id)
+					registrar([self._movimiento('reserva', self.cantidad)])
 				else:
 					# Si el producto tiene colores configurados, exigir color
 					colores_activos = self.producto.colores.filter(activo=True)
@@ -466,6 +823,27 @@ class ItemReserva(models.Model):
 		super().save(*args, **kwargs)
 		self.reserva.recalcular_montos()
 
+	def _movimiento(self, tipo, reservado):
+		return movimiento(tipo, self.producto_id, self.color_id, self.variante_id, reservado=reservado, referencia=f'reserva:{self.reserva_id}')
+
+	def liberar_reservado(self):
+		"""
+		Devuelve al stock disponible las unidades reservadas por el item.
+		Retorna el movimiento de liberación sin guardar (se registran por lotes) o None.
+		"""
+		fila = self.color or self.variante
+		if fila is None:
+			return None
+		# Se lee bloqueada: vencer_reservas puede estar liberando otras reservas de la misma fila
+		modelo = type(fila)
+		fila.stock_reservado = modelo.objects.select_for_update().filter(pk=fila.pk).values_list('stock_reservado', flat=True).get()
+		liberadas = min(fila.stock_reservado, self.cantidad)
+		if liberadas:
+			liberar_reservado_lote(modelo, {fila.pk: liberadas})
+			fila.stock_reservado -= liberadas
+			invalidar_catalogo(self.producto.usuario_id)
+		return self._movimiento('liberacion', -liberadas)
+
 class PagoReserva(models.Model):
 	reserva = models.ForeignKey(Reserva, on_delete=models.CASCADE, related_name='pagos')
 	monto = models.DecimalField(max_digits=12, decimal_places=2)
@@ -0,0 +1,101 @@
+"""
+Numeración correlativa de documentos por usuario (VEN-000001, PED-000001, ...)
+
+Cada usuario tiene una fila en ContadorDocumento por tipo de documento. Los
+números se obtienen con una sola sentencia atómica:
+
+    INSERT ... ON CONFLICT (usuario_id, tipo)
+    DO UPDATE SET ultimo_numero = ultimo_numero + n RETURNING ultimo_numero
+
+La fila queda bloqueada hasta el fin de la transacción que la incrementó; si
+esa transacción se revierte, el número también, por lo que la secuencia no
+tiene huecos. Solo compiten entre sí los documentos del mismo usuario y tipo.
+"""
+
+from django.db import connection, transaction
+
+# Prefijo de cada tipo de documento; agregar aquí los nuevos tipos
+PREFIJOS = {
+    'venta': 'VEN',
+    'pedido': 'PED',
+}
+
+DIGITOS = 6
+
+
+def _validar_tipo(tipo):
+    if tipo not in PREFIJOS:
+        raise ValueError(f"Tipo de documento desconocido: {tipo}")
+
+
+def _soporta_upsert():
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def _incrementar_upsert(usuario_id, tipo, cantidad):
+    from .models import ContadorDocumento
+
+    qn = connection.ops.quote_name
+    tabla = qn(ContadorDocumento._meta.db_table)
+    sql = (
+        f"INSERT INTO {tabla} ({qn('usuario_id')}, {qn('tipo')}, {qn('ultimo_numero')}) "
+        f"VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({qn('usuario_id')}, {qn('tipo')}) "
+        f"DO UPDATE SET {qn('ultimo_numero')} = {tabla}.{qn('ultimo_numero')} + EXCLUDED.{qn('ultimo_numero')} "
+        f"RETURNING {qn('ultimo_numero')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [usuario_id, tipo, cantidad])
+        return cursor.fetchone()[0]
+
+
+def _incrementar_con_bloqueo(usuario_id, tipo, cantidad):
+    """Alternativa para motores sin INSERT ... ON CONFLICT ... RETURNING"""
+    from .models import ContadorDocumento
+
+    with transaction.atomic():
+        ContadorDocumento.objects.get_or_create(usuario_id=usuario_id, tipo=tipo)
+        contador = ContadorDocumento.objects.select_for_update().get(usuario_id=usuario_id, tipo=tipo)
+        contador.ultimo_numero += cantidad
+        contador.save(update_fields=['ultimo_numero'])
+        return contador.ultimo_numero
+
+
+def reservar_bloque(usuario_id, tipo, cantidad):
+    """
+    Reserva `cantidad` números consecutivos para el usuario y retorna el range.
+    Pensado para importaciones masivas: una sola sentencia para todo el lote.
+    """
+    _validar_tipo(tipo)
+    if cantidad < 1:
+        raise ValueError("La cantidad a reservar debe ser al menos 1")
+
+    if _soporta_upsert():
+        ultimo = _incrementar_upsert(usuario_id, tipo, cantidad)
+    else:
+        ultimo = _incrementar_con_bloqueo(usuario_id, tipo, cantidad)
+    return range(ultimo - cantidad + 1, ultimo + 1)
+
+
+def siguiente_numero(usuario_id, tipo):
+    """Retorna el siguiente número del usuario para el tipo de documento"""
+    return reservar_bloque(usuario_id, tipo, 1)[0]
+
+
+def formatear(tipo, numero):
+    """Formatea un número como código de documento, p. ej. VEN-000042"""
+    _validar_tipo(tipo)
+    return f"{PREFIJOS[tipo]}-{numero:0{DIGITOS}d}"
+
+
+def siguiente_documento(usuario_id, tipo):
+    """Retorna el siguiente código de documento del usuario"""
+    return formatear(tipo, siguiente_numero(usuario_id, tipo))
+
+
+def reservar_documentos(usuario_id, tipo, cantidad):
+    """Retorna una lista de `cantidad` códigos de documento consecutivos"""
+    return [formatear(tipo, numero) for numero in reservar_bloque(usuario_id, tipo, cantidad)]
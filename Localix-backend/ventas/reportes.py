@@ -0,0 +1,172 @@
+"""
+Resúmenes de ventas calculados en la base de datos
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Avg, Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+CERO = Value(Decimal('0.00'), output_field=DecimalField())
+
+# Agrupaciones disponibles para las series del dashboard
+PERIODOS = {
+    'por_dia': TruncDay,
+    'por_semana': TruncWeek,
+    'por_mes': TruncMonth,
+}
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _parsear_fecha(valor, parametro):
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(f"Fecha inválida en '{parametro}', use el formato AAAA-MM-DD")
+    return fecha
+
+
+def filtrar_por_fechas(queryset, params, campo):
+    """
+    Aplica fecha_desde y fecha_hasta (AAAA-MM-DD, inclusive) como un rango
+    sobre el campo de fecha y hora `campo`, para que use su índice.
+    Lanza ValueError si una fecha es inválida.
+    """
+    fecha_desde = params.get('fecha_desde')
+    if fecha_desde:
+        queryset = queryset.filter(**{f'{campo}__gte': _inicio_del_dia(_parsear_fecha(fecha_desde, 'fecha_desde'))})
+
+    fecha_hasta = params.get('fecha_hasta')
+    if fecha_hasta:
+        dia_siguiente = _parsear_fecha(fecha_hasta, 'fecha_hasta') + timedelta(days=1)
+        queryset = queryset.filter(**{f'{campo}__lt': _inicio_del_dia(dia_siguiente)})
+    return queryset
+
+
+def filtrar_ventas(queryset, params):
+    """
+    Aplica los filtros fecha_desde, fecha_hasta (inclusive), estado y metodo_pago.
+    Las fechas se convierten en un rango sobre fecha_venta para aprovechar
+    el índice (usuario, fecha_venta). Lanza ValueError si una fecha es inválida.
+    """
+    queryset = filtrar_por_fechas(queryset, params, 'fecha_venta')
+
+    estado = params.get('estado')
+    if estado:
+        queryset = queryset.filter(estado=estado)
+
+    metodo_pago = params.get('metodo_pago')
+    if metodo_pago:
+        queryset = queryset.filter(metodo_pago=metodo_pago)
+
+    return queryset
+
+
+def resumen_ventas(queryset):
+    """Totales generales con un solo aggregate"""
+    totales = queryset.aggregate(
+        total_ventas=Count('id'),
+        total_ingresos=Coalesce(Sum('total'), CERO),
+        total_descuentos=Coalesce(Sum('descuento'), CERO),
+        ticket_promedio=Coalesce(Avg('total'), CERO),
+    )
+    return {
+        'total_ventas': totales['total_ventas'],
+        'total_ingresos': float(totales['total_ingresos']),
+        'total_descuentos': float(totales['total_descuentos']),
+        'ticket_promedio': round(float(totales['ticket_promedio']), 2),
+    }
+
+
+def serie_ventas(queryset, truncar):
+    """Cantidad e ingresos agrupados por periodo (GROUP BY en la base de datos)"""
+    filas = (
+        queryset
+        .order_by()
+        .annotate(periodo=truncar('fecha_venta'))
+        .values('periodo')
+        .annotate(total_ventas=Count('id'), total_ingresos=Coalesce(Sum('total'), CERO))
+        .order_by('periodo')
+    )
+    return [
+        {
+            'periodo': fila['periodo'].date().isoformat(),
+            'total_ventas': fila['total_ventas'],
+            'total_ingresos': float(fila['total_ingresos']),
+        }
+        for fila in filas
+    ]
+
+
+def series_ventas(queryset):
+    """Series por día, semana y mes para los gráficos del dashboard"""
+    return {clave: serie_ventas(queryset, truncar) for clave, truncar in PERIODOS.items()}
+
+
+def filtrar_resumen_diario(queryset, params):
+    """Filtra ResumenVentaDiaria por fecha_desde/fecha_hasta (inclusive) y producto"""
+    fecha_desde = params.get('fecha_desde')
+    if fecha_desde:
+        queryset = queryset.filter(fecha__gte=_parsear_fecha(fecha_desde, 'fecha_desde'))
+
+    fecha_hasta = params.get('fecha_hasta')
+    if fecha_hasta:
+        queryset = queryset.filter(fecha__lte=_parsear_fecha(fecha_hasta, 'fecha_hasta'))
+
+    producto = params.get('producto')
+    if producto:
+        queryset = queryset.filter(producto_id=producto)
+
+    return queryset
+
+
+def _totales_resumen_diario():
+    return {
+        'total_unidades': Coalesce(Sum('unidades'), Value(0)),
+        'total_ingresos': Coalesce(Sum('ingresos'), CERO),
+        'total_costo': Coalesce(Sum('costo'), CERO),
+        'total_margen': Coalesce(Sum('margen'), CERO),
+    }
+
+
+def _serializar_totales(fila):
+    return {
+        'unidades': fila['total_unidades'],
+        'ingresos': float(fila['total_ingresos']),
+        'costo': float(fila['total_costo']),
+        'margen': float(fila['total_margen']),
+    }
+
+
+def rentabilidad(queryset):
+    """
+    Unidades, ingresos, costo y margen desde el resumen diario:
+    totales, por producto y por día, sin recorrer los items de venta.
+    """
+    queryset = queryset.order_by()
+    por_producto = (
+        queryset.values('producto_id', 'producto__nombre')
+        .annotate(**_totales_resumen_diario())
+        .order_by('-total_ingresos')
+    )
+    por_dia = (
+        queryset.values('fecha')
+        .annotate(**_totales_resumen_diario())
+        .order_by('fecha')
+    )
+    return {
+        'totales': _serializar_totales(queryset.aggregate(**_totales_resumen_diario())),
+        'por_producto': [
+            {'producto_id': fila['producto_id'], 'producto_nombre': fila['producto__nombre'], **_serializar_totales(fila)}
+            for fila in por_producto
+        ],
+        'por_dia': [
+            {'fecha': fila['fecha'].isoformat(), **_serializar_totales(fila)}
+            for fila in por_dia
+        ],
+    }
@@ -0,0 +1,205 @@
+"""
+Mantenimiento del resumen diario de ventas (ResumenVentaDiaria)
+
+Cada venta completada suma sus items al acumulado del día por producto;
+si deja de estar completada (cancelada, reembolsada) o se elimina, los resta.
+Las escrituras son un único INSERT ... ON CONFLICT DO UPDATE por venta, así
+ventas simultáneas del mismo día y producto no se pisan entre sí.
+El costo de cada item es el guardado al venderlo (ItemVenta.costo_unitario),
+de modo que restar una venta deja el día como estaba aunque el costo del
+producto haya cambiado entretanto.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Solo las ventas en este estado cuentan en el resumen
+ESTADO_CONTABLE = 'completada'
+
+CENTAVO = Decimal('0.01')
+
+TAMANO_LOTE = 1000
+
+
+def _fecha_local(fecha_venta):
+    return timezone.localdate(fecha_venta) if fecha_venta else timezone.localdate()
+
+
+def _factor_descuento(porcentaje_descuento):
+    """Proporción del subtotal que queda tras el descuento global de la venta"""
+    return (Decimal('100.00') - (porcentaje_descuento or Decimal('0.00'))) / Decimal('100.00')
+
+
+def _costo_unitario(item):
+    """Costo guardado en el item al venderlo (los items anteriores a ese campo usan el del producto)"""
+    return item.costo_unitario if item.costo_unitario is not None else item.producto.costo
+
+
+def _costo_items():
+    return ExpressionWrapper(
+        F('cantidad') * Coalesce(F('costo_unitario'), F('producto__costo')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _fila(unidades, subtotal, costo, factor):
+    ingresos = (subtotal * factor).quantize(CENTAVO)
+    costo = (costo or Decimal('0.00')).quantize(CENTAVO)
+    return [unidades, ingresos, costo]
+
+
+def _filas_items(venta, items):
+    """Agrupa por producto items ya cargados en memoria"""
+    acumulado = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+    for item in items:
+        fila = acumulado[item.producto_id]
+        fila[0] += item.cantidad
+        fila[1] += item.subtotal or Decimal('0.00')
+        fila[2] += _costo_unitario(item) * item.cantidad
+    factor = _factor_descuento(venta.porcentaje_descuento)
+    return {
+        producto_id: _fila(unidades, subtotal, costo, factor)
+        for producto_id, (unidades, subtotal, costo) in acumulado.items()
+    }
+
+
+def _filas_venta(venta):
+    """Agrupa por producto los items de la venta en la base de datos"""
+    factor = _factor_descuento(venta.porcentaje_descuento)
+    agrupado = (
+        venta.items.order_by()
+        .values('producto_id')
+        .annotate(unidades=Sum('cantidad'), subtotal=Sum('subtotal'), costo=Sum(_costo_items()))
+    )
+    return {
+        fila['producto_id']: _fila(fila['unidades'], fila['subtotal'], fila['costo'], factor)
+        for fila in agrupado
+    }
+
+
+def _soporta_upsert():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _upsert(usuario_id, fecha, filas, signo):
+    from .models import ResumenVentaDiaria
+
+    qn = connection.ops.quote_name
+    tabla = qn(ResumenVentaDiaria._meta.db_table)
+    columnas = ['usuario_id', 'fecha', 'producto_id', 'unidades', 'ingresos', 'costo', 'margen']
+    acumulables = ['unidades', 'ingresos', 'costo', 'margen']
+
+    valores = []
+    parametros = []
+    for producto_id, (unidades, ingresos, costo) in filas.items():
+        valores.append(f"({', '.join(['%s'] * len(columnas))})")
+        parametros.extend([
+            usuario_id, fecha, producto_id,
+            signo * unidades, signo * ingresos, signo * costo, signo * (ingresos - costo)
+        ])
+
+    sql = (
+        f"INSERT INTO {tabla} ({', '.join(qn(c) for c in columnas)}) "
+        f"VALUES {', '.join(valores)} "
+        f"ON CONFLICT ({qn('usuario_id')}, {qn('fecha')}, {qn('producto_id')}) DO UPDATE SET "
+        + ', '.join(f"{qn(c)} = {tabla}.{qn(c)} + EXCLUDED.{qn(c)}" for c in acumulables)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+
+def _actualizar_con_bloqueo(usuario_id, fecha, filas, signo):
+    """Alternativa para motores sin INSERT ... ON CONFLICT"""
+    from .models import ResumenVentaDiaria
+
+    for producto_id, (unidades, ingresos, costo) in filas.items():
+        ResumenVentaDiaria.objects.get_or_create(usuario_id=usuario_id, fecha=fecha, producto_id=producto_id)
+        ResumenVentaDiaria.objects.filter(usuario_id=usuario_id, fecha=fecha, producto_id=producto_id).update(
+            unidades=F('unidades') + signo * unidades,
+            ingresos=F('ingresos') + signo * ingresos,
+            costo=F('costo') + signo * costo,
+            margen=F('margen') + signo * (ingresos - costo)
+        )
+
+
+def _aplicar(venta, filas, signo):
+    if not filas:
+        return
+    fecha = _fecha_local(venta.fecha_venta)
+    with transaction.atomic():
+        if _soporta_upsert():
+            _upsert(venta.usuario_id, fecha, filas, signo)
+        else:
+            _actualizar_con_bloqueo(venta.usuario_id, fecha, filas, signo)
+
+
+def registrar_items(venta, items, signo=1):
+    """Suma (signo=1) o resta (signo=-1) items de una venta completada"""
+    _aplicar(venta, _filas_items(venta, items), signo)
+
+
+def registrar_venta(venta, signo=1):
+    """Suma o resta todos los items de la venta con una consulta agrupada"""
+    _aplicar(venta, _filas_venta(venta), signo)
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def reconstruir(usuario_id=None, desde=None, hasta=None):
+    """
+    Recalcula el resumen desde los items de venta para el rango de fechas
+    (inclusive) y, opcionalmente, un solo usuario. Retorna las filas creadas.
+    """
+    from .models import ItemVenta, ResumenVentaDiaria
+
+    resumenes = ResumenVentaDiaria.objects.all()
+    items = ItemVenta.objects.filter(venta__estado=ESTADO_CONTABLE)
+    if usuario_id:
+        resumenes = resumenes.filter(usuario_id=usuario_id)
+        items = items.filter(venta__usuario_id=usuario_id)
+    if desde:
+        resumenes = resumenes.filter(fecha__gte=desde)
+        items = items.filter(venta__fecha_venta__gte=_inicio_del_dia(desde))
+    if hasta:
+        resumenes = resumenes.filter(fecha__lte=hasta)
+        items = items.filter(venta__fecha_venta__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+
+    # Agrupado por venta y producto para redondear igual que el mantenimiento incremental
+    agrupado = (
+        items.order_by()
+        .values('venta_id', 'venta__usuario_id', 'venta__fecha_venta', 'venta__porcentaje_descuento', 'producto_id')
+        .annotate(unidades=Sum('cantidad'), subtotal=Sum('subtotal'), costo=Sum(_costo_items()))
+    )
+    acumulado = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+    for fila in agrupado.iterator():
+        clave = (fila['venta__usuario_id'], _fecha_local(fila['venta__fecha_venta']), fila['producto_id'])
+        unidades, ingresos, costo = _fila(
+            fila['unidades'], fila['subtotal'], fila['costo'],
+            _factor_descuento(fila['venta__porcentaje_descuento'])
+        )
+        total = acumulado[clave]
+        total[0] += unidades
+        total[1] += ingresos
+        total[2] += costo
+
+    with transaction.atomic():
+        resumenes.delete()
+        ResumenVentaDiaria.objects.bulk_create(
+            [
+                ResumenVentaDiaria(
+                    usuario_id=usuario, fecha=fecha, producto_id=producto,
+                    unidades=unidades, ingresos=ingresos, costo=costo, margen=ingresos - costo
+                )
+                for (usuario, fecha, producto), (unidades, ingresos, costo) in acumulado.items()
+            ],
+            batch_size=TAMANO_LOTE
+        )
+    return len(acumulado)
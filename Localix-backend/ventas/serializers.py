@@ -1,24 +1,27 @@
 from rest_framework import serializers
 from .models import Cliente, Venta, ItemVenta, Reserva, ItemReserva, PagoReserva
 from productos.models import Producto, VarianteProducto, ColorProducto
+from productos.imagenes import imagen_responsive
 
 class ClienteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cliente
         fields = [
             'id', 'nombre', 'email', 'telefono', 'tipo_documento',
-            'numero_documento', 'direccion', 'fecha_registro', 'activo', 'usuario'
+            'numero_documento', 'direccion', 'fecha_registro', 'activo', 'usuario',
+            'compras', 'total_gastado', 'primera_compra', 'ultima_compra'
         ]
-        read_only_fields = ['usuario']
+        read_only_fields = ['usuario', 'compras', 'total_gastado', 'primera_compra', 'ultima_compra']
 
 class ProductoVentaSerializer(serializers.ModelSerializer):
     categoria = serializers.StringRelatedField(read_only=True)
     imagen_principal_url = serializers.SerializerMethodField()
+    imagen_responsive = serializers.SerializerMethodField()
     colores_disponibles = serializers.SerializerMethodField()  # hola
     
     class Meta:
         model = Producto
-        fields = ['id', 'sku', 'nombre', 'precio', 'stock', 'categoria', 'imagen_principal_url', 'colores_disponibles']
+        fields = ['id', 'sku', 'nombre', 'precio', 'stock', 'categoria', 'imagen_principal_url', 'imagen_responsive', 'colores_disponibles']
     
     def get_imagen_principal_url(self, obj):
         if obj.imagen_principal:
@@ -28,8 +31,19 @@ class ProductoVentaSerializer(serializers.ModelSerializer):
             return obj.imagen_principal.url
         return None
     
+    def get_imagen_responsive(self, obj):
+        """srcset para la grilla del catálogo: evita descargar la imagen completa"""
+        return imagen_responsive(obj.imagen_principal, obj.imagen_rendiciones, self.context.get('request'))
+    
     def get_colores_disponibles(self, obj):
         """Obtiene los colores disponibles del producto"""
+        # Usar los colores activos precargados por ProductoViewSet.get_queryset() si existen
+        colores_activos = getattr(obj, 'colores_activos', None)
+        if colores_activos is not None:
+            return [
+                {'id': c.id, 'nombre': c.nombre, 'hex_code': c.hex_code, 'stock': c.stock}
+                for c in colores_activos
+            ]
         colores = obj.colores.filter(activo=True).values('id', 'nombre', 'hex_code', 'stock')
         return list(colores)
 
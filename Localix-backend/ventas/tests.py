@@ -1,3 +1,797 @@
-from django.test import TestCase
+import logging
+import threading
+import time
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from productos.inventario import ajustar_stock_lote
+from productos.models import Producto, ColorProducto, VarianteProducto, InstantaneaStock, MovimientoStock
+from productos.movimientos import stock_en
+from usuarios.models import Usuario
+from . import numeracion, reportes, rollup, vencimiento
+from .checkout import CheckoutError, crear_items_venta
+from .models import Cliente, ContadorDocumento, Venta, ItemVenta, ResumenVentaDiaria, Reserva, ItemReserva
+
+logger = logging.getLogger(__name__)
+
+
+class VentaConcurrenteTest(TransactionTestCase):
+    """Ventas simultáneas del mismo color no deben dejar stock negativo"""
+
+    STOCK_INICIAL = 10
+    VENTAS = 40
+    HILOS = 8
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='SKU-1', nombre='Bolso', slug='bolso',
+            descripcion_corta='Bolso', descripcion_larga='Bolso de cuero',
+            precio=Decimal('100.00'), costo=Decimal('40.00'),
+        )
+        self.color = ColorProducto.objects.create(
+            producto=self.producto, nombre='Negro', hex_code='#000000',
+            stock=self.STOCK_INICIAL,
+        )
+
+    def _vender(self, _):
+        try:
+            with transaction.atomic():
+                venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+                ItemVenta.objects.create(
+                    venta=venta, producto=self.producto, color=self.color, cantidad=1
+                )
+            return True
+        except ValueError:
+            return False
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    def test_no_sobrevende_con_ventas_concurrentes(self):
+        if connection.vendor == 'sqlite':
+            opciones = connection.settings_dict.get('OPTIONS', {})
+            if opciones.get('transaction_mode') != 'IMMEDIATE':
+                self.skipTest("SQLite requiere transaction_mode='IMMEDIATE' (--settings=Backend.settings_test)")
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.HILOS) as executor:
+            resultados = list(executor.map(self._vender, range(self.VENTAS)))
+        duracion = time.perf_counter() - inicio
+
+        self.color.refresh_from_db()
+        self.producto.refresh_from_db()
+        vendidas = sum(resultados)
+
+        self.assertEqual(vendidas, self.STOCK_INICIAL)
+        self.assertEqual(self.color.stock, 0)
+        self.assertEqual(self.producto.stock, 0)
+        self.assertEqual(self.producto.vendidos, self.STOCK_INICIAL)
+        self.assertEqual(
+            ItemVenta.objects.filter(color=self.color).count(), self.STOCK_INICIAL
+        )
+        logger.info(
+            "%s ventas concurrentes en %.3fs (%.1f ventas/s)",
+            self.VENTAS, duracion, self.VENTAS / duracion
+        )
+
+
+class CheckoutPorLotesTest(TestCase):
+    """El checkout por lotes debe costar las mismas consultas sin importar el número de líneas"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+
+    def _crear_productos(self, cantidad, prefijo):
+        items = []
+        for i in range(cantidad):
+            producto = Producto.objects.create(
+                usuario=self.usuario, sku=f'{prefijo}-{i}', nombre=f'Producto {prefijo} {i}',
+                slug=f'{prefijo.lower()}-{i}', descripcion_corta='Producto', descripcion_larga='Producto',
+                precio=Decimal('10.00'), costo=Decimal('4.00'),
+            )
+            if i % 2:
+                color = ColorProducto.objects.create(
+                    producto=producto, nombre='Rojo', hex_code='#FF0000', stock=5
+                )
+                items.append({'producto_id': producto.id, 'color_id': color.id, 'cantidad': 2})
+            else:
+                Producto.objects.filter(pk=producto.pk).update(stock=5)
+                items.append({'producto_id': producto.id, 'cantidad': 2})
+        return items
+
+    def _consultas_checkout(self, items):
+        venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        with CaptureQueriesContext(connection) as contexto:
+            crear_items_venta(venta, items)
+        return venta, len(contexto.captured_queries)
+
+    def test_consultas_constantes(self):
+        _, consultas_pocas = self._consultas_checkout(self._crear_productos(4, 'A'))
+        venta, consultas_muchas = self._consultas_checkout(self._crear_productos(20, 'B'))
+
+        self.assertEqual(consultas_pocas, consultas_muchas)
+        self.assertEqual(venta.items.count(), 20)
+        self.assertEqual(venta.total, Decimal('400.00'))
+        self.assertFalse(Producto.objects.filter(sku__startswith='B-').exclude(stock=3).exists())
+        self.assertFalse(ColorProducto.objects.filter(producto__sku__startswith='B-').exclude(stock=3).exists())
+        self.assertFalse(Producto.objects.filter(sku__startswith='B-').exclude(vendidos=2).exists())
+
+    def test_stock_insuficiente_revierte_todo(self):
+        items = self._crear_productos(2, 'C')
+        items[1]['cantidad'] = 6
+        venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+
+        with self.assertRaises(CheckoutError):
+            with transaction.atomic():
+                crear_items_venta(venta, items)
+
+        self.assertEqual(venta.items.count(), 0)
+        self.assertFalse(Producto.objects.filter(sku__startswith='C-').exclude(stock=5).exists())
+
+    def _rechaza(self, items, mensaje):
+        venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        with self.assertRaisesMessage(CheckoutError, mensaje):
+            with transaction.atomic():
+                crear_items_venta(venta, items)
+
+    def test_ids_invalidos_y_ajenos(self):
+        items = self._crear_productos(2, 'D')
+        propio = Producto.objects.get(pk=items[0]['producto_id'])
+        talla = VarianteProducto.objects.create(producto=propio, nombre='Talla', valor='M', sku='D-0-M', stock=5)
+        otro_usuario = Usuario.objects.create(username='otra', email='otra@example.com')
+        ajeno = Producto.objects.create(
+            usuario=otro_usuario, sku='AJ-1', nombre='Ajeno', slug='ajeno',
+            descripcion_corta='Ajeno', descripcion_larga='Ajeno',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        talla_ajena = VarianteProducto.objects.create(producto=ajeno, nombre='Talla', valor='M', sku='AJ-1-M', stock=5)
+
+        self._rechaza([{'producto_id': 'abc', 'cantidad': 1}], 'Id de producto inválido: abc')
+        self._rechaza([{'producto_id': propio.id, 'variante_id': 'x', 'cantidad': 1}], 'Id de variante inválido: x')
+        self._rechaza([{'producto_id': ajeno.id, 'cantidad': 1}], f'Producto con id {ajeno.id} no existe')
+        self._rechaza(
+            [{'producto_id': propio.id, 'variante_id': talla_ajena.id, 'cantidad': 1}],
+            f'La variante con id {talla_ajena.id} no existe'
+        )
+        # Una variante de otro producto del mismo usuario tampoco se acepta
+        self._rechaza(
+            [{'producto_id': items[1]['producto_id'], 'color_id': items[1]['color_id'], 'variante_id': talla.id, 'cantidad': 1}],
+            f'La variante con id {talla.id} no existe'
+        )
+        # El mismo id como texto y como número es la misma línea
+        self._rechaza([{'producto_id': propio.id, 'cantidad': 1}, {'producto_id': str(propio.id), 'cantidad': 1}], 'Producto duplicado')
+
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        respuesta = cliente.post('/api/ventas/ventas/crear_venta_rapida/', {
+            'cliente_nombre': 'Mostrador', 'metodo_pago': 'efectivo',
+            'items': [{'producto_id': 'abc', 'cantidad': 1}],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 400, respuesta.content)
+        self.assertFalse(Venta.objects.filter(items__isnull=False).exists())
+
+
+class NumeracionDocumentosTest(TestCase):
+    """Cada usuario tiene su propia secuencia correlativa por tipo de documento"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.otro_usuario = Usuario.objects.create(username='otra', email='otra@example.com')
+
+    def test_secuencia_por_usuario(self):
+        primera = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        segunda = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        ajena = Venta.objects.create(usuario=self.otro_usuario, cliente_nombre='Mostrador')
+
+        self.assertEqual(primera.numero_venta, 'VEN-000001')
+        self.assertEqual(segunda.numero_venta, 'VEN-000002')
+        self.assertEqual(ajena.numero_venta, 'VEN-000001')
+
+    def test_reservar_bloque(self):
+        Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+
+        self.assertEqual(
+            numeracion.reservar_documentos(self.usuario.id, 'venta', 3),
+            ['VEN-000002', 'VEN-000003', 'VEN-000004']
+        )
+        self.assertEqual(numeracion.siguiente_documento(self.usuario.id, 'venta'), 'VEN-000005')
+        self.assertEqual(numeracion.siguiente_documento(self.usuario.id, 'pedido'), 'PED-000001')
+
+    def test_rollback_no_deja_huecos(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+                raise RuntimeError
+
+        venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        self.assertEqual(venta.numero_venta, 'VEN-000001')
+
+    def test_inicializar_contadores_desde_documentos_existentes(self):
+        Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador', numero_venta='VEN-000041')
+        Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador', numero_venta='VEN-000007')
+        Venta.objects.create(usuario=self.otro_usuario, cliente_nombre='Mostrador', numero_venta='sin-formato')
+        migracion = import_module('ventas.migrations.0004_contadordocumento')
+        self.assertEqual(migracion._extraer_numero('VEN-000041'), 41)
+        self.assertIsNone(migracion._extraer_numero('sin-formato'))
+
+        migracion.inicializar_contadores(django_apps, None)
+
+        self.assertEqual(ContadorDocumento.objects.count(), 1)
+        self.assertEqual(numeracion.siguiente_documento(self.usuario.id, 'venta'), 'VEN-000042')
+        self.assertEqual(numeracion.siguiente_documento(self.otro_usuario.id, 'venta'), 'VEN-000001')
+
+
+class TotalesVentaTest(TestCase):
+    """Los totales se mantienen con deltas en Decimal y pueden diferirse"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='SKU-T', nombre='Gorra', slug='gorra',
+            descripcion_corta='Gorra', descripcion_larga='Gorra bordada',
+            precio=Decimal('19.99'), costo=Decimal('8.00'), gestion_stock=False,
+        )
+        self.venta = Venta.objects.create(
+            usuario=self.usuario, cliente_nombre='Mostrador', porcentaje_descuento=Decimal('10.00')
+        )
+
+    def _agregar(self, cantidad, descuento_item=Decimal('0.00')):
+        return ItemVenta.objects.create(
+            venta=self.venta, producto=self.producto, cantidad=cantidad, descuento_item=descuento_item
+        )
+
+    def test_totales_incrementales(self):
+        self._agregar(3)
+        item = self._agregar(1, Decimal('0.99'))
+
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.subtotal, Decimal('78.97'))
+        self.assertEqual(self.venta.descuento, Decimal('7.90'))
+        self.assertEqual(self.venta.total, Decimal('71.07'))
+
+        item.delete()
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.subtotal, Decimal('59.97'))
+        self.assertEqual(self.venta.total, Decimal('53.97'))
+
+    def test_totales_diferidos(self):
+        with CaptureQueriesContext(connection) as contexto:
+            with self.venta.totales_diferidos():
+                for _ in range(5):
+                    self._agregar(1)
+        actualizaciones = [
+            q for q in contexto.captured_queries
+            if q['sql'].startswith('UPDATE') and 'ventas_venta' in q['sql']
+        ]
+
+        self.assertEqual(len(actualizaciones), 1)
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.subtotal, Decimal('99.95'))
+        self.assertEqual(self.venta.total, Decimal('89.95'))
+
+
+class ResumenVentasTest(TestCase):
+    """El resumen se agrega en la base de datos y respeta los filtros"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        for total, metodo in [('100.00', 'efectivo'), ('50.50', 'yape'), ('20.00', 'efectivo')]:
+            venta = Venta.objects.create(
+                usuario=self.usuario, cliente_nombre='Mostrador', estado='completada', metodo_pago=metodo
+            )
+            venta.establecer_totales(Decimal(total))
+
+    def test_resumen_y_series(self):
+        ventas = Venta.objects.filter(usuario=self.usuario)
+
+        resumen = reportes.resumen_ventas(ventas)
+        series = reportes.series_ventas(ventas)
+
+        self.assertEqual(resumen['total_ventas'], 3)
+        self.assertEqual(resumen['total_ingresos'], 170.5)
+        self.assertEqual(len(series['por_dia']), 1)
+        self.assertEqual(series['por_mes'][0]['total_ingresos'], 170.5)
+
+    def test_filtros(self):
+        ventas = Venta.objects.filter(usuario=self.usuario)
+        hoy = timezone.localdate().isoformat()
+
+        filtradas = reportes.filtrar_ventas(ventas, {'metodo_pago': 'efectivo', 'fecha_desde': hoy, 'fecha_hasta': hoy})
+        self.assertEqual(reportes.resumen_ventas(filtradas)['total_ingresos'], 120.0)
+        with self.assertRaises(ValueError):
+            reportes.filtrar_ventas(ventas, {'fecha_desde': '17/10/2026'})
+
+
+class ResumenVentaDiariaTest(TestCase):
+    """El resumen diario sigue las transiciones de estado de la venta"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='SKU-R', nombre='Cartera', slug='cartera',
+            descripcion_corta='Cartera', descripcion_larga='Cartera de cuero',
+            precio=Decimal('50.00'), costo=Decimal('20.00'), gestion_stock=False,
+        )
+
+    def _vender(self, cantidad, estado='completada'):
+        venta = Venta.objects.create(
+            usuario=self.usuario, cliente_nombre='Mostrador', estado=estado, porcentaje_descuento=Decimal('10.00')
+        )
+        ItemVenta.objects.create(venta=venta, producto=self.producto, cantidad=cantidad)
+        return venta
+
+    def _resumen(self):
+        return ResumenVentaDiaria.objects.get(usuario=self.usuario, producto=self.producto)
+
+    def test_mantenimiento_incremental(self):
+        self._vender(2)
+        pendiente = self._vender(1, estado='pendiente')
+        resumen = self._resumen()
+        self.assertEqual(resumen.unidades, 2)
+        self.assertEqual(resumen.ingresos, Decimal('90.00'))
+        self.assertEqual(resumen.margen, Decimal('50.00'))
+
+        pendiente = Venta.objects.get(pk=pendiente.pk)
+        pendiente.estado = 'completada'
+        pendiente.save()
+        self.assertEqual(self._resumen().unidades, 3)
+
+        pendiente.estado = 'reembolsada'
+        pendiente.save()
+        self.assertEqual(self._resumen().unidades, 2)
+        self.assertEqual(self._resumen().ingresos, Decimal('90.00'))
+
+    def test_cambio_de_costo_antes_de_cancelar(self):
+        venta = self._vender(2)
+        otra = self._vender(1)
+        self.assertEqual(self._resumen().costo, Decimal('60.00'))
+
+        # El costo del producto cambia después de la venta
+        Producto.objects.filter(pk=self.producto.pk).update(costo=Decimal('35.00'))
+
+        venta = Venta.objects.get(pk=venta.pk)
+        venta.estado = 'cancelada'
+        venta.save()
+        resumen = self._resumen()
+        self.assertEqual(resumen.unidades, 1)
+        self.assertEqual(resumen.costo, Decimal('20.00'))
+        self.assertEqual(resumen.margen, Decimal('25.00'))
+
+        # Eliminar la última venta deja el día en cero, sin costo ni margen sobrantes
+        Venta.objects.get(pk=otra.pk).delete()
+        resumen = self._resumen()
+        self.assertEqual((resumen.unidades, resumen.ingresos, resumen.costo, resumen.margen), (0, 0, 0, 0))
+        datos = reportes.rentabilidad(ResumenVentaDiaria.objects.filter(usuario=self.usuario))
+        self.assertEqual(datos['totales']['costo'], 0)
+
+    def test_reconstruir(self):
+        self._vender(2)
+        self._vender(3)
+        esperado = self._resumen()
+        ResumenVentaDiaria.objects.all().delete()
+
+        filas = rollup.reconstruir(usuario_id=self.usuario.id)
+
+        reconstruido = self._resumen()
+        self.assertEqual(filas, 1)
+        self.assertEqual(reconstruido.unidades, esperado.unidades)
+        self.assertEqual(reconstruido.ingresos, esperado.ingresos)
+        self.assertEqual(reconstruido.costo, esperado.costo)
+
+        datos = reportes.rentabilidad(ResumenVentaDiaria.objects.filter(usuario=self.usuario))
+        self.assertEqual(datos['totales']['unidades'], 5)
+        self.assertEqual(datos['por_producto'][0]['margen'], 125.0)
+
+
+class CatalogoVentasTest(TestCase):
+    """El catálogo se pagina por cursor y una página cacheada no consulta la base de datos"""
+
+    URL = '/api/ventas/productos/catalogo/'
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        for i in range(30):
+            producto = Producto.objects.create(
+                usuario=self.usuario, sku=f'SKU-{i}', nombre=f'Producto {i}', slug=f'producto-{i}',
+                descripcion_corta='Producto', descripcion_larga='Producto',
+                precio=Decimal('10.00'), costo=Decimal('4.00'), estado='publicado',
+            )
+            ColorProducto.objects.create(producto=producto, nombre='Rojo', hex_code='#FF0000', stock=3)
+            ColorProducto.objects.create(producto=producto, nombre='Azul', hex_code='#0000FF', stock=4, activo=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _consultar(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json(), len(contexto.captured_queries)
+
+    def test_paginas_por_cursor(self):
+        primera, consultas_primera = self._consultar(self.URL)
+        self.assertEqual(len(primera['results']), 24)
+        self.assertTrue(all(len(p['colores_disponibles']) == 1 for p in primera['results']))
+
+        segunda, consultas_segunda = self._consultar(primera['next'])
+        self.assertEqual(len(segunda['results']), 6)
+        self.assertIsNone(segunda['next'])
+        self.assertEqual(consultas_primera, consultas_segunda)
+
+        ids = [p['id'] for p in primera['results'] + segunda['results']]
+        self.assertEqual(len(set(ids)), 30)
+
+    def test_cache_e_invalidacion(self):
+        datos, _ = self._consultar(self.URL)
+        _, consultas = self._consultar(self.URL)
+        self.assertEqual(consultas, 0)
+
+        color = ColorProducto.objects.get(producto_id=datos['results'][0]['id'], activo=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            color.reducir_stock(2)
+
+        datos, consultas = self._consultar(self.URL)
+        self.assertGreater(consultas, 0)
+        self.assertEqual(datos['results'][0]['colores_disponibles'][0]['stock'], 1)
+
+
+class MovimientosStockTest(TestCase):
+    """El libro de movimientos más sus instantáneas reproduce el stock actual y el de cualquier fecha"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='CAM-01', nombre='Camisa', slug='camisa',
+            descripcion_corta='Camisa', descripcion_larga='Camisa',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        self.rojo = ColorProducto.objects.create(producto=self.producto, nombre='Rojo', hex_code='#FF0000', stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _libro(self, fecha=None):
+        fila = stock_en('color', [self.rojo.pk], fecha)[self.rojo.pk]
+        return fila['stock'], fila['reservado']
+
+    def _consolidar(self):
+        call_command('consolidar_stock', stdout=StringIO())
+
+    def test_libro_e_instantaneas(self):
+        # La primera consolidación abre el libro con el stock existente
+        self._consolidar()
+        self.assertEqual(self._libro(), (10, 0))
+        antes_de_vender = timezone.now()
+
+        venta = Venta.objects.create(usuario=self.usuario, cliente_nombre='Mostrador')
+        with transaction.atomic():
+            crear_items_venta(venta, [{'producto_id': self.producto.id, 'color_id': self.rojo.id, 'cantidad': 3}])
+        reserva = Reserva.objects.create(usuario=self.usuario)
+        ItemReserva.objects.create(reserva=reserva, producto=self.producto, color=self.rojo, cantidad=2)
+        self.assertEqual(self._libro(), (7, 2))
+        respuesta = self.client.post(f'/api/ventas/reservas/{reserva.id}/cancelar/')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        aplicado, _ = ajustar_stock_lote(self.usuario, [{'color': self.rojo.id, 'delta': 5}])
+        self.assertTrue(aplicado)
+
+        self.rojo.refresh_from_db()
+        self.assertEqual((self.rojo.stock, self.rojo.stock_reservado), (12, 0))
+        self.assertEqual(self._libro(), (12, 0))
+        self.assertEqual(self._libro(antes_de_vender), (10, 0))
+        self.assertEqual(
+            list(MovimientoStock.objects.order_by('id').values_list('tipo', 'stock', 'reservado', 'referencia')),
+            [
+                ('conciliacion', 10, 0, 'consolidar_stock'),
+                ('venta', -3, 0, f'venta:{venta.id}'),
+                ('reserva', 0, 2, f'reserva:{reserva.id}'),
+                ('liberacion', 0, -2, f'reserva:{reserva.id}'),
+                ('ajuste', 5, 0, 'ajuste_masivo'),
+            ]
+        )
+
+        # Sin diferencias no hay conciliación; sin movimientos nuevos no hay instantánea nueva
+        self._consolidar()
+        self._consolidar()
+        self.assertEqual(MovimientoStock.objects.filter(tipo='conciliacion').count(), 1)
+        self.assertEqual(InstantaneaStock.objects.filter(color=self.rojo).count(), 2)
+
+        # Una edición directa del stock se concilia en la siguiente consolidación
+        self.rojo.stock = 20
+        self.rojo.save()
+        self._consolidar()
+        self.assertEqual(MovimientoStock.objects.filter(tipo='conciliacion').latest('id').stock, 8)
+        self.assertEqual(self._libro(), (20, 0))
+        self.assertEqual(self._libro(antes_de_vender), (10, 0))
+
+        respuesta = self.client.get(f'/api/productos/productos/{self.producto.slug}/historial_stock/', {'fecha': antes_de_vender.isoformat()})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()['filas'], [{'tipo': 'color', 'id': self.rojo.id, 'nombre': 'Rojo', 'stock': 10, 'reservado': 0}])
+        respuesta = self.client.get(f'/api/productos/productos/{self.producto.slug}/historial_stock/', {'fecha': 'ayer'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_eliminar_filas_conserva_el_libro(self):
+        self._consolidar()
+        aplicado, _ = ajustar_stock_lote(self.usuario, [{'color': self.rojo.id, 'delta': -3}])
+        self.assertTrue(aplicado)
+        self.assertEqual(
+            set(MovimientoStock.objects.values_list('fila', 'sku', 'descripcion')),
+            {('color', 'CAM-01', 'Camisa / Rojo')}
+        )
+
+        self.rojo.delete()
+        movimientos = MovimientoStock.objects.order_by('id')
+        self.assertEqual(
+            list(movimientos.values_list('tipo', 'stock', 'fila', 'color', 'producto', 'sku', 'descripcion')),
+            [
+                ('conciliacion', 10, 'color', None, self.producto.id, 'CAM-01', 'Camisa / Rojo'),
+                ('ajuste', -3, 'color', None, self.producto.id, 'CAM-01', 'Camisa / Rojo'),
+            ]
+        )
+        self.assertEqual(InstantaneaStock.objects.filter(fila='color', color__isnull=True).count(), 1)
+
+        # Los movimientos del color eliminado no se suman al producto, que ahora no tiene desglose
+        self.producto.refresh_from_db()
+        self.assertEqual(stock_en('producto', [self.producto.pk])[self.producto.pk]['stock'], 0)
+        self._consolidar()
+        self.assertEqual(stock_en('producto', [self.producto.pk])[self.producto.pk]['stock'], self.producto.stock)
+
+        total = MovimientoStock.objects.count()
+        self.producto.delete()
+        self.assertEqual(MovimientoStock.objects.count(), total)
+        self.assertFalse(MovimientoStock.objects.filter(producto__isnull=False).exists())
+        self.assertEqual(set(MovimientoStock.objects.values_list('sku', flat=True)), {'CAM-01'})
+        self.assertEqual(InstantaneaStock.objects.filter(producto__isnull=True).count(), InstantaneaStock.objects.count())
+
+
+class VencimientoReservasTest(TestCase):
+    """Las reservas vencidas liberan su stock reservado por lotes, con consultas constantes"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='CAM-01', nombre='Camisa', slug='camisa',
+            descripcion_corta='Camisa', descripcion_larga='Camisa',
+            precio=Decimal('10.00'), costo=Decimal('4.00'),
+        )
+        self.rojo = ColorProducto.objects.create(producto=self.producto, nombre='Rojo', hex_code='#FF0000', stock=100)
+        self.pantalon = Producto.objects.create(
+            usuario=self.usuario, sku='PAN-01', nombre='Pantalón', slug='pantalon',
+            descripcion_corta='Pantalón', descripcion_larga='Pantalón',
+            precio=Decimal('20.00'), costo=Decimal('8.00'),
+        )
+        self.talla = VarianteProducto.objects.create(producto=self.pantalon, nombre='Talla', valor='32', sku='PAN-01-32', stock=100)
+
+    def _reservar(self, vencimiento_en, color=None, variante=None, cantidad=1):
+        reserva = Reserva.objects.create(usuario=self.usuario, fecha_vencimiento=timezone.now() + vencimiento_en)
+        ItemReserva.objects.create(
+            reserva=reserva, producto=variante.producto if variante else self.producto,
+            color=color, variante=variante, cantidad=cantidad
+        )
+        return reserva
+
+    def _reservado(self):
+        self.rojo.refresh_from_db()
+        self.talla.refresh_from_db()
+        return self.rojo.stock_reservado, self.talla.stock_reservado
+
+    def test_vence_y_libera(self):
+        vencida_color = self._reservar(timezone.timedelta(hours=-1), color=self.rojo, cantidad=2)
+        vencida_variante = self._reservar(timezone.timedelta(minutes=-5), variante=self.talla, cantidad=3)
+        vigente = self._reservar(timezone.timedelta(days=1), color=self.rojo, cantidad=4)
+        self.assertEqual(self._reservado(), (6, 3))
+
+        salida = StringIO()
+        call_command('vencer_reservas', stdout=salida)
+        self.assertIn('Reservas vencidas: 2, unidades liberadas: 5', salida.getvalue())
+
+        self.assertEqual(self._reservado(), (4, 0))
+        estados = dict(Reserva.objects.values_list('pk', 'estado'))
+        self.assertEqual(
+            (estados[vencida_color.pk], estados[vencida_variante.pk], estados[vigente.pk]),
+            ('vencida', 'vencida', 'activa')
+        )
+        self.assertEqual(MovimientoStock.objects.filter(tipo='liberacion').count(), 2)
+        # Una reserva vencida ya no se puede cancelar (su stock ya se liberó)
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        respuesta = client.post(f'/api/ventas/reservas/{vencida_color.id}/cancelar/')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self._reservado(), (4, 0))
+
+    def test_consultas_constantes_por_lote(self):
+        def consultas(cantidad):
+            for i in range(cantidad):
+                self._reservar(timezone.timedelta(hours=-1), color=self.rojo)
+                self._reservar(timezone.timedelta(hours=-1), variante=self.talla)
+            with CaptureQueriesContext(connection) as contexto:
+                resultado = vencimiento.vencer_reservas()
+            self.assertEqual(resultado['reservas'], cantidad * 2)
+            return len(contexto)
+
+        self.assertEqual(consultas(2), consultas(20))
+        self.assertEqual(self._reservado(), (0, 0))
+
+        # Con lotes pequeños se recorren todas
+        for i in range(5):
+            self._reservar(timezone.timedelta(hours=-1), color=self.rojo)
+        self.assertEqual(vencimiento.vencer_reservas(tamano_lote=2)['reservas'], 5)
+        self.assertEqual(self._reservado(), (0, 0))
+
+
+
+class HistorialClienteTest(TestCase):
+    """Las estadísticas del cliente siguen sus ventas completadas y el historial se pagina por cursor"""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.cliente = Cliente.objects.create(usuario=self.usuario, nombre='Ana Torres')
+        self.producto = Producto.objects.create(
+            usuario=self.usuario, sku='SKU-H', nombre='Billetera', slug='billetera',
+            descripcion_corta='Billetera', descripcion_larga='Billetera de cuero',
+            precio=Decimal('25.00'), costo=Decimal('10.00'), gestion_stock=False,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _vender(self, cantidad, estado='completada', cliente=None):
+        venta = Venta.objects.create(usuario=self.usuario, cliente=cliente or self.cliente, estado=estado)
+        with venta.totales_diferidos():
+            ItemVenta.objects.create(venta=venta, producto=self.producto, cantidad=cantidad)
+        return venta
+
+    def _estadisticas(self, cliente=None):
+        cliente = Cliente.objects.get(pk=(cliente or self.cliente).pk)
+        return cliente.compras, cliente.total_gastado
+
+    def test_estadisticas_incrementales(self):
+        primera = self._vender(2)
+        pendiente = self._vender(1, estado='pendiente')
+        self.assertEqual(self._estadisticas(), (1, Decimal('50.00')))
+
+        pendiente = Venta.objects.get(pk=pendiente.pk)
+        pendiente.estado = 'completada'
+        pendiente.save()
+        self.assertEqual(self._estadisticas(), (2, Decimal('75.00')))
+
+        # Un item agregado a una venta completada cambia su total
+        ItemVenta.objects.create(venta=pendiente, producto=self.producto, cantidad=1)
+        self.assertEqual(self._estadisticas(), (2, Decimal('100.00')))
+
+        cliente = Cliente.objects.get(pk=self.cliente.pk)
+        self.assertEqual(cliente.primera_compra, primera.fecha_venta)
+        self.assertEqual(cliente.ultima_compra, pendiente.fecha_venta)
+
+        primera = Venta.objects.get(pk=primera.pk)
+        primera.estado = 'reembolsada'
+        primera.save()
+        self.assertEqual(self._estadisticas(), (1, Decimal('50.00')))
+        self.assertEqual(Cliente.objects.get(pk=self.cliente.pk).primera_compra, pendiente.fecha_venta)
+
+        # La venta pasa a otro cliente
+        otro = Cliente.objects.create(usuario=self.usuario, nombre='Luis Rojas')
+        pendiente.cliente = otro
+        pendiente.save()
+        self.assertEqual(self._estadisticas(), (0, Decimal('0.00')))
+        self.assertEqual(self._estadisticas(otro), (1, Decimal('50.00')))
+
+        Venta.objects.get(pk=pendiente.pk).delete()
+        self.assertEqual(self._estadisticas(otro), (0, Decimal('0.00')))
+        self.assertIsNone(Cliente.objects.get(pk=otro.pk).ultima_compra)
+
+    def test_recalcular(self):
+        self._vender(2)
+        self._vender(3)
+        Cliente.objects.update(compras=0, total_gastado=Decimal('0.00'), primera_compra=None)
+
+        call_command('recalcular_estadisticas_clientes', usuario=self.usuario.id, stdout=StringIO())
+
+        self.assertEqual(self._estadisticas(), (2, Decimal('125.00')))
+        self.assertIsNotNone(Cliente.objects.get(pk=self.cliente.pk).primera_compra)
+
+    def test_historial_por_cursor(self):
+        for i in range(25):
+            self._vender(1 + i % 2)
+        self._vender(4, estado='cancelada')
+        url = f'/api/ventas/clientes/{self.cliente.id}/ventas/?page_size=10'
+
+        ids = []
+        consultas = []
+        while url:
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            consultas.append(len(contexto))
+            ids += [venta['id'] for venta in datos['ventas']]
+            url = datos['next']
+
+        self.assertEqual(len(ids), 26)
+        self.assertEqual(len(set(ids)), 26)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(consultas[0], consultas[1])
+        self.assertEqual(datos['estadisticas']['compras'], 25)
+        self.assertEqual(datos['estadisticas']['total_gastado'], '925.00')
+        self.assertEqual(datos['estadisticas']['ticket_promedio'], '37.00')
+        # Las claves anteriores cuentan todas las ventas, incluida la cancelada
+        self.assertEqual(datos['total_ventas'], 26)
+        self.assertEqual(datos['total_gastado'], 1025.0)
+
+
+class BusquedaClientesTest(TestCase):
+    """La búsqueda de clientes usa las columnas normalizadas y crear_rapido no duplica clientes"""
+
+    URL = '/api/ventas/clientes/'
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='tienda', email='tienda@example.com')
+        self.ana = Cliente.objects.create(
+            usuario=self.usuario, nombre='Ana María Torres', email='ana.torres@example.com',
+            telefono='+51 987-654-321', numero_documento='45.678.912'
+        )
+        self.mariana = Cliente.objects.create(usuario=self.usuario, nombre='Mariana Díaz', telefono='987 111 222')
+        otro = Usuario.objects.create(username='otra', email='otra@example.com')
+        Cliente.objects.create(usuario=otro, nombre='Ana Ajena', numero_documento='45678912')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _buscar(self, texto):
+        respuesta = self.client.get(f'{self.URL}buscar/', {'q': texto})
+        self.assertEqual(respuesta.status_code, 200)
+        return [cliente['nombre'] for cliente in respuesta.json()]
+
+    def test_columnas_normalizadas(self):
+        self.assertEqual(self.ana.texto_busqueda, 'ana maria torres ana torres example com')
+        self.assertEqual(self.ana.telefono_normalizado, '51987654321')
+        self.assertEqual(self.ana.telefono_invertido, '12345678915')
+        self.assertEqual(self.ana.documento_normalizado, '45678912')
+        self.mariana.telefono = '(01) 555-0000'
+        self.mariana.save(update_fields=['telefono'])
+        self.mariana.refresh_from_db()
+        self.assertEqual(self.mariana.telefono_normalizado, '015550000')
+        self.assertEqual(self.mariana.telefono_invertido, '000055510')
+
+    def test_busqueda_por_nombre_telefono_y_documento(self):
+        # El nombre que empieza por el texto va primero
+        self.assertEqual(self._buscar('MARIA'), ['Mariana Díaz', 'Ana María Torres'])
+        self.assertEqual(self._buscar('ana torres'), ['Ana María Torres'])
+        self.assertEqual(self._buscar('987-111'), ['Mariana Díaz'])
+        self.assertEqual(self._buscar('51 987'), ['Ana María Torres'])
+        # El número local, sin código de país, encuentra '+51 987-654-321'
+        self.assertEqual(self._buscar('987 654 321'), ['Ana María Torres'])
+        self.assertEqual(self._buscar('654-321'), ['Ana María Torres'])
+        self.assertEqual(self._buscar('45678912'), ['Ana María Torres'])
+        self.assertEqual(self._buscar('zzz'), [])
+        self.assertEqual(self.client.get(f'{self.URL}buscar/', {'q': ' '}).status_code, 400)
+
+    def test_crear_rapido_sin_duplicados(self):
+        respuesta = self.client.post(f'{self.URL}crear_rapido/', {'nombre': 'A. Torres', 'numero_documento': '45678912'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['id'], self.ana.id)
+
+        respuesta = self.client.post(f'{self.URL}crear_rapido/', {'nombre': 'mariana diaz', 'telefono': '987111222'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['id'], self.mariana.id)
+
+        # Con y sin código de país es el mismo teléfono
+        respuesta = self.client.post(f'{self.URL}crear_rapido/', {'nombre': 'Mariana Díaz', 'telefono': '+51 987111222'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['id'], self.mariana.id)
+        respuesta = self.client.post(f'{self.URL}crear_rapido/', {'nombre': 'Ana María Torres', 'telefono': '987654321'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['id'], self.ana.id)
+
+        # Mismo teléfono con otro nombre es otro cliente
+        respuesta = self.client.post(f'{self.URL}crear_rapido/', {'nombre': 'Mario Díaz', 'telefono': '987111222'})
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Cliente.objects.filter(usuario=self.usuario).count(), 3)
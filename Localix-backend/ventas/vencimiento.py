@@ -0,0 +1,97 @@
+"""
+Vencimiento de reservas (comando vencer_reservas)
+
+Las reservas activas con fecha_vencimiento pasada se marcan como vencidas y
+su stock reservado vuelve a estar disponible. Se procesan por lotes: cada
+lote se obtiene con un recorrido por rango del índice parcial de reservas
+activas, se bloquea (saltando las que otra petición está cancelando o
+finalizando) y libera el stock con un UPDATE ... CASE por tabla, de modo que
+el costo de un lote no depende de cuántas reservas o items tenga.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from productos.catalogo import invalidar_catalogo_de_productos
+from productos.inventario import liberar_reservado_lote
+from productos.models import ColorProducto, VarianteProducto
+from productos.movimientos import movimiento, registrar
+from .models import ItemReserva, Reserva
+
+TAMANO_LOTE = 1000
+
+
+def _liberar(model, campo, items):
+    """
+    Libera el stock reservado de los items sobre las filas de un modelo.
+    Nunca deja stock_reservado negativo: si una fila tiene menos reservado
+    que la suma de sus items, se libera lo que queda. Retorna los movimientos.
+    """
+    por_fila = defaultdict(list)
+    for item in items:
+        if item[campo]:
+            por_fila[item[campo]].append(item)
+    if not por_fila:
+        return []
+
+    reservado = dict(
+        model.objects.select_for_update(of=('self',)).filter(pk__in=por_fila)
+        .order_by('pk').values_list('pk', 'stock_reservado')
+    )
+    liberado = {}
+    movimientos = []
+    for pk, items_fila in por_fila.items():
+        restante = reservado.get(pk, 0)
+        for item in items_fila:
+            cantidad = min(restante, item['cantidad'])
+            restante -= cantidad
+            movimientos.append(movimiento(
+                'liberacion', item['producto_id'], item['color_id'], item['variante_id'],
+                reservado=-cantidad, referencia=f"reserva:{item['reserva_id']}"
+            ))
+        liberado[pk] = reservado.get(pk, 0) - restante
+    liberar_reservado_lote(model, {pk: cantidad for pk, cantidad in liberado.items() if cantidad})
+    return movimientos
+
+
+def _vencer_lote(ahora, tamano_lote):
+    """Vence un lote de reservas; retorna (reservas vencidas, unidades liberadas)"""
+    with transaction.atomic():
+        ids = list(
+            Reserva.objects.select_for_update(skip_locked=True)
+            .filter(estado='activa', fecha_vencimiento__lt=ahora)
+            .order_by('fecha_vencimiento').values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return 0, 0
+        items = list(
+            ItemReserva.objects.filter(reserva_id__in=ids, producto__gestion_stock=True)
+            .values('reserva_id', 'producto_id', 'color_id', 'variante_id', 'cantidad')
+        )
+        # Solo los productos con gestión de stock reservan, en el color si lo hay
+        # y si no en la variante (igual que en ItemReserva.save)
+        con_color = [item for item in items if item['color_id']]
+        sin_color = [item for item in items if not item['color_id']]
+        movimientos = _liberar(ColorProducto, 'color_id', con_color) + _liberar(VarianteProducto, 'variante_id', sin_color)
+        Reserva.objects.filter(pk__in=ids).update(estado='vencida')
+        registrar(movimientos)
+        if movimientos:
+            invalidar_catalogo_de_productos({m.producto_id for m in movimientos})
+    return len(ids), -sum(m.reservado for m in movimientos)
+
+
+def vencer_reservas(ahora=None, tamano_lote=TAMANO_LOTE):
+    """
+    Vence todas las reservas activas con fecha_vencimiento anterior a `ahora`.
+    Retorna un Counter con: reservas y unidades liberadas.
+    """
+    ahora = ahora or timezone.now()
+    resultado = Counter()
+    while True:
+        reservas, unidades = _vencer_lote(ahora, tamano_lote)
+        if not reservas:
+            return resultado
+        resultado['reservas'] += reservas
+        resultado['unidades'] += unidades
@@ -5,6 +5,7 @@ from django.views.decorators.http import require_http_methods
 from django.db import transaction
 from django.utils import timezone
 from django.db import models
+from django.core.cache import cache
 import json
 from decimal import Decimal
 from datetime import datetime
@@ -16,10 +17,16 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import serializers
 
-from .models import Venta, ItemVenta, Cliente, Reserva, ItemReserva, PagoReserva
+from .models import Venta, ItemVenta, Cliente, Reserva, ItemReserva, PagoReserva, ResumenVentaDiaria
+from .busqueda import buscar_clientes, buscar_duplicado
+from .checkout import CheckoutError, crear_items_venta
+from .historial import HistorialVentasCursorPagination, estadisticas, venta_de_historial
+from .reportes import filtrar_ventas, resumen_ventas, series_ventas, filtrar_resumen_diario, rentabilidad
 from .serializers import ClienteSerializer, VentaSerializer, VentaCreateSerializer, ItemVentaSerializer, ProductoVentaSerializer, ReservaSerializer, ReservaCreateSerializer, PagoReservaSerializer
 from productos.models import Producto, VarianteProducto, ColorProducto
-from django.db.models import Q
+from productos.busqueda import buscar_productos
+from productos.catalogo import CATALOGO_CACHE_TIMEOUT, CatalogoCursorPagination, clave_pagina_catalogo
+from productos.movimientos import registrar
 # import mercadopago  # Eliminado
 from django.conf import settings
 
@@ -80,90 +87,53 @@ class ClienteViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def ventas(self, request, pk=None):
-        """Obtener todas las ventas de un cliente específico"""
-        try:
-            cliente = self.get_object()
-            ventas = Venta.objects.filter(cliente=cliente).select_related('cliente').prefetch_related('items__producto').order_by('-fecha_venta')
-            
-            # Serializar las ventas con información detallada
-            ventas_data = []
-            for venta in ventas:
-                venta_info = {
-                    'id': venta.id,
-                    'numero_venta': venta.numero_venta,
-                    'fecha_venta': venta.fecha_venta,
-                    'total': str(venta.total),
-                    'estado': venta.estado,
-                    'metodo_pago': venta.metodo_pago,
-                    'items': []
-                }
-                
-                # Agregar información de cada item
-                for item in venta.items.all():
-                    # Obtener URL de la imagen del producto
-                    imagen_url = None
-                    if item.producto.imagen_principal:
-                        request = self.request
-                        if request is not None:
-                            imagen_url = request.build_absolute_uri(item.producto.imagen_principal.url)
-                        else:
-                            imagen_url = item.producto.imagen_principal.url
-                    
-                    # Agregar información del color si existe
-                    color_info = None
-                    if item.color:
-                        color_info = {
-                            'id': item.color.id,
-                            'nombre': item.color.nombre,
-                            'hex_code': item.color.hex_code
-                        }
-                    
-                    item_info = {
-                        'producto_id': item.producto.id,
-                        'producto_nombre': item.producto.nombre,
-                        'producto_sku': item.producto.sku,
-                        'producto_imagen_url': imagen_url,
-                        'cantidad': item.cantidad,
-                        'precio_unitario': str(item.precio_unitario),
-                        'subtotal': str(item.subtotal),
-                        'color': color_info
-                    }
-                    if item.variante:
-                        item_info['variante_nombre'] = item.variante.nombre
-                        item_info['variante_id'] = item.variante.id
-                    venta_info['items'].append(item_info)
-                
-                ventas_data.append(venta_info)
-            
-            return Response({
-                'cliente': ClienteSerializer(cliente).data,
-                'ventas': ventas_data,
-                'total_ventas': len(ventas_data),
-                'total_gastado': sum(float(venta['total']) for venta in ventas_data)
-            })
-            
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        """
+        Historial de ventas de un cliente, paginado por cursor (?cursor=, ?page_size=).
+        total_ventas y total_gastado cuentan todas las ventas del cliente; las
+        estadísticas de las ventas completadas van en 'estadisticas'.
+        """
+        cliente = self.get_object()
+        ventas = Venta.objects.filter(cliente=cliente).prefetch_related(
+            'items__producto', 'items__variante', 'items__color'
+        )
+        paginador = HistorialVentasCursorPagination()
+        pagina = paginador.paginate_queryset(ventas, request, view=self)
+        # total_ventas y total_gastado conservan su significado: todas las ventas, en cualquier estado
+        totales = Venta.objects.filter(cliente=cliente).aggregate(  # type: ignore[attr-defined]
+            total_ventas=models.Count('id'), total_gastado=models.Sum('total')
+        )
+        return Response({
+            'cliente': ClienteSerializer(cliente).data,
+            'estadisticas': estadisticas(cliente),
+            'ventas': [venta_de_historial(venta, request) for venta in pagina],
+            'next': paginador.get_next_link(),
+            'previous': paginador.get_previous_link(),
+            'total_ventas': totales['total_ventas'],
+            'total_gastado': float(totales['total_gastado'] or 0)
+        })
     
     @action(detail=False, methods=['get'])
     def buscar(self, request):
-        """Buscar clientes por nombre o email"""
+        """
+        Buscar clientes por nombre, email, teléfono o documento (ver ventas/busqueda.py).
+        Retorna los 10 más relevantes.
+        """
         query = request.query_params.get('q', '').strip()
         if not query:
             return Response({'error': 'Query parameter required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        clientes = self.get_queryset().filter(
-            Q(nombre__icontains=query) |  # type: ignore[operator]
-            Q(email__icontains=query) |  # type: ignore[operator]
-            Q(telefono__icontains=query)  # type: ignore[operator]
-        )[:10]
+        clientes = buscar_clientes(Cliente.objects.filter(usuario=request.user), query)[:10]  # type: ignore[attr-defined]
         
         serializer = self.get_serializer(clientes, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
     def crear_rapido(self, request):
-        """Crear cliente de forma rápida para ventas"""
+        """
+        Crear cliente de forma rápida para ventas. Si ya existe un cliente con el
+        mismo documento, o con el mismo teléfono y nombre, lo retorna (200) en lugar
+        de crear un duplicado.
+        """
         try:
             data = request.data
             
@@ -174,6 +144,10 @@ class ClienteViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            duplicado = buscar_duplicado(Cliente.objects.filter(usuario=request.user), data)  # type: ignore[attr-defined]
+            if duplicado is not None:
+                return Response(self.get_serializer(duplicado).data, status=status.HTTP_200_OK)
+            
             # Usar serializer para crear cliente y asignar usuario
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
@@ -242,98 +216,8 @@ class VentaViewSet(viewsets.ModelViewSet):
                 venta_serializer.is_valid(raise_exception=True)
                 venta = venta_serializer.save(usuario=request.user)
 
-                # Crear los items de la venta
-                items_data = data.get('items', [])
-                if not items_data or not isinstance(items_data, list):
-                    return Response({'error': 'La venta debe tener al menos un item'}, status=status.HTTP_400_BAD_REQUEST)
-
-                # ✅ Validar que no haya productos duplicados
-                items_unicos = {}
-                for item_data in items_data:
-                    producto_id = item_data.get('producto_id')
-                    variante_id = item_data.get('variante_id')
-                    color_id = item_data.get('color_id')
-                    
-                    # Crear clave única para el item
-                    clave = f"{producto_id}_{variante_id or 'null'}_{color_id or 'null'}"
-                    
-                    if clave in items_unicos:
-                        return Response({
-                            'error': f'Producto duplicado detectado. Cada combinación de producto, variante y color debe ser única.'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    items_unicos[clave] = item_data
-
-                for item_data in items_data:
-                    producto_id = item_data.get('producto_id')
-                    if not producto_id:
-                        return Response({'error': 'Falta producto_id en un item'}, status=status.HTTP_400_BAD_REQUEST)
-                    try:
-                        producto = Producto.objects.get(id=producto_id)
-                    except Producto.DoesNotExist:  # type: ignore[attr-defined]
-                        return Response({'error': f'Producto con id {producto_id} no existe'}, status=status.HTTP_400_BAD_REQUEST)
-
-                    # Determinar precio unitario (no se almacena, solo se usa para el cálculo)
-                    precio_unitario = producto.precio
-                    variante_id = item_data.get('variante_id')
-                    variante = None
-                    if variante_id:
-                        try:
-                            variante = VarianteProducto.objects.get(id=variante_id)  # type: ignore[attr-defined]
-                            precio_unitario += variante.precio_extra
-                        except VarianteProducto.DoesNotExist:  # type: ignore[attr-defined]
-                            return Response({'error': f'Variante con id {variante_id} no existe'}, status=status.HTTP_400_BAD_REQUEST)
-
-                    # ✅ Manejar color específico
-                    color_id = item_data.get('color_id')
-                    color = None
-                    
-                    # Verificar si el producto tiene colores configurados
-                    colores_activos = producto.colores.filter(activo=True)
-                    tiene_colores = colores_activos.exists()
-                    
-                    if tiene_colores:
-                        # Si el producto tiene colores, es obligatorio especificar uno
-                        if not color_id:
-                            colores_disponibles = [f"{c.nombre} (Stock: {c.stock})" for c in colores_activos]
-                            return Response({
-                                'error': f'El producto "{producto.nombre}" tiene colores configurados. Debe seleccionar un color específico. Colores disponibles: {", ".join(colores_disponibles)}'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-                        
-                        # Validar que el color existe y está activo
-                        try:
-                            color = ColorProducto.objects.get(id=color_id, producto=producto, activo=True)  # type: ignore[attr-defined]
-                        except ColorProducto.DoesNotExist:  # type: ignore[attr-defined]
-                            return Response({
-                                'error': f'El color seleccionado no existe o no está disponible para el producto "{producto.nombre}"'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-                        
-                        # Verificar stock del color
-                        if color.stock < item_data['cantidad']:
-                            return Response({
-                                'error': f'Stock insuficiente para el color "{color.nombre}" del producto "{producto.nombre}". Disponible: {color.stock}, Solicitado: {item_data["cantidad"]}'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-                    elif color_id:
-                        # Si el producto no tiene colores pero se especificó uno, es un error
-                        return Response({
-                            'error': f'El producto "{producto.nombre}" no tiene colores configurados, pero se especificó un color'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                    # Crear item de venta
-                    ItemVenta.objects.create(  # type: ignore[attr-defined]
-                        venta=venta,
-                        producto=producto,
-                        variante=variante,
-                        color=color,
-                        cantidad=item_data['cantidad'],
-                        descuento_item=Decimal(str(item_data.get('descuento_item', 0)))
-                    )
-
-                    # ✅ El descuento de stock ahora se maneja automáticamente en el modelo ItemVenta
-                    # No es necesario duplicar la lógica aquí
-
-                # Calcular totales
-                venta.calcular_totales()
+                # ✅ Crear los items, descontar stock y calcular totales por lotes
+                items_venta = crear_items_venta(venta, data.get('items', []))
 
                 # ✅ Crear pedido automáticamente después de la venta
                 # Determinar tipo de venta basado en el método de pago
@@ -362,18 +246,17 @@ class VentaViewSet(viewsets.ModelViewSet):
                 )
                 
                 # Crear items del pedido basados en los items de la venta
-                for item_venta in venta.items.all():
-                    precio_unitario = item_venta.producto.precio
-                    if item_venta.variante:
-                        precio_unitario += item_venta.variante.precio_extra
-                    ItemPedido.objects.create(
+                ItemPedido.objects.bulk_create([
+                    ItemPedido(
                         pedido=pedido,
                         producto=item_venta.producto,
                         cantidad=item_venta.cantidad,
-                        precio_unitario=precio_unitario,
+                        precio_unitario=item_venta.precio_unitario,
                         subtotal=item_venta.subtotal,
                         color=item_venta.color  # Guardar el color seleccionado
                     )
+                    for item_venta in items_venta
+                ])
 
                 # ✅ Crear estado inicial si el método de pago es 'separado'
                 if venta.metodo_pago == 'separado':
@@ -389,33 +272,55 @@ class VentaViewSet(viewsets.ModelViewSet):
                     
                     # No crear abono inicial de $0.00 - los abonos se crearán cuando se registren pagos reales
 
-                # Serializar la venta completa
-                serializer = self.get_serializer(venta)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Serializar la venta completa
+            venta = Venta.objects.select_related('cliente').prefetch_related(
+                'items__producto', 'items__variante', 'items__color'
+            ).get(pk=venta.pk)
+            serializer = self.get_serializer(venta)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['get'])
     def resumen(self, request):
-        """Obtener resumen de ventas del usuario autenticado"""
-        # Usar get_queryset() que ya filtra por usuario
-        user_ventas = self.get_queryset()
-        ventas = user_ventas[:20]
-        serializer = self.get_serializer(ventas, many=True)
+        """
+        Obtener resumen de ventas del usuario autenticado.
+        Filtros opcionales: fecha_desde, fecha_hasta (AAAA-MM-DD), estado, metodo_pago.
+        Los totales y las series por día/semana/mes se calculan en la base de datos.
+        """
+        try:
+            user_ventas = filtrar_ventas(Venta.objects.filter(usuario=request.user), request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calcular totales solo para el usuario autenticado
-        total_ventas = user_ventas.count()
-        total_ingresos = sum(float(venta.total) for venta in user_ventas)
+        # Solo las últimas 20 ventas se serializan
+        ventas = user_ventas.select_related('cliente').prefetch_related('items__producto').order_by('-fecha_venta')[:20]
+        serializer = self.get_serializer(ventas, many=True)
         
         return Response({
             'ventas': serializer.data,
-            'resumen': {
-                'total_ventas': total_ventas,
-                'total_ingresos': total_ingresos
-            }
+            'resumen': resumen_ventas(user_ventas),
+            **series_ventas(user_ventas)
         })
 
+    @action(detail=False, methods=['get'])
+    def rentabilidad(self, request):
+        """
+        Unidades, ingresos, costo y margen por producto y por día, leídos del
+        resumen diario de ventas completadas.
+        Filtros opcionales: fecha_desde, fecha_hasta (AAAA-MM-DD), producto.
+        """
+        try:
+            resumenes = filtrar_resumen_diario(
+                ResumenVentaDiaria.objects.filter(usuario=request.user), request.query_params
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(rentabilidad(resumenes))
+
 
 class ReservaViewSet(viewsets.ModelViewSet):
 	queryset = Reserva.objects.select_related('cliente').prefetch_related('items__producto', 'pagos').order_by('-fecha_creacion')
@@ -513,18 +418,18 @@ class ReservaViewSet(viewsets.ModelViewSet):
 			pedido.save(update_fields=['monto_abono', 'monto_pendiente'])
 		return Response(ReservaSerializer(reserva).data)
 
+	def _reserva_bloqueada(self):
+		"""La reserva de la URL bloqueada hasta el fin de la transacción (vencer_reservas puede estar venciéndola)"""
+		return Reserva.objects.select_for_update().get(pk=self.get_object().pk)
+
 	@action(detail=True, methods=['post'])
 	def cancelar(self, request, pk=None):
 		with transaction.atomic():
-			reserva = self.get_object()
-			# Liberar stock reservado
-			for item in reserva.items.select_related('variante', 'color'):
-				if item.color:
-					item.color.stock_reservado = max(0, item.color.stock_reservado - item.cantidad)
-					item.color.save(update_fields=['stock_reservado'])
-				elif item.variante:
-					item.variante.stock_reservado = max(0, item.variante.stock_reservado - item.cantidad)
-					item.variante.save(update_fields=['stock_reservado'])
+			reserva = self._reserva_bloqueada()
+			if reserva.estado != 'activa':
+				return Response({'error': f'La reserva está {reserva.get_estado_display().lower()}'}, status=400)
+			# Liberar stock reservado (los movimientos se registran con un solo INSERT)
+			registrar([item.liberar_reservado() for item in reserva.items.select_related('producto', 'variante', 'color')])
 			reserva.estado = 'cancelada'
 			reserva.save(update_fields=['estado'])
 			# Actualizar pedido
@@ -538,7 +443,9 @@ class ReservaViewSet(viewsets.ModelViewSet):
 	def finalizar(self, request, pk=None):
 		"""Convertir reserva en venta: descuenta stock real, libera reservado"""
 		with transaction.atomic():
-			reserva = self.get_object()
+			reserva = self._reserva_bloqueada()
+			if reserva.estado != 'activa':
+				return Response({'error': f'La reserva está {reserva.get_estado_display().lower()}'}, status=400)
 			if reserva.monto_pendiente > 0:
 				return Response({'error': 'La reserva aún tiene saldo pendiente'}, status=400)
 			# Crear venta
@@ -549,23 +456,21 @@ class ReservaViewSet(viewsets.ModelViewSet):
 				metodo_pago='efectivo',
 				observaciones=f'Conversión de reserva #{reserva.id}'
 			)
-			for item in reserva.items.select_related('producto', 'variante', 'color'):
-				ItemVenta.objects.create(
-					venta=venta,
-					producto=item.producto,
-					variante=item.variante,
-					color=item.color,
-					cantidad=item.cantidad,
-					descuento_item=item.descuento_item
-				)
-				# Liberar reservado
-				if item.color:
-					item.color.stock_reservado = max(0, item.color.stock_reservado - item.cantidad)
-					item.color.save(update_fields=['stock_reservado'])
-				elif item.variante:
-					item.variante.stock_reservado = max(0, item.variante.stock_reservado - item.cantidad)
-					item.variante.save(update_fields=['stock_reservado'])
-			venta.calcular_totales()
+			# Los totales se calculan una sola vez al cerrar el bloque
+			liberaciones = []
+			with venta.totales_diferidos():
+				for item in reserva.items.select_related('producto', 'variante', 'color'):
+					ItemVenta.objects.create(
+						venta=venta,
+						producto=item.producto,
+						variante=item.variante,
+						color=item.color,
+						cantidad=item.cantidad,
+						descuento_item=item.descuento_item
+					)
+					# Liberar reservado
+					liberaciones.append(item.liberar_reservado())
+			registrar(liberaciones)
 			reserva.estado = 'completada'
 			reserva.save(update_fields=['estado'])
 			# Actualizar pedido a pagado/confirmado y vincular venta
@@ -594,7 +499,15 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
         return Producto.objects.filter(
             usuario=self.request.user,
             estado='publicado'
-        ).select_related('categoria').prefetch_related('variantes')
+        ).select_related('categoria').prefetch_related(
+            'variantes',
+            # Colores activos en una sola consulta para colores_disponibles
+            models.Prefetch(
+                'colores',
+                queryset=ColorProducto.objects.filter(activo=True).only('id', 'producto_id', 'nombre', 'hex_code', 'stock'),
+                to_attr='colores_activos'
+            )
+        )
     
     def list(self, request):
         """Listar productos con información completa"""
@@ -602,6 +515,35 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(productos, many=True, context={'request': request})
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'], pagination_class=CatalogoCursorPagination)
+    def catalogo(self, request):
+        """
+        Catálogo paginado por cursor para la tienda virtual y el punto de venta.
+        Parámetros: cursor, page_size (máx. 100) y categoria (id) opcional.
+        Cada página se cachea por usuario y se invalida con cualquier cambio
+        en sus productos, colores o categorías.
+        """
+        categoria = request.query_params.get('categoria')
+        if categoria and not categoria.isdigit():
+            return Response({'error': 'El parámetro categoria debe ser un id numérico'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        clave = clave_pagina_catalogo(request) if CATALOGO_CACHE_TIMEOUT else None
+        if clave:
+            datos = cache.get(clave)
+            if datos is not None:
+                return Response(datos)
+        
+        productos = self.get_queryset()
+        if categoria:
+            productos = productos.filter(categoria_id=categoria)
+        
+        pagina = self.paginate_queryset(productos)
+        serializer = self.get_serializer(pagina, many=True)
+        datos = self.get_paginated_response(serializer.data).data
+        if clave:
+            cache.set(clave, datos, CATALOGO_CACHE_TIMEOUT)
+        return Response(datos)
+    
     @action(detail=False, methods=['get'])
     def buscar(self, request):
         """Buscar productos por nombre o SKU - Solo del usuario autenticado"""
@@ -609,10 +551,8 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
         if not query:
             return Response({'error': 'Query parameter required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        productos = self.get_queryset().filter(
-            Q(nombre__icontains=query) |  # type: ignore[operator]
-            Q(sku__icontains=query)  # type: ignore[operator]
-        ).select_related('categoria')[:10]  # type: ignore[attr-defined]
+        # Índice de búsqueda con coincidencia por prefijo, ordenado por relevancia
+        productos = buscar_productos(self.get_queryset(), query)[:10]
         
         serializer = self.get_serializer(productos, many=True, context={'request': request})
         return Response(serializer.data)